@@ -0,0 +1,260 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from DocumentProcessor import DocumentProcessor
+from ChromaCollectionCreator import ChromaCollectionCreator
+from IngestionPipeline import IngestionPipeline
+from PageCache import PageCache
+from QuestionIndex import QuestionIndex
+from QuizGenerator import QuizGenerator
+from ResourceRegistry import registry
+from streamlit import config as streamlit_config
+from streamlit.logger import set_log_level
+
+"""
+Headless batch generation of quizzes, e.g. to pre-build the quizzes of a course catalogue:
+`python BatchRunner.py <pdf directory> --topics topics.txt --questions 5 --workers 4 --output quizzes.jsonl`
+"""
+
+# The per-document collections are a cache: they can be rebuilt from the PDFs, so they stay out of the working directory
+DEFAULT_INDEX_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "gemini-quizify", "batch_index")
+
+
+def build_document_quizzes(path, file_name, topics, num_questions, index_dir, embed_config, generator_options):
+    """
+    Builds the quizzes of one PDF: parses and indexes it in its own Chroma collection with the IngestionPipeline,
+    and generates a quiz per topic.
+    Runs in a worker process of the BatchQuizRunner.
+
+    :param path: The path of the PDF file.
+    :param file_name: The name of the file recorded in the results, relative to the PDF directory.
+    :param topics: The topics of the quizzes to generate.
+    :param num_questions: The number of questions of each quiz.
+    :param index_dir: The directory under which the collection of the document is persisted.
+    :param embed_config: The settings of the EmbeddingClient.
+    :param generator_options: Extra arguments of the QuizGenerator.
+    :return: A list of records, one per topic, with the questions or the error.
+    """
+    with open(path, "rb") as f:
+        file_hash = PageCache.hash_file(f)
+    records = []
+    try:
+        processor = DocumentProcessor()
+        # Each document gets its own collection, so the workers never write to the same directory
+        chroma_creator = ChromaCollectionCreator(
+            processor, registry.embedding_client(**embed_config), persist_directory=os.path.join(index_dir, file_hash[:16]))
+        # The pages are embedded and indexed while the rest of the document is being parsed, and not kept;
+        # the chunks are only kept for the LexicalIndex of the hybrid retrieval
+        with open(path, "rb") as f:
+            ingested = IngestionPipeline(
+                chroma_creator, build_lexical_index=generator_options.get("retrieval") == "hybrid").run([f])
+        if processor.errors:
+            raise RuntimeError(f"Failed to parse the document: {processor.errors[0][1]}")
+    except Exception as e:
+        return [{"file": file_name, "file_hash": file_hash, "topic": topic, "questions": [], "seconds": 0.0,
+                 "error": str(e)} for topic in topics]
+
+    # The quizzes of the same document share the question index, so their questions are all different
+    question_index = QuestionIndex()
+    for topic in topics:
+        start = time.perf_counter()
+        try:
+            generator = QuizGenerator(topic, num_questions, chroma_creator, question_index=question_index,
+                                      corpus_fingerprint=file_hash, **generator_options)
+            questions, error = generator.generate_quiz(), None
+        except Exception as e:
+            questions, error = [], str(e)
+        records.append({"file": file_name, "file_hash": file_hash, "topic": topic, "pages": ingested["pages"],
+                        "questions": questions, "seconds": time.perf_counter() - start, "error": error})
+    return records
+
+
+class BatchQuizRunner:
+    """
+    This class generates the quizzes of a directory of PDFs on a list of topics, without Streamlit.
+
+    Functionalities:
+    - Schedules the documents over a pool of worker processes; each worker parses, indexes and generates
+      the quizzes of one document at a time, reusing DocumentProcessor, ChromaCollectionCreator and QuizGenerator.
+    - Appends one JSON line per quiz (file, topic, questions, duration, error) to the output file as soon as
+      a document is done. Progress is resumable: quizzes already in the output file for the same file content and
+      topic are skipped, while failed ones are generated again.
+    - Returns a throughput summary: quizzes/min, questions/min, pages and failures.
+
+    Parameters:
+    - pdf_dir: The directory searched (recursively) for PDF files.
+    - topics: The list of quiz topics; a quiz is generated for every document and topic.
+    - output_path: The JSONL file where the quizzes are written.
+    - num_questions: The number of questions of each quiz.
+    - workers: The number of worker processes; defaults to the number of CPUs. 1 runs in the current process.
+    - index_dir: The directory under which the collection of each document is persisted; defaults to a cache directory
+      (`$XDG_CACHE_HOME/gemini-quizify/batch_index`) rather than the working directory.
+    - embed_config: The settings of the EmbeddingClient (model_name, project, location, backend...).
+    - generator_options: Extra arguments of the QuizGenerator (max_concurrency, context_strategy, llm_backend...).
+    """
+
+    def __init__(self, pdf_dir, topics, output_path="quizzes.jsonl", num_questions=5, workers=None,
+                 index_dir=DEFAULT_INDEX_DIR, embed_config=None, generator_options=None):
+        self.pdf_dir = pdf_dir
+        self.topics = list(dict.fromkeys(topic.strip() for topic in topics if topic.strip()))
+        self.output_path = output_path
+        self.num_questions = num_questions
+        self.workers = workers or os.cpu_count() or 1
+        self.index_dir = index_dir
+        self.embed_config = embed_config or {
+            "model_name": "textembedding-gecko@003",
+            "project": "gemini-quizzify-427807",
+            "location": "us-central1"
+        }
+        self.generator_options = generator_options if generator_options is not None else {
+            "max_concurrency": num_questions, "context_strategy": "mmr"}
+
+    def find_pdfs(self) -> list:
+        """
+        Returns the paths of the PDF files of the directory, sorted.
+        """
+        pattern = os.path.join(self.pdf_dir, "**", "*.pdf")
+        return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+    def completed(self) -> set:
+        """
+        Reads the output file and returns the (file hash, topic) of the quizzes already generated without error.
+        """
+        done = set()
+        if not os.path.exists(self.output_path):
+            return done
+        with open(self.output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by an interrupted run
+                    continue
+                if not record.get("error") and record.get("questions"):
+                    done.add((record["file_hash"], record["topic"]))
+        return done
+
+    def plan(self) -> list:
+        """
+        Lists the work left: for each document, the topics that have no quiz in the output file yet.
+        Files with the same content are processed once: the other paths get a copy of the records of the first one,
+        so two workers never index the same collection.
+
+        :return: A list of (path, file name, topics, file names of the copies) tuples.
+        """
+        done = self.completed()
+        jobs = {}  # file hash -> job
+        for path in self.find_pdfs():
+            with open(path, "rb") as f:
+                file_hash = PageCache.hash_file(f)
+            file_name = os.path.relpath(path, self.pdf_dir)
+            if file_hash in jobs:
+                jobs[file_hash][3].append(file_name)
+                continue
+            topics = [topic for topic in self.topics if (file_hash, topic) not in done]
+            if topics:
+                jobs[file_hash] = (path, file_name, topics, [])
+        return list(jobs.values())
+
+    def run(self) -> dict:
+        """
+        Generates the missing quizzes and appends them to the output file.
+
+        :return: The throughput summary of the run.
+        """
+        jobs = self.plan()
+        print(f"{len(jobs)} documents to process, {sum(len(topics) for _, _, topics, _ in jobs)} quizzes "
+              f"({len(self.completed())} already done), with {self.workers} workers")
+        summary = {"documents": 0, "quizzes": 0, "questions": 0, "failures": 0, "pages": 0}
+        start = time.perf_counter()
+
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.output_path, "a", encoding="utf-8") as output:
+            def write(records, copies):
+                # The files with the same content as the document get the same quizzes
+                records = records + [{**record, "file": file_name} for file_name in copies for record in records]
+                for record in records:
+                    output.write(json.dumps(record) + "\n")
+                    if record["error"]:
+                        summary["failures"] += 1
+                    else:
+                        summary["quizzes"] += 1
+                        summary["questions"] += len(record["questions"])
+                # Flushing after each document, so an interrupted run keeps its progress
+                output.flush()
+                summary["documents"] += 1
+                summary["pages"] += records[0].get("pages", 0) if records else 0
+                print(f"[{summary['documents']}/{len(jobs)}] {records[0]['file']}: "
+                      f"{sum(1 for record in records if not record['error'])}/{len(records)} quizzes")
+
+            arguments = [(path, file_name, topics, self.num_questions, self.index_dir, self.embed_config,
+                          self.generator_options) for path, file_name, topics, _ in jobs]
+            copies = [job[3] for job in jobs]
+            if self.workers <= 1:
+                for job, job_copies in zip(arguments, copies):
+                    write(build_document_quizzes(*job), job_copies)
+            else:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = {executor.submit(build_document_quizzes, *job): job_copies
+                               for job, job_copies in zip(arguments, copies)}
+                    for future in as_completed(futures):
+                        write(future.result(), futures[future])
+
+        elapsed = time.perf_counter() - start
+        minutes = elapsed / 60 if elapsed else 1.0
+        summary.update({
+            "seconds": elapsed,
+            "quizzes_per_min": summary["quizzes"] / minutes,
+            "questions_per_min": summary["questions"] / minutes,
+            "pages_per_sec": summary["pages"] / elapsed if elapsed else 0.0,
+        })
+        return summary
+
+
+"""
+End of BatchQuizRunner class implementation
+"""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates the quizzes of a directory of PDFs, without the Streamlit UI.")
+    parser.add_argument("pdf_dir", help="directory of PDF files, searched recursively")
+    parser.add_argument("--topics", help="file with one topic per line")
+    parser.add_argument("--topic", action="append", default=[], help="a topic (can be repeated)")
+    parser.add_argument("--questions", type=int, default=5, help="number of questions per quiz (up to 10)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="questions generated in parallel per quiz")
+    parser.add_argument("--output", default="quizzes.jsonl", help="JSONL file the quizzes are appended to")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR, help="directory of the per-document collections")
+    parser.add_argument("--backend", choices=("vertex", "fake"), default=os.environ.get("QUIZIFY_BACKEND", "vertex"),
+                        help="embedding and LLM backend")
+    args = parser.parse_args()
+
+    topics = list(args.topic)
+    if args.topics:
+        with open(args.topics, encoding="utf-8") as f:
+            topics.extend(f.read().splitlines())
+    if not topics:
+        parser.error("no topic given, use --topics or --topic")
+
+    # The Streamlit messages of the pipeline have no page to show on, and only warn about it
+    # (after loading the Streamlit configuration, which sets the log level again when it is first read)
+    streamlit_config.get_option("logger.level")
+    set_log_level("error")
+
+    runner = BatchQuizRunner(
+        args.pdf_dir, topics, output_path=args.output, num_questions=args.questions, workers=args.workers,
+        index_dir=args.index_dir,
+        embed_config={"model_name": "textembedding-gecko@003", "project": "gemini-quizzify-427807",
+                      "location": "us-central1", "backend": args.backend},
+        generator_options={"max_concurrency": args.max_concurrency or args.questions, "context_strategy": "mmr",
+                           "llm_backend": args.backend},
+    )
+    summary = runner.run()
+    print(f"{summary['quizzes']} quizzes, {summary['questions']} questions, {summary['failures']} failures "
+          f"on {summary['documents']} documents ({summary['pages']} pages) in {summary['seconds']:.1f}s: "
+          f"{summary['quizzes_per_min']:.1f} quizzes/min, {summary['questions_per_min']:.1f} questions/min")
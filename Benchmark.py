@@ -0,0 +1,816 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+sys.path.append(os.path.abspath('../../'))
+from DocumentProcessor import DocumentProcessor
+from SampleDocuments import WORDS, InMemoryUpload, make_pdf, make_uploads
+from EmbeddingClient import EmbeddingClient
+from EmbeddingCache import EmbeddingCache
+from EmbeddingEngine import EmbeddingEngine
+from ChromaCollectionCreator import ChromaCollectionCreator
+from QuizGenerator import QuizGenerator
+from FakeBackends import FakeEmbeddings, FakeLLM
+from LLMCache import LLMResponseCache
+from QuestionLibrary import QuestionLibrary
+from QuestionProducer import QuestionProducer
+from ResourceRegistry import ResourceRegistry
+from QuizServer import QuizServer
+from QuantizedVectorStore import QuantizedVectorStore
+from LexicalIndex import LexicalIndex
+from IngestionPipeline import IngestionPipeline
+from Tracing import tracer
+from langchain_community.vectorstores import Chroma
+
+"""
+Benchmarks for the Quizify pipeline. Run with `python Benchmark.py`; they run locally and do not call Google Cloud.
+`python Benchmark.py --suite --baseline <results.json>` runs the regression suite on corpora of increasing size instead.
+"""
+
+def benchmark_ingestion(num_files=8, pages_per_file=100, worker_counts=(1, 2, 4, 8)):
+    """
+    Measures the pages/sec of DocumentProcessor.process_files for different numbers of worker processes.
+    The page cache is disabled so that every run actually parses the files.
+
+    :return: A list of dictionaries with the worker count, the number of pages, the elapsed time and the pages/sec.
+    """
+    uploads = make_uploads(num_files, pages_per_file)
+    results = []
+    for num_workers in worker_counts:
+        processor = DocumentProcessor(use_page_cache=False, num_workers=num_workers)
+        start = time.perf_counter()
+        processor.process_files(uploads)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "workers": num_workers,
+            "pages": num_files * pages_per_file,
+            "seconds": elapsed,
+            "pages_per_sec": num_files * pages_per_file / elapsed,
+        })
+        print(f"workers={num_workers:<3} pages={num_files * pages_per_file:<6} "
+              f"time={elapsed:7.2f}s  pages/sec={num_files * pages_per_file / elapsed:8.1f}")
+    return results
+
+
+def benchmark_embedding_engine(num_texts=2000, batch_size=50, concurrency_levels=(1, 2, 4, 8),
+                               latency=0.05, throttle_rate=0.1):
+    """
+    Measures the texts/sec of the EmbeddingEngine against a FakeEmbeddings backend that simulates
+    network latency and throttling errors, for different numbers of concurrent requests.
+
+    :return: A list of dictionaries with the concurrency, the elapsed time, the texts/sec and the engine counters.
+    """
+    texts = [f"chunk {i} " + " ".join(random.Random(i).choice(WORDS) for _ in range(50)) for i in range(num_texts)]
+    expected = FakeEmbeddings(dimensions=64).embed_documents(texts)
+    results = []
+    for concurrency in concurrency_levels:
+        backend = FakeEmbeddings(dimensions=64, latency=latency, throttle_rate=throttle_rate, seed=concurrency)
+        engine = EmbeddingEngine(backend.embed_documents, batch_size=batch_size, max_concurrency=concurrency,
+                                 initial_backoff=0.05, max_retries=10)
+        start = time.perf_counter()
+        vectors = engine.embed(texts)
+        elapsed = time.perf_counter() - start
+        if vectors != expected:
+            raise AssertionError("The engine returned the vectors out of order")
+        results.append({"concurrency": concurrency, "seconds": elapsed, "texts_per_sec": num_texts / elapsed,
+                        **engine.stats()})
+        print(f"concurrency={concurrency:<3} time={elapsed:6.2f}s  texts/sec={num_texts / elapsed:8.1f}  "
+              f"requests={engine.requests} throttled={engine.throttled}")
+    return results
+
+
+# Temporary directories of the collections returned by build_fake_collection, removed when the process exits
+TEMPORARY_DIRECTORIES = []
+
+
+def build_fake_collection(num_pages=20, persist_directory=None):
+    """
+    Builds a Chroma collection over a generated PDF, embedded with FakeEmbeddings.
+
+    :param num_pages: The number of pages of the generated document.
+    :param persist_directory: Where to persist the collection; by default a new temporary directory,
+                              removed when the process exits since the collection outlives the call.
+    :return: The ChromaCollectionCreator holding the collection.
+    """
+    if persist_directory is None:
+        TEMPORARY_DIRECTORIES.append(tempfile.TemporaryDirectory())
+        persist_directory = TEMPORARY_DIRECTORIES[-1].name
+    processor = DocumentProcessor(use_page_cache=False)
+    processor.process_files(make_uploads(1, num_pages))
+    chroma_creator = ChromaCollectionCreator(
+        processor, FakeEmbeddings(dimensions=256), persist_directory=persist_directory)
+    chroma_creator.create_chroma_collection()
+    return chroma_creator
+
+
+def benchmark_batched_generation(num_questions=10, latency=1.0, token_latency=0.01):
+    """
+    Compares the per-question generation path with the batched path (several questions per LLM call),
+    in number of LLM calls, prompt and completion tokens, and wall time, against a FakeLLM.
+
+    :return: A dictionary with the measures of each path.
+    """
+    chroma_creator = build_fake_collection()
+    results = {}
+    for name, options in (("per-question", {}), ("batched", {"batch_mode": True})):
+        generator = QuizGenerator("cell membrane", num_questions, chroma_creator, **options)
+        generator.llm = FakeLLM(latency=latency, token_latency=token_latency)
+        start = time.perf_counter()
+        questions = generator.generate_quiz()
+        elapsed = time.perf_counter() - start
+        results[name] = {"questions": len(questions), "seconds": elapsed, **generator.llm.stats}
+        print(f"{name:<13} questions={len(questions):<3} calls={generator.llm.stats['calls']:<3} "
+              f"prompt_tokens={generator.llm.stats['prompt_tokens']:<6} "
+              f"completion_tokens={generator.llm.stats['completion_tokens']:<6} time={elapsed:6.2f}s")
+    return results
+
+
+def benchmark_chain_construction(num_questions=50):
+    """
+    Measures the per-question overhead that was removed by compiling the QuizGenerator chain once:
+    the time to build the retriever, prompt, format instructions and chain for every question,
+    against the time to run the questions on a chain built once. The FakeLLM answers instantly.
+
+    :return: A dictionary with the time per question of each variant, in milliseconds.
+    """
+    chroma_creator = build_fake_collection()
+    generator = QuizGenerator("cell membrane", 1, chroma_creator)
+    generator.llm = FakeLLM()
+
+    start = time.perf_counter()
+    for _ in range(num_questions):
+        generator.chain = None
+        generator.build_chain()
+    build_ms = (time.perf_counter() - start) * 1000 / num_questions
+
+    start = time.perf_counter()
+    for _ in range(num_questions):
+        generator.chain = None
+        generator.generate_question_with_vectorstore()
+    rebuilt_ms = (time.perf_counter() - start) * 1000 / num_questions
+
+    start = time.perf_counter()
+    for _ in range(num_questions):
+        generator.generate_question_with_vectorstore()
+    reused_ms = (time.perf_counter() - start) * 1000 / num_questions
+
+    print(f"chain construction={build_ms:7.2f} ms/question  "
+          f"question with rebuilt chain={rebuilt_ms:7.2f} ms  with compiled chain={reused_ms:7.2f} ms")
+    return {"build_ms": build_ms, "rebuilt_ms": rebuilt_ms, "reused_ms": reused_ms}
+
+
+def benchmark_context_scheduling(num_questions=10, num_quizzes=5):
+    """
+    Compares the duplicate rate and the wasted LLM calls per quiz when every question uses the top chunks
+    for the topic, and when the ContextScheduler gives each question its own slice of the corpus.
+    The FakeLLM only looks at the beginning of its context, so the same context tends to produce the same question.
+
+    :return: A dictionary with the average metrics of each strategy.
+    """
+    chroma_creator = build_fake_collection(num_pages=40)
+    results = {}
+    for strategy in (None, "partition", "mmr"):
+        totals = {"llm_calls": 0, "duplicates": 0, "wasted_calls": 0, "accepted": 0}
+        for seed in range(num_quizzes):
+            generator = QuizGenerator("cell membrane protein", num_questions, chroma_creator,
+                                      context_strategy=strategy)
+            generator.llm = FakeLLM(focus=6, seed=seed)
+            generator.generate_quiz()
+            metrics = generator.quiz_metrics()
+            for key in totals:
+                totals[key] += metrics[key]
+        generated = totals["accepted"] + totals["duplicates"]
+        results[strategy or "top-k"] = {
+            "duplicate_rate": totals["duplicates"] / generated if generated else 0.0,
+            "wasted_calls_per_quiz": totals["wasted_calls"] / num_quizzes,
+            "questions_per_quiz": totals["accepted"] / num_quizzes,
+        }
+        print(f"{strategy or 'top-k':<10} duplicate rate={results[strategy or 'top-k']['duplicate_rate']:6.1%}  "
+              f"wasted calls/quiz={totals['wasted_calls'] / num_quizzes:5.1f}  "
+              f"questions/quiz={totals['accepted'] / num_quizzes:5.1f}")
+    return results
+
+
+def benchmark_output_repair(num_questions=10, num_quizzes=5, malformed_rate=0.3):
+    """
+    Counts the LLM outputs that were repaired locally and the ones that had to be generated again,
+    against a FakeLLM returning malformed output at the given rate.
+
+    :return: A dictionary with the totals over all quizzes.
+    """
+    chroma_creator = build_fake_collection()
+    totals = {"llm_calls": 0, "accepted": 0, "repaired": 0, "regenerated": 0}
+    for seed in range(num_quizzes):
+        generator = QuizGenerator("cell membrane", num_questions, chroma_creator, context_strategy="mmr")
+        generator.llm = FakeLLM(malformed_rate=malformed_rate, seed=seed)
+        generator.generate_quiz()
+        metrics = generator.quiz_metrics()
+        for key in totals:
+            totals[key] += metrics[key]
+    print(f"malformed rate={malformed_rate:.0%}  calls={totals['llm_calls']}  accepted={totals['accepted']}  "
+          f"repaired locally={totals['repaired']}  generated again={totals['regenerated']}")
+    return totals
+
+
+def benchmark_llm_cache(num_questions=5, num_quizzes=6, latency=0.5, samples_per_prompt=3):
+    """
+    Runs the same quiz (same corpus, topic and contexts) several times with an LLMResponseCache around a FakeLLM.
+    The first `samples_per_prompt` quizzes fill the samples of each prompt, the following ones are served from the cache.
+
+    :return: A list with the wall time and the LLM calls of each quiz.
+    """
+    chroma_creator = build_fake_collection()
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMResponseCache(os.path.join(directory, "responses.sqlite3"), samples_per_prompt=samples_per_prompt)
+        # The same LLM for every quiz, since its parameters are part of the cache key
+        llm = FakeLLM(latency=latency, cache=cache)
+        results = []
+        for run in range(num_quizzes):
+            # A fresh question index per quiz, so cached questions are not rejected as already asked
+            generator = QuizGenerator("cell membrane", num_questions, chroma_creator, context_strategy="partition",
+                                      llm_cache=cache)
+            generator.llm = llm
+            calls = llm.stats["calls"]
+            start = time.perf_counter()
+            questions = generator.generate_quiz()
+            elapsed = time.perf_counter() - start
+            calls = llm.stats["calls"] - calls
+            results.append({"questions": len(questions), "seconds": elapsed, "llm_calls": calls})
+            print(f"quiz {run + 1}  questions={len(questions):<3} LLM calls={calls:<3} time={elapsed * 1000:8.1f} ms")
+        stats = cache.stats()
+        print(f"cache hits={stats['hits']}  misses={stats['misses']}  hit rate={stats['hit_rate']:.0%}")
+    return results
+
+
+def benchmark_question_library(num_questions=5, topics=("cell membrane", "Cell Membrane", "membrane cell", "cell membrane"),
+                               latency=0.5):
+    """
+    Simulates users quizzing themselves one after the other on the same document, with similar topics, sharing a
+    QuestionLibrary. Each user has their own question index, like separate Streamlit sessions.
+
+    :return: A list with the wall time, the LLM calls and the questions served by the library for each user.
+    """
+    chroma_creator = build_fake_collection()
+    with tempfile.TemporaryDirectory() as directory:
+        library = QuestionLibrary(chroma_creator.embed_model, os.path.join(directory, "library.sqlite3"))
+        results = []
+        for user, topic in enumerate(topics):
+            generator = QuizGenerator(topic, num_questions, chroma_creator, context_strategy="mmr", library=library)
+            generator.llm = FakeLLM(latency=latency, seed=user)
+            start = time.perf_counter()
+            questions = generator.generate_quiz()
+            elapsed = time.perf_counter() - start
+            metrics = generator.quiz_metrics()
+            results.append({"questions": len(questions), "seconds": elapsed, "llm_calls": metrics["llm_calls"],
+                            "from_library": metrics["from_library"]})
+            print(f"user {user + 1}  topic={topic!r:<17} questions={len(questions):<3} from library={metrics['from_library']:<3} "
+                  f"LLM calls={metrics['llm_calls']:<3} time={elapsed * 1000:8.1f} ms")
+    return results
+
+
+def benchmark_time_to_first_question(num_questions=10, num_pages=20, latency=1.0, token_latency=0.01, max_concurrency=4):
+    """
+    Compares the time from upload to the first question shown, when indexing and the whole quiz run on Submit
+    (the previous flow), and with a QuestionProducer indexing in the background and streaming the questions.
+    The FakeLLM takes longer for longer answers, and up to `max_concurrency` questions are generated at a time.
+
+    :return: A dictionary with the time to the first question and to the full quiz of each flow, in seconds.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        processor = DocumentProcessor(use_page_cache=False)
+        processor.process_files(make_uploads(1, num_pages))
+        results = {}
+
+        def make_creator():
+            return ChromaCollectionCreator(processor, FakeEmbeddings(dimensions=256, latency=0.05),
+                                           persist_directory=tempfile.mkdtemp(dir=directory))
+
+        start = time.perf_counter()
+        chroma_creator = make_creator()
+        chroma_creator.create_chroma_collection()
+        generator = QuizGenerator("cell membrane", num_questions, chroma_creator, max_concurrency=max_concurrency,
+                                  context_strategy="mmr")
+        generator.llm = FakeLLM(latency=latency, token_latency=token_latency, seed=0)
+        generator.generate_quiz()
+        elapsed = time.perf_counter() - start
+        results["blocking"] = {"first_question": elapsed, "full_quiz": elapsed}
+
+        start = time.perf_counter()
+        producer = QuestionProducer(make_creator())
+        producer.start_indexing()
+        generator = QuizGenerator("cell membrane", num_questions, producer.chroma_creator,
+                                  max_concurrency=max_concurrency, context_strategy="mmr")
+        generator.llm = FakeLLM(latency=latency, token_latency=token_latency, seed=0)
+        producer.start_generator(generator)
+        producer.wait_for_question()
+        first_question = time.perf_counter() - start
+        while producer.wait_for_question() is not None:
+            pass
+        results["background"] = {"first_question": first_question, "full_quiz": time.perf_counter() - start}
+
+    for name, result in results.items():
+        print(f"{name:<11} first question={result['first_question']:6.2f}s  full quiz={result['full_quiz']:6.2f}s")
+    return results
+
+
+def benchmark_resource_registry(num_reruns=20):
+    """
+    Measures the setup cost of a Streamlit rerun: opening the persisted Chroma collection, the LLM response cache and
+    the question library, and building the LLM client. Without a registry every rerun builds them again; with a
+    ResourceRegistry only the first one (the cold start) does. The fake embedding model and LLM stand in for the
+    VertexAI clients, whose construction (credentials, channels) is not measured here.
+
+    :return: A dictionary with the cold start and the mean per-rerun setup time of each variant, in milliseconds.
+    """
+    chroma_creator = build_fake_collection()
+    embed_model = chroma_creator.embed_model
+    with tempfile.TemporaryDirectory() as directory:
+        def setup(resources):
+            if resources is None:
+                return (Chroma(collection_name=chroma_creator.opened_collection_name, embedding_function=embed_model,
+                               persist_directory=chroma_creator.persist_directory),
+                        LLMResponseCache(os.path.join(directory, "responses.sqlite3")),
+                        QuestionLibrary(embed_model, os.path.join(directory, "library.sqlite3")),
+                        FakeLLM(latency=0.0))
+            return (resources.chroma_collection(chroma_creator.opened_collection_name, chroma_creator.persist_directory, embed_model),
+                    resources.llm_cache(cache_path=os.path.join(directory, "responses.sqlite3")),
+                    resources.question_library(embed_model, library_path=os.path.join(directory, "library.sqlite3")),
+                    resources.get_or_create("llm", {"model_name": "fake"}, lambda: FakeLLM(latency=0.0)))
+
+        results = {}
+        for name, resources in (("no registry", None), ("registry", ResourceRegistry())):
+            timings = []
+            for _ in range(num_reruns):
+                start = time.perf_counter()
+                setup(resources)
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {"cold_start_ms": timings[0], "rerun_ms": sum(timings[1:]) / (len(timings) - 1)}
+            print(f"{name:<12} cold start={timings[0]:8.2f} ms  per rerun={results[name]['rerun_ms']:8.3f} ms")
+            if resources is not None:
+                resources.invalidate()
+    return results
+
+
+def benchmark_tracing_overhead(num_questions=200, num_spans=100_000):
+    """
+    Measures the overhead of the tracing instrumentation: the cost of a span and a counter while tracing is disabled
+    and enabled, and the time per question of the compiled chain (against an instant FakeLLM) in both cases.
+
+    :return: A dictionary with the cost of a span in microseconds and the time per question in milliseconds.
+    """
+    chroma_creator = build_fake_collection()
+    generator = QuizGenerator("cell membrane", 1, chroma_creator)
+    generator.llm = FakeLLM()
+    generator.build_chain()
+    enabled = tracer.enabled
+    results = {}
+    try:
+        for tracing in (False, True):
+            tracer.enabled = tracing
+            tracer.reset()
+            start = time.perf_counter()
+            for _ in range(num_spans):
+                with tracer.span("benchmark"):
+                    tracer.count("benchmark")
+            span_us = (time.perf_counter() - start) * 1e6 / num_spans
+            tracer.reset()
+
+            start = time.perf_counter()
+            for _ in range(num_questions):
+                generator.generate_question_with_vectorstore()
+            question_ms = (time.perf_counter() - start) * 1000 / num_questions
+            name = "enabled" if tracing else "disabled"
+            results[name] = {"span_us": span_us, "question_ms": question_ms}
+            print(f"tracing {name:<9} span+counter={span_us:6.2f} us  question={question_ms:6.2f} ms")
+    finally:
+        tracer.enabled = enabled
+        tracer.reset()
+    return results
+
+
+def benchmark_vector_backends(corpus_sizes=(20, 100, 500), num_queries=200, k=4):
+    """
+    Compares the Chroma collection with the in-process NumpyVectorStore: build time of the collection, latency
+    of a single query, and time per query when all the queries are ranked at once (`query_chroma_collection`
+    with a list). The vectors come from a warm EmbeddingCache, so the embedding model costs the same to both.
+
+    :return: A dictionary with, for each corpus size and backend, the build time in seconds and the query times in ms.
+    """
+    rng = random.Random(0)
+    queries = [" ".join(rng.sample(WORDS, 3)) for _ in range(num_queries)]
+    results = {}
+    # Warming up Chroma, so the first corpus does not pay its start-up cost
+    build_fake_collection(num_pages=1)
+    with tempfile.TemporaryDirectory() as directory:
+        embed_client = EmbeddingClient("benchmark", backend="fake", cache=EmbeddingCache(os.path.join(directory, "embeddings.sqlite3")),
+                                       backend_options={"dimensions": 768})
+        for num_pages in corpus_sizes:
+            processor = DocumentProcessor(use_page_cache=False)
+            processor.process_files(make_uploads(1, num_pages))
+            # Warming the embedding cache with the chunks and the queries
+            ChromaCollectionCreator(processor, embed_client, backend="numpy").create_chroma_collection()
+            embed_client.embed_documents(queries)
+            for query in queries:
+                embed_client.embed_query(query)
+
+            for backend in ("chroma", "numpy"):
+                chroma_creator = ChromaCollectionCreator(processor, embed_client, backend=backend,
+                                                         persist_directory=tempfile.mkdtemp(dir=directory))
+                start = time.perf_counter()
+                chroma_creator.create_chroma_collection()
+                build_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for query in queries:
+                    chroma_creator.db.similarity_search(query, k=k)
+                query_ms = (time.perf_counter() - start) * 1000 / num_queries
+
+                start = time.perf_counter()
+                chroma_creator.query_chroma_collection(queries)
+                batch_query_ms = (time.perf_counter() - start) * 1000 / num_queries
+
+                results.setdefault(num_pages, {})[backend] = {
+                    "build_seconds": build_seconds, "query_ms": query_ms, "batch_query_ms": batch_query_ms}
+                print(f"pages={num_pages:<5} {backend:<7} build={build_seconds * 1000:8.1f} ms  query={query_ms:7.3f} ms  "
+                      f"batched={batch_query_ms:7.3f} ms/query")
+    return results
+
+
+def benchmark_quantized_store(num_vectors=20_000, dimensions=768, num_clusters=200, num_queries=200, k=10):
+    """
+    Compares the recall@k, memory and query latency of the QuantizedVectorStore (float16, int8, with and without
+    re-ranking) against exact float32 search, on a corpus of clustered random unit vectors (like the embeddings
+    of chunks about a few hundred subjects). The queries are noisy copies of random chunks.
+
+    :return: A dictionary with, for each variant, the recall@k, the size of the searched data in MB, the mean
+             latency of a single query and the time per query when all the queries are ranked at once, in ms.
+    """
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((num_clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(num_clusters, size=num_vectors)] + rng.standard_normal((num_vectors, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    noise = rng.standard_normal((num_queries, dimensions)).astype(np.float32) * np.float32(0.5 / np.sqrt(dimensions))
+    queries = vectors[rng.integers(num_vectors, size=num_queries)] + noise
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    exact = [set(rows) for rows in QuantizedVectorStore._top_k(queries @ vectors.T, k)]
+
+    results = {}
+    start = time.perf_counter()
+    for query in queries:
+        QuantizedVectorStore._top_k(vectors @ query, k)
+    query_ms = (time.perf_counter() - start) * 1000 / num_queries
+    start = time.perf_counter()
+    QuantizedVectorStore._top_k(queries @ vectors.T, k)
+    results["float32"] = {"recall": 1.0, "searched_mb": vectors.nbytes / 1e6, "query_ms": query_ms,
+                          "batch_query_ms": (time.perf_counter() - start) * 1000 / num_queries}
+
+    ids = [str(i) for i in range(num_vectors)]
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization in QuantizedVectorStore.QUANTIZATIONS:
+            path = QuantizedVectorStore.write(os.path.join(directory, quantization), ids, [f"chunk {i}" for i in ids],
+                                              [{} for _ in ids], vectors, quantization=quantization)
+            for rerank in (False, True):
+                store = QuantizedVectorStore(path, rerank=rerank)
+                start = time.perf_counter()
+                found = [store.similarity_search_by_vector_with_scores(query, k=k) for query in queries]
+                query_ms = (time.perf_counter() - start) * 1000 / num_queries
+                start = time.perf_counter()
+                store.batch_similarity_search_by_vector(queries, k=k)
+                batch_query_ms = (time.perf_counter() - start) * 1000 / num_queries
+                recall = sum(len(expected & {int(document.id) for document, _ in hits}) / k
+                             for expected, hits in zip(exact, found)) / num_queries
+                results[quantization + (" + rerank" if rerank else "")] = {
+                    "recall": recall, "searched_mb": store.nbytes()["searched"] / 1e6, "query_ms": query_ms,
+                    "batch_query_ms": batch_query_ms}
+
+    for name, result in results.items():
+        print(f"{name:<17} recall@{k}={result['recall']:.3f}  searched={result['searched_mb']:6.1f} MB  "
+              f"query={result['query_ms']:6.2f} ms  batched={result['batch_query_ms']:6.2f} ms/query")
+    return results
+
+
+def benchmark_lazy_embedding(corpus_sizes=(50, 200, 800), num_questions=5, embed_latency=0.1, latency=0.2):
+    """
+    Compares the time from upload to the first question when every chunk is embedded before the quiz, and in lazy
+    mode, where only the best lexical candidates for the topic are embedded first (with hybrid retrieval).
+    The fake embedding model takes `embed_latency` per batch of 32 chunks, 4 batches at a time, and the embedding cache is off.
+
+    :return: A dictionary with, for each corpus size and mode, the time to the first question in seconds, the number
+             of chunks embedded, and the time to build the LexicalIndex in ms.
+    """
+    results = {}
+    # Warming up Chroma, so the first corpus does not pay its start-up cost
+    build_fake_collection(num_pages=1)
+    with tempfile.TemporaryDirectory() as directory:
+        for num_pages in corpus_sizes:
+            processor = DocumentProcessor(use_page_cache=False)
+            processor.process_files(make_uploads(1, num_pages))
+            for lazy in (False, True):
+                embed_client = EmbeddingClient("benchmark", backend="fake", use_cache=False,
+                                               backend_options={"dimensions": 256, "latency": embed_latency})
+                chroma_creator = ChromaCollectionCreator(processor, embed_client, lazy=lazy,
+                                                         persist_directory=tempfile.mkdtemp(dir=directory))
+                start = time.perf_counter()
+                chroma_creator.create_chroma_collection()
+                generator = QuizGenerator("cell membrane", num_questions, chroma_creator, max_concurrency=num_questions,
+                                          context_strategy="mmr", retrieval="hybrid" if lazy else "vector")
+                generator.llm = FakeLLM(latency=latency, seed=0)
+                quiz = generator.iter_quiz()
+                next(quiz)
+                first_question = time.perf_counter() - start
+                quiz.close()
+                embedded = len(chroma_creator.db.get(include=[])["ids"])
+
+                start = time.perf_counter()
+                LexicalIndex(chroma_creator.chunks)
+                lexical_ms = (time.perf_counter() - start) * 1000
+
+                mode = "lazy" if lazy else "full"
+                results.setdefault(num_pages, {})[mode] = {
+                    "first_question": first_question, "embedded": embedded, "chunks": len(chroma_creator.chunks),
+                    "lexical_index_ms": lexical_ms}
+                print(f"pages={num_pages:<5} {mode:<5} first question={first_question:6.2f}s  "
+                      f"embedded={embedded:>5}/{len(chroma_creator.chunks):<5} lexical index={lexical_ms:6.1f} ms")
+    return results
+
+
+def benchmark_streaming_ingestion(num_files=4, pages_per_file=100, embed_latency=0.2):
+    """
+    Compares the phased ingestion (parse every page, then split, then embed and index every chunk) with the
+    IngestionPipeline, where the chunks are embedded and indexed while the next pages are being parsed.
+    The fake embedding model takes `embed_latency` per request, the page and embedding caches are off.
+
+    :return: A dictionary with, for each flow, the total time and the time until the first chunk is searchable
+             in seconds, and for the pipeline the items/sec and backpressure wait of each stage.
+    """
+    uploads = make_uploads(num_files, pages_per_file)
+    results = {}
+    # Warming up Chroma, so the first flow does not pay its start-up cost
+    build_fake_collection(num_pages=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        def make_creator(processor):
+            embed_client = EmbeddingClient("benchmark", backend="fake", use_cache=False,
+                                           backend_options={"dimensions": 256, "latency": embed_latency})
+            return ChromaCollectionCreator(processor, embed_client, persist_directory=tempfile.mkdtemp(dir=directory))
+
+        start = time.perf_counter()
+        processor = DocumentProcessor(use_page_cache=False)
+        processor.process_files(uploads)
+        make_creator(processor).create_chroma_collection()
+        elapsed = time.perf_counter() - start
+        results["phased"] = {"total": elapsed, "first_chunk": elapsed}
+
+        first_chunk = []
+        start = time.perf_counter()
+        pipeline = IngestionPipeline(make_creator(DocumentProcessor(use_page_cache=False)),
+                                     on_progress=lambda progress: first_chunk or first_chunk.append(time.perf_counter() - start))
+        stages = pipeline.run(uploads)
+        results["streaming"] = {"total": time.perf_counter() - start, "first_chunk": first_chunk[0] if first_chunk else 0.0,
+                                "stages": {name: stages[name] for name in IngestionPipeline.STAGES}}
+
+    for name, result in results.items():
+        print(f"{name:<10} total={result['total']:6.2f}s  first chunk searchable={result['first_chunk']:6.2f}s")
+    for name, stage in results["streaming"]["stages"].items():
+        print(f"  {name:<6} {stage['items']:>5} items  {stage['items_per_sec']:9.1f} items/s  "
+              f"busy={stage['busy_seconds']:5.2f}s  blocked={stage['blocked_seconds']:5.2f}s")
+    return results
+
+
+# Metrics of the benchmark suite, and whether higher values are better
+SUITE_METRICS = {
+    "pages_per_sec": True,
+    "index_seconds": False,
+    "retrieval_p50_ms": False,
+    "retrieval_p95_ms": False,
+    "quiz_seconds": False,
+}
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction (0.5 for the median) of the sorted values.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_benchmark_suite(corpus_sizes=(10, 50, 200), num_queries=50, num_questions=5, embed_latency=0.0,
+                        llm_latency=0.2, token_latency=0.001, max_concurrency=4):
+    """
+    Runs the whole pipeline with the fake backends on generated PDF corpora of increasing size, and measures
+    the ingestion pages/sec, the index build time (splitting, embedding and adding the chunks), the retrieval latency
+    (embedding the query and searching the collection) and the end-to-end latency of a quiz.
+    The fake backends are deterministic, so the results of two runs on the same machine can be compared.
+
+    :param corpus_sizes: The numbers of pages of the generated corpora.
+    :param num_queries: The number of retrieval queries timed on each corpus.
+    :param num_questions: The number of questions of the quiz timed on each corpus.
+    :return: A dictionary with the environment, the settings and the metrics of each corpus size.
+    """
+    settings = {"num_queries": num_queries, "num_questions": num_questions, "embed_latency": embed_latency,
+                "llm_latency": llm_latency, "token_latency": token_latency, "max_concurrency": max_concurrency}
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": settings,
+        "corpora": {},
+    }
+    rng = random.Random(0)
+    queries = [" ".join(rng.sample(WORDS, 3)) for _ in range(num_queries)]
+
+    # Warming up Chroma, so the first corpus does not pay its start-up cost
+    build_fake_collection(num_pages=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for num_pages in corpus_sizes:
+            processor = DocumentProcessor(use_page_cache=False)
+            start = time.perf_counter()
+            processor.process_files(make_uploads(1, num_pages))
+            ingestion_seconds = time.perf_counter() - start
+
+            embed_client = EmbeddingClient("benchmark", backend="fake", use_cache=False,
+                                           backend_options={"dimensions": 256, "latency": embed_latency})
+            chroma_creator = ChromaCollectionCreator(processor, embed_client, persist_directory=tempfile.mkdtemp(dir=directory))
+            start = time.perf_counter()
+            chroma_creator.create_chroma_collection()
+            index_seconds = time.perf_counter() - start
+
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                chroma_creator.db.similarity_search(query, k=4)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            generator = QuizGenerator("cell membrane", num_questions, chroma_creator, max_concurrency=max_concurrency,
+                                      context_strategy="mmr", llm_backend="fake",
+                                      llm_options={"latency": llm_latency, "token_latency": token_latency, "seed": 0})
+            start = time.perf_counter()
+            questions = generator.generate_quiz()
+            quiz_seconds = time.perf_counter() - start
+
+            metrics = {
+                "pages": len(processor.pages),
+                "chunks": chroma_creator.db._collection.count(),
+                "pages_per_sec": len(processor.pages) / ingestion_seconds,
+                "index_seconds": index_seconds,
+                "retrieval_p50_ms": percentile(timings, 0.5),
+                "retrieval_p95_ms": percentile(timings, 0.95),
+                "quiz_seconds": quiz_seconds,
+                "questions": len(questions),
+            }
+            results["corpora"][str(num_pages)] = metrics
+            print(f"pages={num_pages:<5} chunks={metrics['chunks']:<6} pages/sec={metrics['pages_per_sec']:8.1f}  "
+                  f"index={index_seconds:6.2f}s  retrieval p50={metrics['retrieval_p50_ms']:6.2f} ms "
+                  f"p95={metrics['retrieval_p95_ms']:6.2f} ms  quiz={quiz_seconds:6.2f}s")
+    return results
+
+
+def save_benchmark_results(results, path=None) -> str:
+    """
+    Saves the results of the benchmark suite as JSON.
+
+    :param path: The file to write; defaults to a timestamped file under ./benchmark_results.
+    :return: The path of the file written.
+    """
+    if path is None:
+        path = os.path.join("benchmark_results", f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare_benchmark_results(baseline, results, tolerance=0.2) -> list:
+    """
+    Compares the results of the benchmark suite with those of a previous run.
+
+    :param baseline: The results of the previous run.
+    :param results: The results of the current run.
+    :param tolerance: The relative change tolerated before a metric counts as a regression.
+    :return: The list of regressions, as messages.
+    """
+    regressions = []
+    for size, metrics in results["corpora"].items():
+        previous = baseline.get("corpora", {}).get(size)
+        if previous is None:
+            continue
+        for name, higher_is_better in SUITE_METRICS.items():
+            if not previous.get(name):
+                continue
+            change = (metrics[name] - previous[name]) / previous[name]
+            print(f"pages={size:<5} {name:<17} {previous[name]:10.3f} -> {metrics[name]:10.3f} ({change:+.1%})")
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name} on {size} pages: {previous[name]:.3f} -> {metrics[name]:.3f} ({change:+.1%})")
+    return regressions
+
+def benchmark_serving_load(concurrency_levels=(1, 10, 25, 50), num_corpora=3, num_questions=3, latency=0.2,
+                           token_latency=0.0, max_workers=8):
+    """
+    Load test of the QuizServer: at each level of concurrency, that many users upload one of `num_corpora` documents
+    at the same time and each requests a quiz. The fake backends stand in for VertexAI.
+
+    :return: A dictionary with, for each concurrency level, the p50 and p99 quiz latency (from the request to the
+             last question) in seconds, and the number of indexes built.
+    """
+    corpora = [make_pdf(20, seed=position) for position in range(num_corpora)]
+    embed_model = FakeEmbeddings(dimensions=256, latency=0.05)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for users in concurrency_levels:
+            server = QuizServer(embed_model, index_dir=tempfile.mkdtemp(dir=directory), max_workers=max_workers, max_queued=users,
+                                resources=ResourceRegistry())
+            latencies = []
+            lock = threading.Lock()
+
+            def user(position):
+                processor = DocumentProcessor(use_page_cache=False)
+                corpus = position % num_corpora
+                processor.process_files([InMemoryUpload(f"corpus_{corpus}.pdf", corpora[corpus])])
+                start = time.perf_counter()
+                server.submit_quiz(f"user-{position}", processor, "cell membrane", num_questions,
+                                   max_concurrency=num_questions, context_strategy="mmr", llm_backend="fake",
+                                   llm_options={"latency": latency, "token_latency": token_latency}).result()
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+            threads = [threading.Thread(target=user, args=(position,)) for position in range(users)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            indexes = server.resources.stats()["misses"]
+            server.shutdown()
+
+            results[users] = {"p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99),
+                              "quizzes_per_min": len(latencies) / elapsed * 60, "indexes_built": indexes}
+            print(f"users={users:<4} p50={results[users]['p50']:6.2f}s  p99={results[users]['p99']:6.2f}s  "
+                  f"quizzes/min={results[users]['quizzes_per_min']:7.1f}  indexes built={indexes}")
+    return results
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local benchmarks of the Quizify pipeline, with fake backends.")
+    parser.add_argument("--suite", action="store_true", help="run the regression suite on corpora of increasing size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="pages of the generated corpora")
+    parser.add_argument("--output", help="file where the suite results are saved (default: ./benchmark_results)")
+    parser.add_argument("--baseline", help="results of a previous suite run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    if args.suite:
+        print(f"Benchmark suite ({os.cpu_count()} CPUs, fake embeddings and LLM)")
+        results = run_benchmark_suite(corpus_sizes=args.sizes)
+        print(f"Results saved to {save_benchmark_results(results, args.output)}")
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                regressions = compare_benchmark_results(json.load(f), results, args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION: {regression}")
+            sys.exit(1 if regressions else 0)
+    else:
+        print(f"Ingestion scaling ({os.cpu_count()} CPUs)")
+        benchmark_ingestion()
+        print("Embedding engine (fake backend, 50 ms latency, 10% throttled)")
+        benchmark_embedding_engine()
+        print("Per-question vs batched quiz generation (fake LLM, 1 s + 10 ms/token)")
+        benchmark_batched_generation()
+        print("Chain construction overhead per question")
+        benchmark_chain_construction()
+        print("Duplicate questions with and without context scheduling")
+        benchmark_context_scheduling()
+        print("Local repair of malformed LLM output")
+        benchmark_output_repair()
+        print("Repeated quiz with the LLM response cache (fake LLM, 500 ms latency)")
+        benchmark_llm_cache()
+        print("Shared question library across users (fake LLM, 500 ms latency)")
+        benchmark_question_library()
+        print("Time to the first question, blocking vs background generation (fake LLM, 1 s + 10 ms/token)")
+        benchmark_time_to_first_question()
+        print("Setup cost per Streamlit rerun, with and without the resource registry")
+        benchmark_resource_registry()
+        print("Overhead of the tracing instrumentation")
+        benchmark_tracing_overhead()
+        print("Concurrent sessions on the quiz server (fake backends, 8 workers, fake LLM 200 ms)")
+        benchmark_serving_load()
+        print("Chroma vs in-process NumPy vectorstore (768 dimensions, warm embedding cache)")
+        benchmark_vector_backends()
+        print("Quantized memory-mapped embedding store (20,000 x 768 clustered vectors)")
+        benchmark_quantized_store()
+        print("Time to the first question on large uploads, full vs lazy embedding (fake embeddings 100 ms per batch)")
+        benchmark_lazy_embedding()
+        print("Phased vs streaming ingestion (fake embeddings 200 ms per request)")
+        benchmark_streaming_ingestion()
@@ -1,38 +1,157 @@
 import sys
 import os
+import hashlib
+import threading
+import chromadb
 import streamlit as st
 sys.path.append(os.path.abspath('../../'))
 from DocumentProcessor import DocumentProcessor
 from EmbeddingClient import EmbeddingClient
+from ResourceRegistry import registry
+from MatrixVectorStore import MatrixVectorStore
+from NumpyVectorStore import NumpyVectorStore
+from QuantizedVectorStore import QuantizedVectorStore
+from LexicalIndex import LexicalIndex
+from IngestionPipeline import IngestionPipeline
+from Tracing import tracer
 
 
 # Import Task libraries
 from langchain_core.documents import Document
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.vectorstores import Chroma
 
 class ChromaCollectionCreator:
-    def __init__(self, processor, embed_model):
+    def __init__(self, processor, embed_model, persist_directory="./chroma_db", collection_name=None, prune_removed=False,
+                 backend="chroma", lazy=False, lazy_candidates=64, quantization=None):
         """
         Initializing the ChromaCollectionCreator with a DocumentProcessor instance and embeddings configuration.
         :param processor: An instance of DocumentProcessor that has processed documents.
         :param embeddings_config: An embedding client for embedding documents.
+        :param persist_directory: The directory where the Chroma collection is persisted.
+        :param collection_name: The name of a Chroma collection shared by every upload. By default, each corpus (see
+                                DocumentProcessor.corpus_fingerprint) gets a collection of its own, so the chunks of
+                                other uploads are never retrieved.
+        :param prune_removed: Whether to drop the chunks of documents that are no longer uploaded when the collection is updated.
+                              Only for a named collection holding a single corpus: shared by several uploads,
+                              it would delete the chunks of the other uploads.
+        :param backend: "chroma" for the persisted Chroma collection, or "numpy" for an in-process NumpyVectorStore,
+                        faster to build and query for a handful of documents but not persisted.
+        :param lazy: Whether to only split the documents and build their LexicalIndex when the collection is created,
+                     and embed the chunks on demand, starting with the best lexical candidates for the topic (see embed_for_topic).
+        :param lazy_candidates: In lazy mode, the number of candidates embedded for a topic by default.
+        :param quantization: "float16" or "int8" to search a QuantizedVectorStore exported after each update
+                             (see export_quantized) instead of the collection, or None.
         """
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vectorstore backend: {backend}")
+        if quantization is not None and lazy:
+            raise ValueError("A lazy collection embeds its chunks on demand, it cannot be searched from a read-only quantized store.")
         self.processor = processor      # holds the DocumentProcessor 
         self.embed_model = embed_model  # holds the EmbeddingClient 
         self.db = None                  # holds the Chroma collection
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.opened_collection_name = None  # name of the collection held by db
+        self.prune_removed = prune_removed
+        self.backend = backend
+        self.lock = threading.Lock()    # serializes the updates of the collection
+        self.indexed_fingerprint = None # corpus fingerprint of the documents last indexed
+        self.status = None              # message of the last update of the collection
+        self.lazy = lazy
+        self.lazy_candidates = lazy_candidates
+        self.chunks = []                # chunk Documents of the documents last indexed
+        self.lexical_index = None       # LexicalIndex of the chunks, built on every update
+        self.embedded_topics = {}       # in lazy mode, topic -> number of its lexical candidates embedded
+        self.completion_thread = None   # in lazy mode, thread embedding the remaining chunks
+        self.quantization = quantization
+        self.writable_db = None         # with quantization, the collection updated, while db is its QuantizedVectorStore
     
     def create_chroma_collection(self):
         """
-        This method creates a Chroma collection from the documents processed by the DocumentProcessor instance.
+        This method creates or updates the Chroma collection from the documents processed by the DocumentProcessor instance.
+        The persisted collection is reopened instead of being rebuilt, and only the chunks that are not indexed yet are embedded.
+        Files the DocumentProcessor received with `defer_parsing` are parsed here, with the IngestionPipeline.
+        With `quantization`, the collection is then exported to a QuantizedVectorStore, which becomes `db`.
+        Concurrent calls (e.g. from sessions sharing the collection of a corpus, see QuizServer) run one at a time,
+        and a call returns at once when the same documents were already indexed.
+        It often runs in a background thread, where Streamlit cannot show messages: the outcome is returned or raised,
+        for the script to show.
+        :return: A message describing the update (or the last one, when the documents were already indexed).
+        :raises ValueError: If no documents were processed.
+        :raises RuntimeError: If the collection could not be created.
         """
-        
+        with self.lock:
+            fingerprint = self.processor.corpus_fingerprint()
+            if self.db is not None and self.indexed_fingerprint == fingerprint:
+                return self.status
+            pending_files = self.processor.take_pending_files()
+            if pending_files and not self.lazy:
+                # Files uploaded without being parsed: their pages are embedded and indexed while the next ones are parsed
+                IngestionPipeline(self).ingest(pending_files)
+            else:
+                if pending_files:
+                    self.processor.process_files(pending_files)
+                self.status = self._update_collection()
+                self.indexed_fingerprint = self.processor.corpus_fingerprint()
+            if self.quantization is not None:
+                self._serve_quantized()
+            return self.status
+
+    def _serve_quantized(self):
+        # The store of the same documents is reused as is: rewriting its files would break the processes mapping them
+        path = os.path.join(self.persist_directory, "quantized", f"{self.indexed_fingerprint[:16]}-{self.quantization}")
+        with tracer.span("index.quantize", quantization=self.quantization):
+            if os.path.exists(os.path.join(path, "meta.json")):
+                store = QuantizedVectorStore(path, self.embed_model)
+            else:
+                store = self.export_quantized(path, self.quantization)
+        self.writable_db, self.db = self.db, store
+    
+    def _update_collection(self):
         # Checking if any documents have been processed by the DocumentProcessor instance
         if len(self.processor.pages) == 0:
-            st.error("No documents found!", icon="🚨")
-            return
+            raise ValueError("No documents found!")
 
-        # Splitting documents into text chunks suitable for embedding and indexing, using the CharacterTextSplitter from Langchain
+        with tracer.span("split", pages=len(self.processor.pages)) as span:
+            texts = self.split_pages(self.processor.pages)
+            span.set_attribute("chunks", len(texts))
+        
+        # The lexical index needs no embedding, so it is rebuilt with the chunks on every update
+        with tracer.span("index.lexical", chunks=len(texts)):
+            self.chunks = texts
+            self.lexical_index = LexicalIndex(texts)
+            self.embedded_topics = {}
+            self.completion_thread = None
+
+        # Reopening the persisted Chroma Collection, with the embeddings model initialized in the class
+        # In lazy mode, the chunks are embedded later, by embed_for_topic
+        self.open_chroma_collection()
+        num_added = 0
+        if not self.lazy:
+            with tracer.span("index", chunks=len(texts)) as span:
+                num_added = self.upsert_documents(texts)
+                span.set_attribute("chunks_added", num_added)
+        
+        # Dropping the chunks of the documents that were removed from the upload
+        num_removed = 0
+        if self.prune_removed:
+            with tracer.span("index.prune"):
+                num_removed = self.prune_chunks({self.chunk_id(text) for text in texts})
+
+        # An empty collection is falsy, as it is before the chunks of a lazy collection are embedded
+        if self.db is None:
+            raise RuntimeError("Failed to create Chroma Collection!")
+        if self.lazy:
+            return f"Successfully indexed {len(texts)} chunks! They are embedded on demand ({num_removed} removed)"
+        return f"Successfully updated Chroma Collection! ({len(texts)} chunks, {num_added} new chunks embedded, {num_removed} removed)"
+    
+    @staticmethod
+    def split_pages(pages) -> list:
+        """
+        Splits pages into text chunks suitable for embedding and indexing, using the CharacterTextSplitter from Langchain.
+        :param pages: A list of page Documents.
+        :return: The list of chunk Documents, keeping the source and page of each chunk.
+        """
         text_splitter = CharacterTextSplitter(
             separator="\n\n",
             chunk_size=512,
@@ -41,30 +160,194 @@ class ChromaCollectionCreator:
             is_separator_regex=False,
         )
 
-        aux_array = list(map(lambda page: page.page_content, self.processor.pages))
-        texts = text_splitter.create_documents(aux_array)
+        # Keeping the metadata of the pages, so each chunk knows the document it comes from
+        aux_array = list(map(lambda page: page.page_content, pages))
+        metadatas = list(map(lambda page: {"source": page.metadata.get("source", ""), "page": page.metadata.get("page", 0)}, pages))
+        return text_splitter.create_documents(aux_array, metadatas=metadatas)
+    
+    def open_chroma_collection(self):
+        """
+        Opens the persisted Chroma collection, creating it if it does not exist yet.
+        With the "numpy" backend, creates the in-process vectorstore instead.
+        With `quantization`, reopens the collection the QuantizedVectorStore was exported from, to update it.
+        Without a `collection_name`, the collection of the current corpus is opened, replacing that of the previous one.
+        """
+        if self.writable_db is not None:
+            self.db, self.writable_db = self.writable_db, None
+        name = self.collection_name or f"corpus-{self.processor.corpus_fingerprint()[:16]}"
+        if name != self.opened_collection_name:
+            self.db = None
+        if self.db is None and self.backend == "numpy":
+            self.db = NumpyVectorStore(self.embed_model)
+        elif self.db is None:
+            # The opened collection is shared by every rerun and session of the process
+            self.db = registry.chroma_collection(name, self.persist_directory, self.embed_model)
+        self.opened_collection_name = name
+        return self.db
+    
+    @staticmethod
+    def chunk_id(document) -> str:
+        """
+        Builds a deterministic ID for a chunk from its content, so the same text is never embedded twice,
+        even when it appears in several documents or a document is uploaded under another name.
+        :param document: The chunk Document.
+        :return: The hex SHA-256 of the content of the chunk.
+        """
+        return hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+    
+    def upsert_documents(self, documents) -> int:
+        """
+        Adds to the collection the chunks that are not indexed yet; only those are embedded.
+        :param documents: A list of chunk Documents.
+        :return: The number of chunks added.
+        """
+        chunks = self.new_chunks(documents)
+        if chunks:
+            self.db.add_documents(list(chunks.values()), ids=list(chunks.keys()))
+        return len(chunks)
+    
+    def new_chunks(self, documents) -> dict:
+        """
+        Selects the chunks that are not indexed yet.
+        :param documents: A list of chunk Documents.
+        :return: A dictionary of the chunk Documents not in the collection, by chunk ID, without repetitions.
+        """
+        # Removing the chunks that appear several times in the list
+        chunks = {}
+        for document in documents:
+            chunks.setdefault(self.chunk_id(document), document)
         
-        if texts is not None:
-            st.success(f"Successfully split pages to {len(texts)} documents!", icon="✅")
-
-        # Now creating the Chroma Collection in memory with texts and the embeddings model initialized in the class
-        self.db = Chroma.from_documents(
-            texts, 
-            self.embed_model.client, 
-            persist_directory="./chroma_db")
-
-        if self.db:
-            st.success("Successfully created Chroma Collection!", icon="✅")
+        ids = list(chunks.keys())
+        existing = set(self.db.get(ids=ids, include=[])["ids"]) if ids else set()
+        return {chunk_id: chunks[chunk_id] for chunk_id in ids if chunk_id not in existing}
+    
+    def add_embedded_documents(self, chunks, vectors):
+        """
+        Writes chunks whose embeddings are already computed to the collection, without calling the embedding model.
+        :param chunks: A dictionary of chunk Documents by chunk ID, as returned by `new_chunks`.
+        :param vectors: The embeddings of the chunks, in the same order.
+        """
+        ids = list(chunks.keys())
+        texts = [document.page_content for document in chunks.values()]
+        metadatas = [document.metadata for document in chunks.values()]
+        if isinstance(self.db, NumpyVectorStore):
+            self.db.add_embeddings(texts, vectors, metadatas, ids=ids)
         else:
-            st.error("Failed to create Chroma Collection!", icon="🚨")
+            # The LangChain wrapper of Chroma always embeds the texts itself, so the vectors are written with the
+            # chromadb client of the same directory, which shares the opened database
+            collection = chromadb.PersistentClient(path=self.persist_directory).get_collection(
+                self.opened_collection_name, embedding_function=None)
+            collection.upsert(ids=ids, embeddings=[list(map(float, vector)) for vector in vectors],
+                              documents=texts, metadatas=metadatas)
+    
+    def embed_for_topic(self, topic, count=None) -> int:
+        """
+        In lazy mode, embeds the best lexical candidates for a topic that are not embedded yet, so the questions on
+        the topic can be generated without embedding the whole corpus. Asking again for the same topic with a larger
+        count grows the embedded set with the next candidates. When no chunk shares a term with the topic,
+        the lexical ranking is of no help and every chunk is embedded.
+        :param topic: The topic of the quiz.
+        :param count: The number of candidates of the topic that must be embedded; defaults to `lazy_candidates`.
+        :return: The number of chunks added to the collection.
+        """
+        if not self.lazy or self.lexical_index is None:
+            return 0
+        count = count or self.lazy_candidates
+        with self.lock:
+            if self.embedded_topics.get(topic, 0) >= count:
+                return 0
+            candidates = [document for document, _ in self.lexical_index.search(topic, k=count)]
+            if not candidates:
+                candidates = self.chunks
+            with tracer.span("index.lazy", topic=topic, candidates=len(candidates)) as span:
+                num_added = self.upsert_documents(candidates)
+                span.set_attribute("chunks_added", num_added)
+            self.embedded_topics[topic] = count
+        return num_added
+    
+    def embed_remaining(self, batch_size=256) -> int:
+        """
+        In lazy mode, embeds every chunk not embedded yet, in batches, so the later quizzes search the whole documents.
+        The lock is taken per batch, so topics asked for in the meantime are embedded without waiting for the rest.
+        :param batch_size: The number of chunks upserted at a time.
+        :return: The number of chunks added to the collection.
+        """
+        if not self.lazy or self.db is None:
+            return 0
+        num_added = 0
+        chunks = self.chunks
+        for start in range(0, len(chunks), batch_size):
+            with self.lock:
+                if self.chunks is not chunks:
+                    # The documents were indexed again in the meantime, with a completion of their own
+                    break
+                num_added += self.upsert_documents(chunks[start:start + batch_size])
+        return num_added
+    
+    def embed_remaining_in_background(self):
+        """
+        In lazy mode, starts `embed_remaining` in a background thread, once per indexing of the documents.
+        Called once the first question of a quiz is ready (see QuestionProducer and QuizServer).
+        """
+        if not self.lazy:
+            return
+        with self.lock:
+            if self.completion_thread is not None or self.db is None:
+                return
+            completion_thread = threading.Thread(target=self._complete_collection, daemon=True)
+            completion_thread.start()
+            self.completion_thread = completion_thread
+    
+    def _complete_collection(self):
+        # The outcome is added to the message of the last update, since the thread has no page to show it on
+        try:
+            message = f" Embedded the {self.embed_remaining()} remaining chunks."
+        except Exception as e:
+            message = f" Failed to embed the remaining chunks: {e}"
+        with self.lock:
+            # Unless the documents were indexed again in the meantime
+            if self.completion_thread is threading.current_thread():
+                self.status = (self.status or "") + message
+    
+    def prune_chunks(self, current_ids) -> int:
+        """
+        Deletes the chunks of the collection that are not among the given ones, e.g. those of the documents no longer uploaded.
+        :param current_ids: The IDs of the chunks of the documents last indexed (see chunk_id).
+        :return: The number of chunks deleted.
+        """
+        stale_ids = list(set(self.db.get(include=[])["ids"]) - set(current_ids))
+        if stale_ids:
+            self.db.delete(ids=stale_ids)
+        return len(stale_ids)
+    
+    def export_quantized(self, path, quantization="int8", keep_full_precision=True, **kwargs) -> QuantizedVectorStore:
+        """
+        Writes the collection to a compact, memory-mapped QuantizedVectorStore and opens it, e.g. to serve
+        a large collection from several processes.
+        :param path: The directory of the store.
+        :param quantization: "float16" or "int8".
+        :param keep_full_precision: Whether to keep the float32 vectors, needed to re-rank the results.
+        :param kwargs: Extra arguments of the QuantizedVectorStore (rerank, rerank_factor...).
+        """
+        if self.db is None:
+            raise RuntimeError("The collection has not been created.")
+        return QuantizedVectorStore.from_store(self.db, path, quantization=quantization,
+                                               keep_full_precision=keep_full_precision,
+                                               embedding_function=self.embed_model, **kwargs)
     
     def query_chroma_collection(self, query) -> Document:
         """
         Queries the created Chroma collection for documents similar to the query.
-        :param query: The query string to search for in the Chroma collection.
+        :param query: The query string to search for in the Chroma collection, or a list of queries.
         
-        Returns the first matching document from the collection with similarity score.
+        Returns the first matching document from the collection with similarity score, or a list of them for a list of queries.
+        With the "numpy" backend or `quantization`, a list of queries is ranked at once.
         """
+        if self.db and isinstance(query, (list, tuple)):
+            if isinstance(self.db, MatrixVectorStore):
+                results = self.db.batch_similarity_search_by_vector([self.embed_model.embed_query(q) for q in query], k=1)
+                return [(docs[0][0], self.db.relevance_score(docs[0][1])) if docs else None for docs in results]
+            return [self.query_chroma_collection(q) for q in query]
         if self.db:
             docs = self.db.similarity_search_with_relevance_scores(query)
             if docs:
@@ -93,4 +376,7 @@ if __name__ == "__main__":
         
         submitted = st.form_submit_button("Submit")
         if submitted:
-            chroma_creator.create_chroma_collection()
\ No newline at end of file
+            try:
+                st.success(chroma_creator.create_chroma_collection(), icon="✅")
+            except (ValueError, RuntimeError) as e:
+                st.error(str(e), icon="🚨")
\ No newline at end of file
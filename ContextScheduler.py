@@ -0,0 +1,97 @@
+import threading
+from HybridRetriever import HybridRetriever
+
+class ContextScheduler:
+    """
+    This class spreads the corpus across the questions of a quiz, so that each question is generated
+    from a different slice of context instead of the same top-k chunks for the topic.
+
+    Functionalities:
+    - Retrieves, once per quiz, a pool of chunks around the topic: diverse chunks with Maximal Marginal
+      Relevance ("mmr"), or simply the most similar ones ("partition").
+    - With a LexicalIndex, the pool is fused with the BM25 ranking of the topic (Reciprocal Rank Fusion, see HybridRetriever).
+    - Deals the pool into one slice per question without replacement, round-robin, so every slice mixes
+      highly and less relevant chunks. Extra slices are kept aside for the retries.
+
+    Parameters:
+    - db: The vectorstore (e.g. the Chroma collection) to retrieve the chunks from.
+    - topic: The topic of the quiz.
+    - chunks_per_question: The number of chunks in the context of each question.
+    - strategy: "mmr" or "partition".
+    - fetch_factor: For "mmr", the number of candidates considered per chunk returned.
+    - lexical_index: An optional LexicalIndex of the chunks, for hybrid retrieval.
+    """
+
+    def __init__(self, db, topic, chunks_per_question=4, strategy="mmr", fetch_factor=4, lexical_index=None):
+        if strategy not in ("mmr", "partition"):
+            raise ValueError(f"Unknown context strategy: {strategy}")
+        self.db = db
+        self.topic = topic
+        self.chunks_per_question = chunks_per_question
+        self.strategy = strategy
+        self.fetch_factor = fetch_factor
+        self.lexical_index = lexical_index
+        self.slices = []
+        self.spare_slices = []
+        self.num_slots = 0
+        self.attempts = {}
+        self.lock = threading.Lock()
+
+    def plan(self, num_slots, num_spare_slots=0):
+        """
+        Retrieves the pool of chunks and deals it into slices, one per question plus the spare slices.
+
+        :param num_slots: The number of questions of the quiz.
+        :param num_spare_slots: The number of extra slices kept for the retries.
+        """
+        num_slices = num_slots + num_spare_slots
+        k = num_slices * self.chunks_per_question
+        if self.strategy == "mmr":
+            documents = self.db.max_marginal_relevance_search(self.topic, k=k, fetch_k=k * self.fetch_factor)
+        else:
+            documents = self.db.similarity_search(self.topic, k=k)
+        if self.lexical_index is not None:
+            lexical = [document for document, _ in self.lexical_index.search(self.topic, k=k)]
+            documents = HybridRetriever(vectorstore=self.db, lexical_index=self.lexical_index, k=k).fuse(documents, lexical)
+
+        # With a small corpus, some slices would be empty: those reuse the chunks of the others
+        if documents and len(documents) < num_slices:
+            documents = [documents[i % len(documents)] for i in range(num_slices)]
+        slices = [documents[i::num_slices] for i in range(num_slices)]
+
+        with self.lock:
+            self.num_slots = num_slots
+            self.slices = slices[:num_slots]
+            self.spare_slices = slices[num_slots:]
+            self.attempts = {}
+
+    def next_context(self, slot):
+        """
+        Returns the context for the next attempt at the given question: its own slice on the first attempt,
+        then spare slices for the retries, then the slices of the other questions once the spares run out.
+
+        :param slot: The position of the question in the quiz.
+        :return: A list of chunk Documents.
+        """
+        with self.lock:
+            attempt = self.attempts.get(slot, 0)
+            self.attempts[slot] = attempt + 1
+            if not self.slices:
+                return []
+            if attempt == 0:
+                return self.slices[slot % len(self.slices)]
+            if self.spare_slices:
+                return self.spare_slices.pop(0)
+            return self.slices[(slot + attempt) % len(self.slices)]
+
+    def next_contexts(self, slots):
+        """
+        Returns the chunks of the next contexts of several questions, joined together (used in batch mode).
+
+        :param slots: The positions of the questions in the quiz.
+        :return: A list of chunk Documents.
+        """
+        documents = []
+        for slot in slots:
+            documents.extend(self.next_context(slot))
+        return documents
@@ -1,59 +1,296 @@
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader
-import os
-import tempfile
-import uuid
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+import io
+import mmap
+from PageCache import PageCache
+from Tracing import tracer
+
+# Same splitter (and defaults) as Langchain's PyPDFLoader.load_and_split()
+text_splitter = RecursiveCharacterTextSplitter()
+
+
+def _split_page(reader, file_name, index):
+    """
+    Extracts the text of a single page and splits it into Documents.
+
+    :param reader: The PdfReader of the file.
+    :param file_name: The original name of the uploaded file, stored as the 'source' of each page.
+    :param index: The index of the page in the file.
+    :return: The list of Documents for the page.
+    """
+    page = Document(page_content=reader.pages[index].extract_text(), metadata={"source": file_name, "page": index})
+    return text_splitter.split_documents([page])
+
+
+def _extract_page_range(file_name, file_bytes, start, stop):
+    """
+    Extracts the pages [start, stop) of a PDF file. Defined at module level so it can run in a worker process.
+
+    :param file_name: The original name of the uploaded file, stored as the 'source' of each page.
+    :param file_bytes: The raw content of the PDF file.
+    :param start: The index of the first page to extract.
+    :param stop: The index after the last page to extract.
+    :return: The list of page Documents, split the same way as PyPDFLoader.load_and_split().
+    """
+    reader = PdfReader(io.BytesIO(file_bytes))
+    pages = []
+    for i in range(start, stop):
+        pages.extend(_split_page(reader, file_name, i))
+    return pages
+
 
 class DocumentProcessor:
     """
     This class encapsulates the functionality for processing uploaded PDF documents using Streamlit
-    and Langchain's PyPDFLoader. It provides a method to render a file uploader widget, process the
-    uploaded PDF files, extract their pages, and display the total number of pages extracted.
+    and pypdf. It provides a method to render a file uploader widget, process the uploaded PDF files,
+    extract their pages, and display the total number of pages extracted.
+
+    Files are parsed straight from the uploaded buffer (or a memory-mapped file), without writing a
+    temporary copy, and `stream_documents` yields pages one at a time so downstream steps can start
+    before a whole PDF has been read.
+
+    Pages extracted from a file are stored in a PageCache keyed by the SHA-256 of the file content,
+    so an unchanged upload is not parsed again on the next Streamlit rerun.
+
+    With num_workers > 1, files (and page ranges of `pages_per_task` pages within large files) are
+    parsed in a pool of worker processes. Pages are returned in the original order, and a file that
+    fails to parse is reported in self.errors without stopping the rest of the batch.
     """
-    def __init__(self):
+    def __init__(self, use_page_cache=True, page_cache=None, num_workers=1, pages_per_task=50):
         self.pages = []  # List to keep track of pages from all documents
-    
-    def ingest_documents(self):
+        self.errors = []  # List of (file name, error message) for the files that could not be parsed
+        self.file_hashes = []  # SHA-256 of the content of each processed file
+        self.pending_files = []  # Files received with defer_parsing, parsed later by the ChromaCollectionCreator
+        self.num_workers = num_workers
+        self.pages_per_task = pages_per_task
+
+        # Holds the PageCache, or None when caching is disabled
+        if use_page_cache:
+            self.page_cache = page_cache if page_cache is not None else PageCache()
+        else:
+            self.page_cache = None
+
+    def ingest_documents(self, defer_parsing=False):
         """
         Renders a file uploader in a Streamlit app, processes uploaded PDF files,
         extracts their pages, and updates the self.pages list with the total number of pages.
+
+        :param defer_parsing: Whether to only record the uploaded files (see `defer_files`), so they are parsed
+                              while being indexed instead of before.
         """
-        
+
         # Rendering a file uploader widget in Streamlit
         uploaded_files = st.file_uploader(
             type='pdf',
             accept_multiple_files=True,
             label="Upload PDF files :sunglasses:"
         )
-        
-        # For each uploaded PDF file:
-        if uploaded_files is not None:
-            for uploaded_file in uploaded_files:
-                # Generating a unique identifier and append it to the original file name before saving it temporarily.
-                # This avoids name conflicts and maintains traceability of the file.
-                unique_id = uuid.uuid4().hex
-                original_name, file_extension = os.path.splitext(uploaded_file.name)
-                temp_file_name = f"{original_name}_{unique_id}{file_extension}"
-                temp_file_path = os.path.join(tempfile.gettempdir(), temp_file_name)
-
-                # Writing the content of the uploaded PDF to a temporary file.
-                with open(temp_file_path, 'wb') as f:
-                    f.write(uploaded_file.getvalue()) 
-
-                # Processing the temporary file using PyPDFLoader from Langchain to load the PDF and extract pages.
-                loader = PyPDFLoader(temp_file_path)
-                pages_result = loader.load_and_split()                
-                
-                #Adding the extracted pages to the 'pages' list to keep track of the total number of pages extracted from all uploaded documents.
-                for i in pages_result:
-                    self.pages.append(i)
-                
-                # Cleaning up by deleting the temporary file after processing.
-                os.unlink(temp_file_path)
-            
+
+        if uploaded_files and defer_parsing:
+            self.defer_files(uploaded_files)
+            st.write(f"Total files uploaded: {len(uploaded_files)}")
+        elif uploaded_files is not None:
+            self.process_files(uploaded_files)
+
+            # Reporting the files that could not be parsed
+            for file_name, error in self.errors:
+                st.error(f"Failed to process {file_name}: {error}", icon="🚨")
+
             # Displaying the total number of pages processed.
             st.write(f"Total pages processed: {len(self.pages)}")
-        
+
+    def process_files(self, uploaded_files):
+        """
+        Extracts the pages of the given PDF files and appends them to self.pages, in the order of the files.
+
+        :param uploaded_files: A list of uploaded files, each a binary file-like object with a `name`.
+        """
+        if self.num_workers <= 1:
+            num_pages, num_errors = len(self.pages), len(self.errors)
+            self.pages.extend(self.stream_documents(uploaded_files))
+            # Dropping the pages of the files that failed halfway
+            failed = self.failed_files(since=num_errors)
+            if failed:
+                self.pages[num_pages:] = [page for page in self.pages[num_pages:] if page.metadata["source"] not in failed]
+            return
+
+        results = [None] * len(uploaded_files)
+        to_parse = []  # (position, file, hash) of the files that are not cached
+
+        # For each uploaded PDF file:
+        for position, uploaded_file in enumerate(uploaded_files):
+            # Looking up the pages of this file in the cache before parsing it
+            file_hash = PageCache.hash_file(uploaded_file)
+            # The hash of a deferred file is already recorded
+            if file_hash not in self.file_hashes:
+                self.file_hashes.append(file_hash)
+            results[position] = self.page_cache.get(file_hash) if self.page_cache else None
+            if results[position] is None:
+                to_parse.append((position, uploaded_file, file_hash))
+            else:
+                tracer.count("page_cache.hits")
+
+        if to_parse:
+            # The worker processes need their own copy of the file content
+            with tracer.span("pdf.parse", files=len(to_parse), workers=self.num_workers):
+                parsed = self._load_pages_parallel([(f.name, f.getvalue()) for _, f, _ in to_parse])
+        else:
+            parsed = []
+
+        for (position, uploaded_file, file_hash), pages_result in zip(to_parse, parsed):
+            if isinstance(pages_result, Exception):
+                self.errors.append((uploaded_file.name, str(pages_result)))
+                self.file_hashes.remove(file_hash)
+                continue
+            results[position] = pages_result
+            if self.page_cache:
+                self.page_cache.put(file_hash, pages_result, {"file_name": uploaded_file.name})
+
+        #Adding the extracted pages to the 'pages' list to keep track of the total number of pages extracted from all uploaded documents.
+        for pages_result in results:
+            if pages_result:
+                self.pages.extend(pages_result)
+
+    def defer_files(self, uploaded_files):
+        """
+        Records files to parse later, with their hashes, so the corpus fingerprint is known before any page is parsed.
+        The ChromaCollectionCreator parses them with the IngestionPipeline, overlapping the parsing with the embedding.
+
+        :param uploaded_files: A list of uploaded files, each a binary file-like object with a `name`.
+        """
+        for uploaded_file in uploaded_files:
+            self.file_hashes.append(PageCache.hash_file(uploaded_file))
+            self.pending_files.append(uploaded_file)
+
+    def take_pending_files(self) -> list:
+        """
+        Returns the files recorded by `defer_files` and not parsed yet, and forgets them.
+        """
+        pending_files, self.pending_files = self.pending_files, []
+        return pending_files
+
+    def stream_documents(self, uploaded_files):
+        """
+        Yields the pages of the given PDF files one at a time, in order, without accumulating them in self.pages.
+        Each page is yielded as soon as it is extracted, and written to the PageCache entry of its file at the same time.
+        Cached files are served from the PageCache. A file that fails to parse halfway is recorded in self.errors and
+        its hash dropped; the consumer discards the pages of that file it already received (see `failed_files`).
+
+        :param uploaded_files: A list of uploaded files, each a binary file-like object with a `name`.
+        :return: A generator of page Documents.
+        """
+        for uploaded_file in uploaded_files:
+            file_hash = PageCache.hash_file(uploaded_file)
+            # The hash of a deferred file is already recorded
+            if file_hash not in self.file_hashes:
+                self.file_hashes.append(file_hash)
+            cached = self.page_cache.get(file_hash) if self.page_cache else None
+            if cached is not None:
+                tracer.count("page_cache.hits")
+                yield from cached
+                continue
+
+            span = tracer.start_span("pdf.parse", file=uploaded_file.name)
+            writer = self.page_cache.open_entry(file_hash, {"file_name": uploaded_file.name}) if self.page_cache else None
+            num_pages = 0
+            try:
+                for page in self.iter_pages(uploaded_file, uploaded_file.name):
+                    if writer is not None:
+                        writer.write(page)
+                    num_pages += 1
+                    yield page
+            except GeneratorExit:
+                # The consumer stopped reading: the file is not cached, as some of its pages are missing
+                span.end()
+                if writer is not None:
+                    writer.discard()
+                raise
+            except Exception as e:
+                self.errors.append((uploaded_file.name, str(e)))
+                self.file_hashes.remove(file_hash)
+                span.end(e)
+                if writer is not None:
+                    writer.discard()
+                continue
+            span.set_attribute("pages", num_pages)
+            span.end()
+            if writer is not None:
+                writer.commit()
+
+    def failed_files(self, since=0) -> set:
+        """
+        Returns the names of the files that failed to parse, which are the sources of the pages to discard.
+
+        :param since: The number of errors recorded before the parsing of interest started; only later failures are returned.
+        :return: A set of file names.
+        """
+        return {file_name for file_name, _ in self.errors[since:]}
+
+    def corpus_fingerprint(self) -> str:
+        """
+        Identifies the set of processed files by their content, whatever their names and upload order.
+
+        :return: The hex SHA-256 of the sorted hashes of the processed files.
+        """
+        return PageCache.hash_bytes("\n".join(sorted(set(self.file_hashes))).encode("utf-8"))
+
+    def iter_pages(self, source, file_name=None):
+        """
+        Yields the pages of a single PDF file, parsed straight from memory.
+
+        :param source: A binary file-like object (e.g. a Streamlit UploadedFile), or the path of a PDF file,
+                       which is memory-mapped instead of being read into memory.
+        :param file_name: The name stored as the 'source' of each page. Defaults to the path or the file's `name`.
+        :return: A generator of page Documents, split the same way as PyPDFLoader.load_and_split().
+        """
+        if isinstance(source, str):
+            with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from self.iter_pages(mapped, file_name or source)
+            return
+
+        source.seek(0)
+        reader = PdfReader(source)
+        file_name = file_name or getattr(source, "name", None)
+        for i in range(len(reader.pages)):
+            yield from _split_page(reader, file_name, i)
+
+    def _load_pages_parallel(self, files):
+        """
+        Extracts the pages of several PDF files in a pool of worker processes.
+        Each file is split into ranges of `pages_per_task` pages, so large files are also parsed in parallel.
+
+        :param files: A list of (file name, file bytes) tuples.
+        :return: A list with, for each file, its list of page Documents in order, or the Exception that made it fail.
+        """
+        results = [[] for _ in files]
+
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            tasks = []  # (file position, future) in page order
+            for position, (name, file_bytes) in enumerate(files):
+                try:
+                    num_pages = len(PdfReader(io.BytesIO(file_bytes)).pages)
+                except Exception as e:
+                    results[position] = e
+                    continue
+                for start in range(0, num_pages, self.pages_per_task):
+                    stop = min(start + self.pages_per_task, num_pages)
+                    tasks.append((position, executor.submit(_extract_page_range, name, file_bytes, start, stop)))
+
+            # Collecting the results in submission order keeps the pages in their original order
+            for position, future in tasks:
+                try:
+                    pages_result = future.result()
+                except Exception as e:
+                    results[position] = e
+                    continue
+                if not isinstance(results[position], Exception):
+                    results[position].extend(pages_result)
+
+        return results
+
 if __name__ == "__main__":
     processor = DocumentProcessor()
     processor.ingest_documents()
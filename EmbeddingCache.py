@@ -0,0 +1,118 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+class EmbeddingCache:
+    """
+    This class implements a persistent cache of embedding vectors, backed by a local SQLite file.
+
+    Functionalities:
+    - Stores one vector per key, where the key is built from the model name, the kind of embedding
+      (query or document) and the hash of the normalized text.
+    - Keeps at most `max_entries` vectors, evicting the least recently used ones.
+    - Can be shared between threads (Streamlit runs each session in its own thread).
+
+    Parameters:
+    - cache_path: The path of the SQLite file where vectors are stored.
+    - max_entries: The maximum number of vectors kept in the cache.
+    """
+
+    def __init__(self, cache_path="./embedding_cache/embeddings.sqlite3", max_entries=200_000):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The file is shared by the worker processes of the BatchRunner: a writer waits for the others instead of
+        # failing with "database is locked", and with write-ahead logging the readers never wait for a writer
+        self.connection = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(model_name, kind, text) -> str:
+        """
+        Builds the cache key of a text. Texts that only differ in whitespace share the same key.
+
+        :param model_name: The name of the embedding model.
+        :param kind: "query" or "document", since the model embeds them differently.
+        :param text: The text to embed.
+        :return: The hex SHA-256 of the model name, the kind and the normalized text.
+        """
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{model_name}\0{kind}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys) -> dict:
+        """
+        Retrieves the cached vectors for the given keys.
+
+        :param keys: A list of cache keys.
+        :return: A dictionary mapping each key found in the cache to its vector.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self.lock:
+            # Querying in chunks to stay under SQLite's limit on the number of parameters
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('d')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            # Marking the hits as recently used
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+            )
+            self.connection.commit()
+        return found
+
+    def put_many(self, items):
+        """
+        Stores vectors in the cache and evicts the least recently used ones if the cache grew over its cap.
+
+        :param items: A list of (key, vector) tuples.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array('d', vector).tobytes(), now) for key, vector in items],
+            )
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        """
+        Removes every vector from the cache.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM embeddings")
+            self.connection.commit()
@@ -1,28 +1,71 @@
+from langchain_core.embeddings import Embeddings
 from langchain_google_vertexai import VertexAIEmbeddings
+from EmbeddingCache import EmbeddingCache
+from EmbeddingEngine import EmbeddingEngine
+from FakeBackends import FakeEmbeddings
+from Tracing import tracer
 
-class EmbeddingClient:
+# Embedding backends, by name: each builds the LangChain embedding model from the client settings and its own options
+EMBEDDING_BACKENDS = {
+    "vertex": lambda model_name, project, location, **options: VertexAIEmbeddings(
+        model_name=model_name, project=project, location=location, **options),
+    "fake": lambda model_name, project, location, **options: FakeEmbeddings(**options),
+}
+
+class EmbeddingClient(Embeddings):
     """
     This class connects to Google Cloud's VertexAI for text embeddings.
 
     Funtionalities:
     - Should be capable of initializing an embedding client with specific configurations
-      for model name, project, and location. 
+      for model name, project, and location.
     - This client will be used to embed queries.
+    - Vectors are cached on disk (see EmbeddingCache), so only texts that were never embedded
+      with this model are sent to VertexAI. Hits and misses are counted in `cache_hits` and `cache_misses`.
+    - Documents are embedded by an EmbeddingEngine: in batches, with a bounded number of concurrent requests,
+      an optional rate limit, and retries with backoff when the quota is exceeded.
+    - The backend is pluggable: "vertex" calls VertexAI, "fake" uses the deterministic FakeEmbeddings
+      (configurable latency and errors, no Google Cloud call), e.g. for benchmarks and offline runs.
 
     Parameters:
     - model_name: A string representing the name of the model to use for embeddings.
     - project: The Google Cloud project ID where the embedding model is hosted.
     - location: The location of the Google Cloud project, such as 'us-central1'.
+    - use_cache: Whether to cache the embeddings.
+    - cache: An optional EmbeddingCache instance; a default one is created when caching is enabled.
+    - batch_size: The number of documents sent in each request.
+    - max_concurrency: The maximum number of requests in flight.
+    - requests_per_minute: The maximum request rate, or None for no limit.
+    - backend: The name of the embedding backend, "vertex" or "fake" (see EMBEDDING_BACKENDS).
+    - backend_options: Extra arguments of the backend, e.g. {"latency": 0.05, "error_rate": 0.1} for "fake".
     """
-    
-    def __init__(self, model_name, project, location):
-        # Initializing the VertexAIEmbeddings client (from LangChain) with the given parameters
-        self.client = VertexAIEmbeddings(
-            model_name=model_name,
-            project=project,
-            location=location
+
+    def __init__(self, model_name, project=None, location=None, use_cache=True, cache=None,
+                 batch_size=32, max_concurrency=4, requests_per_minute=None, backend="vertex", backend_options=None):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}. Expected one of {', '.join(EMBEDDING_BACKENDS)}.")
+        self.backend = backend
+
+        # The cached vectors of a backend must not be served for another one
+        self.model_name = model_name if backend == "vertex" else f"{backend}:{model_name}"
+
+        # Initializing the embedding model (from LangChain, e.g. VertexAIEmbeddings) with the given parameters
+        self.client = EMBEDDING_BACKENDS[backend](model_name, project, location, **(backend_options or {}))
+        self.engine = EmbeddingEngine(
+            self.client.embed_documents,
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute
         )
-    
+
+        # Holds the EmbeddingCache, or None when caching is disabled
+        if use_cache:
+            self.cache = cache if cache is not None else EmbeddingCache()
+        else:
+            self.cache = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     def embed_query(self, query):
         """
         Using the embedding client to retrieve embeddings for the given query.
@@ -30,9 +73,9 @@ class EmbeddingClient:
         :param: query: The text query to embed.
         :return: The embeddings for the query or None if the operation fails.
         """
-        vectors = self.client.embed_query(query)
-        return vectors
-    
+        vectors = self._embed_with_cache([query], "query", lambda texts: [self.client.embed_query(texts[0])])
+        return vectors[0]
+
     def embed_documents(self, documents):
         """
         Retrieve embeddings for multiple documents.
@@ -41,11 +84,61 @@ class EmbeddingClient:
         :return: A list of embeddings for the given documents.
         """
         try:
-            return self.client.embed_documents(documents)
+            return self._embed_with_cache(documents, "document", self.engine.embed)
         except AttributeError:
             print("Method embed_documents not defined for the client.")
             return None
-        
+
+    def _embed_with_cache(self, texts, kind, embed_function):
+        """
+        Embeds the given texts, sending only the cache misses to `embed_function`.
+
+        :param texts: A list of texts to embed.
+        :param kind: "query" or "document".
+        :param embed_function: A function embedding a list of texts with the backend.
+        :return: The list of vectors, in the order of `texts`.
+        """
+        if self.cache is None:
+            with tracer.span("embed", kind=kind, texts=len(texts)):
+                return embed_function(texts)
+
+        keys = [EmbeddingCache.make_key(self.model_name, kind, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embedding each missing text once, even if it appears several times in the list
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        hits = sum(1 for key in keys if key in cached)
+        self.cache_hits += hits
+        self.cache_misses += len(texts) - hits
+        tracer.count("embedding_cache.hits", hits)
+        tracer.count("embedding_cache.misses", len(texts) - hits)
+
+        if missing:
+            with tracer.span("embed", kind=kind, texts=len(missing)):
+                vectors = embed_function(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def cache_stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the embedding cache.
+
+        :return: A dictionary with the number of hits, misses and the hit rate.
+        """
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / total if total else 0.0,
+        }
+
 """
 End of EmbeddingClient class implementation
 """
@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions as google_exceptions
+from Tracing import tracer
+
+# Errors returned by Vertex AI when the quota or the service capacity is exceeded
+THROTTLING_ERRORS = (
+    google_exceptions.ResourceExhausted,   # 429
+    google_exceptions.TooManyRequests,     # 429
+    google_exceptions.ServiceUnavailable,  # 503
+)
+
+
+def is_throttling_error(error) -> bool:
+    """
+    Checks whether an error means the request was throttled and can be retried later.
+
+    :param error: The exception raised by the embedding backend.
+    :return: True if the request should be retried after a backoff.
+    """
+    return isinstance(error, THROTTLING_ERRORS) or getattr(error, "code", None) == 429
+
+
+class TokenBucket:
+    """
+    This class implements a thread-safe token bucket rate limiter.
+
+    Parameters:
+    - rate: The number of tokens added per second.
+    - capacity: The maximum number of tokens in the bucket, i.e. the largest burst allowed.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until `tokens` tokens are available, then consumes them.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingEngine:
+    """
+    This class embeds large lists of texts in batches, with a bounded number of concurrent requests.
+
+    Functionalities:
+    - Splits the texts into batches of `batch_size` and sends up to `max_concurrency` batches at a time.
+    - Limits the request rate with a token bucket when `requests_per_minute` is set.
+    - Retries throttled requests (HTTP 429/503) with exponential backoff and full jitter.
+    - Returns the vectors in the order of the input texts.
+
+    Parameters:
+    - embed_function: A function embedding a list of texts, such as `VertexAIEmbeddings.embed_documents`.
+    - batch_size: The number of texts sent in each request.
+    - max_concurrency: The maximum number of requests in flight.
+    - requests_per_minute: The maximum request rate, or None for no limit.
+    - max_retries: The number of retries of a throttled request before giving up.
+    - initial_backoff: The upper bound of the first backoff delay, in seconds.
+    - max_backoff: The upper bound of any backoff delay, in seconds.
+    """
+
+    def __init__(self, embed_function, batch_size=32, max_concurrency=4, requests_per_minute=None,
+                 max_retries=5, initial_backoff=1.0, max_backoff=32.0):
+        self.embed_function = embed_function
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0) if requests_per_minute else None
+
+        # Counters, updated from the worker threads
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def embed(self, texts) -> list:
+        """
+        Embeds the given texts.
+
+        :param texts: A list of texts to embed.
+        :return: The list of vectors, in the order of `texts`.
+        """
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            # executor.map returns the results in the order of the batches
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                results = list(executor.map(self._embed_batch, batches))
+
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def _embed_batch(self, batch):
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            with self.lock:
+                self.requests += 1
+            try:
+                return self.embed_function(batch)
+            except Exception as e:
+                if not is_throttling_error(e) or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    self.throttled += 1
+                tracer.count("embedding.retries")
+                # Full jitter keeps the retries of concurrent batches from hitting the quota at the same time
+                time.sleep(random.uniform(0, min(self.max_backoff, self.initial_backoff * 2 ** attempt)))
+
+    def stats(self) -> dict:
+        """
+        Returns the number of requests sent and of requests that were throttled.
+        """
+        with self.lock:
+            return {"requests": self.requests, "throttled": self.throttled}
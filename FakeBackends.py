@@ -0,0 +1,193 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from pydantic import PrivateAttr
+from google.api_core import exceptions as google_exceptions
+
+"""
+Local stand-ins for the Vertex AI backends, selected with backend="fake" (EmbeddingClient) or llm_backend="fake"
+(QuizGenerator), and used by Benchmark.py to measure the pipeline without calling Google Cloud.
+"""
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    This class implements a deterministic fake embedding model.
+
+    Functionalities:
+    - Returns the same unit vector for the same text on every call: a hashed bag of words, so texts
+      sharing words are close to each other.
+    - Simulates the latency of a network call, throttling errors (HTTP 429) and unavailability errors (HTTP 503)
+      at given rates.
+
+    Parameters:
+    - dimensions: The size of the vectors.
+    - latency: The simulated duration of each call, in seconds.
+    - throttle_rate: The probability that a call fails with ResourceExhausted.
+    - error_rate: The probability that a call fails with ServiceUnavailable.
+    - seed: The seed of the random generator deciding which calls fail.
+    """
+
+    def __init__(self, dimensions=768, latency=0.0, throttle_rate=0.0, error_rate=0.0, seed=0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text):
+        # Hashing each word into one of the dimensions, so texts sharing words get similar vectors
+        values = [0.0] * self.dimensions
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.sha256(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            values[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(value * value for value in values) ** 0.5
+        if not norm:
+            values[0], norm = 1.0, 1.0
+        return [value / norm for value in values]
+
+    def _call(self, texts):
+        with self.lock:
+            self.calls += 1
+            throttled = self.random.random() < self.throttle_rate
+            failed = self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            raise google_exceptions.ResourceExhausted("Quota exceeded (simulated)")
+        if failed:
+            raise google_exceptions.ServiceUnavailable("Service unavailable (simulated)")
+        with self.lock:
+            self.texts_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts):
+        return self._call(list(texts))
+
+    def embed_query(self, text):
+        return self._call([text])[0]
+
+
+def estimate_tokens(text) -> int:
+    """
+    Estimates the number of tokens of a text, at about 4 characters per token.
+    """
+    return max(1, len(text) // 4)
+
+
+# Words of the repr of the context Documents, which are not part of their content
+DOCUMENT_REPR_WORDS = {"Document", "metadata", "source", "page", "page_content", "content"}
+
+
+class FakeLLM(LLM):
+    """
+    This class implements a fake LLM that answers the QuizGenerator prompts with well-formed quiz questions.
+
+    Functionalities:
+    - Builds questions from the words of the context found in the prompt; answers with a list of questions
+      when the prompt asks for a quiz of N questions (batch mode).
+    - Simulates latency (a fixed part plus a part per output token), errors, and duplicate questions.
+    - Counts the calls and the (estimated) prompt and completion tokens.
+
+    Parameters:
+    - latency: The fixed duration of each call, in seconds.
+    - token_latency: The additional duration per output token, in seconds.
+    - error_rate: The probability that a call fails with ResourceExhausted.
+    - duplicate_rate: The probability that a question is picked from a small set of recurring questions.
+    - malformed_rate: The probability that an output has a defect: code fences and trailing text, choices as a
+                      dictionary, the answer given as text, a missing explanation, truncated JSON, or no JSON at all.
+    - focus: When set, questions only use the first `focus` distinct words of the context, so the same context
+             tends to produce the same questions, like a real model at a moderate temperature.
+    - seed: The seed of the random generator.
+    """
+    latency: float = 0.0
+    token_latency: float = 0.0
+    error_rate: float = 0.0
+    duplicate_rate: float = 0.0
+    malformed_rate: float = 0.0
+    focus: int = 0
+    seed: int = 0
+
+    _random: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _stats: dict = PrivateAttr(default_factory=lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _question(self, words, rng):
+        if rng.random() < self.duplicate_rate:
+            words = ["recurring", "fact", str(rng.randrange(3))]
+        picked = [rng.choice(words) for _ in range(4)] if words else ["nothing"] * 4
+        return {
+            "question": f"Which term is described together with {picked[0]} and {picked[1]}?",
+            "choices": [{"key": key, "value": value} for key, value in zip("ABCD", picked)],
+            "answer": "A",
+            "explanation": f"The context describes {picked[0]} together with {picked[1]}.",
+        }
+
+    def _malform_question(self, question, rng):
+        defect = rng.choice(("choices_dict", "answer_text", "no_explanation"))
+        if defect == "choices_dict":
+            question["choices"] = {choice["key"]: choice["value"] for choice in question["choices"]}
+        elif defect == "answer_text":
+            question["answer"] = question["choices"][0]["value"]
+        else:
+            del question["explanation"]
+        return question
+
+    def _malform_text(self, output, rng):
+        defect = rng.choice(("fences", "truncated", "no_json"))
+        if defect == "fences":
+            return f"```json\n{output}\n```\nLet me know if you need more questions!"
+        if defect == "truncated":
+            return output[:int(len(output) * 0.9)]
+        return "I am sorry, I cannot create a question from this context."
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        with self._lock:
+            if self._random is None:
+                self._random = random.Random(self.seed)
+            rng = random.Random(self._random.random())
+            failed = self._random.random() < self.error_rate
+
+        context = prompt.rsplit("Context:", 1)[-1]
+        words = [word for word in re.findall(r"[a-zA-Z]{4,}", context) if word not in DOCUMENT_REPR_WORDS]
+        if self.focus:
+            words = list(dict.fromkeys(words))[:self.focus]
+        batch = re.search(r"create a quiz of (\d+) questions", prompt)
+        count = int(batch.group(1)) if batch else 1
+        questions = [self._question(words, rng) for _ in range(count)]
+        malformed = rng.random() < self.malformed_rate
+        if malformed and rng.random() < 0.5:
+            questions = [self._malform_question(question, rng) for question in questions]
+            malformed = False
+        output = json.dumps({"questions": questions} if batch else questions[0])
+        if malformed:
+            output = self._malform_text(output, rng)
+
+        time.sleep(self.latency + self.token_latency * estimate_tokens(output))
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["prompt_tokens"] += estimate_tokens(prompt)
+            if not failed:
+                self._stats["completion_tokens"] += estimate_tokens(output)
+        if failed:
+            raise google_exceptions.ResourceExhausted("Quota exceeded (simulated)")
+        return output
@@ -0,0 +1,54 @@
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+
+class HybridRetriever(BaseRetriever):
+    """
+    This class retrieves the context of a question from both the vectorstore and the LexicalIndex,
+    so chunks naming the exact terms of the topic are found even when their embedding ranks them lower.
+
+    Functionalities:
+    - Runs the vector similarity search and the BM25 search for the query, `fetch_k` chunks each.
+    - Fuses the two rankings with Reciprocal Rank Fusion: each chunk scores 1 / (rrf_k + rank) in every ranking
+      it appears in, so no score normalization is needed between BM25 and cosine similarity.
+    - A LangChain retriever: it replaces `vectorstore.as_retriever()` in the chains of the QuizGenerator.
+
+    Parameters:
+    - vectorstore: The vectorstore (e.g. the Chroma collection).
+    - lexical_index: The LexicalIndex of the same chunks.
+    - k: The number of chunks returned.
+    - fetch_k: The number of chunks taken from each ranking.
+    - rrf_k: The rank constant of the fusion; larger values flatten the weight of the top ranks.
+    """
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    @staticmethod
+    def key(document) -> tuple:
+        # The vectorstores do not all return the ids of the chunks, so the chunks are matched on source and content
+        return document.metadata.get("source", ""), document.page_content
+
+    def fuse(self, *rankings) -> list:
+        """
+        Merges rankings of chunks with Reciprocal Rank Fusion.
+
+        :param rankings: Lists of Documents, best first.
+        :return: The k best Documents of the fused ranking.
+        """
+        scores = {}
+        documents = {}
+        for ranking in rankings:
+            for rank, document in enumerate(ranking, start=1):
+                key = self.key(document)
+                documents.setdefault(key, document)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank)
+        best = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [documents[key] for key in best]
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> list:
+        vector_ranking = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        lexical_ranking = [document for document, _ in self.lexical_index.search(query, k=self.fetch_k)]
+        return self.fuse(vector_ranking, lexical_ranking)
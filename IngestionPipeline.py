@@ -0,0 +1,305 @@
+import queue
+import threading
+import time
+from LexicalIndex import LexicalIndex
+from Tracing import tracer
+
+# Marks the end of the items of a queue
+DONE = object()
+
+class StageStats:
+    """
+    The progress counters of one stage of the IngestionPipeline.
+
+    Parameters:
+    - name: The name of the stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.items = 0              # pages, chunks or vectors handled
+        self.busy_seconds = 0.0     # time spent doing the work of the stage
+        self.blocked_seconds = 0.0  # time spent waiting for room in the next queue (backpressure)
+        self.started_at = None
+        self.finished_at = None
+
+    def record(self, items, seconds):
+        with self.lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def snapshot(self) -> dict:
+        """
+        Returns the counters of the stage, with its throughput in items per second of work.
+        """
+        with self.lock:
+            end = self.finished_at or time.perf_counter()
+            return {
+                "items": self.items,
+                "busy_seconds": self.busy_seconds,
+                "blocked_seconds": self.blocked_seconds,
+                "elapsed_seconds": end - self.started_at if self.started_at else 0.0,
+                "items_per_sec": self.items / self.busy_seconds if self.busy_seconds else 0.0,
+                "done": self.finished_at is not None,
+            }
+
+
+class IngestionPipeline:
+    """
+    This class indexes uploaded PDF files as a stream: pages are split, embedded and written to the collection
+    while the next pages are still being parsed, so the CPU-bound parsing overlaps the network-bound embedding.
+
+    Functionalities:
+    - Four stages, each in its own thread (several threads for the embedding): parse (DocumentProcessor.stream_documents),
+      split (ChromaCollectionCreator.split_pages), embed (the EmbeddingClient, only for chunks not indexed yet)
+      and index (writes the vectors to the collection and, with `build_lexical_index`, the chunks to the LexicalIndex).
+    - Bounded queues between the stages: a stage waits when the next one falls behind (backpressure), so at most
+      `queue_size` pages or batches are in flight between two stages. The pages are not kept once split, and the
+      chunks not once indexed, except in the LexicalIndex: without it, the memory used does not grow with the size
+      of the upload, besides the IDs of the chunks.
+    - Progress and throughput of each stage (`progress`), also reported to `on_progress` after each indexed batch.
+    - The first error of a stage stops the pipeline and is raised by `run`. Files that fail to parse are recorded
+      in the DocumentProcessor's `errors` and skipped, as with `process_files`: the chunks of a file failing halfway,
+      already indexed, are deleted at the end.
+    - At the end, the ChromaCollectionCreator is in the same state as after `create_chroma_collection`, which then
+      returns at once for the same documents.
+
+    Parameters:
+    - chroma_creator: The ChromaCollectionCreator of the collection, with the DocumentProcessor receiving the pages.
+    - queue_size: The capacity of each queue between two stages.
+    - batch_size: The number of chunks embedded and written at a time.
+    - embed_workers: The number of threads sending batches to the embedding model.
+    - build_lexical_index: Whether to build the LexicalIndex of the chunks, needed by the hybrid retrieval and
+      the `chunks` of the ChromaCollectionCreator; it holds every chunk in memory.
+    - on_progress: An optional function called with the `progress` dictionary after each indexed batch.
+    """
+
+    STAGES = ("parse", "split", "embed", "index")
+
+    def __init__(self, chroma_creator, queue_size=8, batch_size=64, embed_workers=2, build_lexical_index=True,
+                 on_progress=None):
+        if chroma_creator.lazy:
+            raise ValueError("The ingestion pipeline embeds every chunk; use create_chroma_collection for a lazy collection.")
+        self.chroma_creator = chroma_creator
+        self.processor = chroma_creator.processor
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.build_lexical_index = build_lexical_index
+        self.on_progress = on_progress
+        self.stats = {}
+        self.queues = {}
+        self.stopped = threading.Event()
+        self.error = None
+        self.page_counts = {}   # source -> number of its pages parsed
+        self.chunks_added = 0
+        self.chunk_ids = {}     # source -> IDs of its chunks, to prune the collection and to discard a file failing halfway
+        self.added_ids = set()  # IDs of the chunks added to the collection by this run
+
+    def progress(self) -> dict:
+        """
+        Returns the counters of each stage (see StageStats.snapshot) and the number of items waiting in each queue.
+        """
+        return {name: {**stats.snapshot(), "queued": self.queues[name].qsize() if name in self.queues else 0}
+                for name, stats in self.stats.items()}
+
+    def _put(self, name, item, stats):
+        # Waiting for room in the queue, unless the pipeline is stopped by an error
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                self.queues[name].put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        with stats.lock:
+            stats.blocked_seconds += time.perf_counter() - start
+
+    def _get(self, name):
+        while not self.stopped.is_set():
+            try:
+                return self.queues[name].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def _stage(self, name, work):
+        # Runs the work of a stage, recording its first error and stopping the other stages
+        stats = self.stats[name]
+        with stats.lock:
+            if stats.started_at is None:
+                stats.started_at = time.perf_counter()
+        try:
+            work(stats)
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+            self.stopped.set()
+
+    def _parse(self, uploaded_files, stats):
+        pages = iter(self.processor.stream_documents(uploaded_files))
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            page = next(pages, DONE)
+            if page is DONE:
+                break
+            # Only counted: the page is released once split
+            source = page.metadata["source"]
+            self.page_counts[source] = self.page_counts.get(source, 0) + 1
+            stats.record(1, time.perf_counter() - start)
+            self._put("split", page, stats)
+        self._put("split", DONE, stats)
+        stats.finished_at = time.perf_counter()
+
+    def _split(self, stats):
+        batch = []
+        while True:
+            page = self._get("split")
+            if page is not DONE:
+                start = time.perf_counter()
+                chunks = self.chroma_creator.split_pages([page])
+                batch.extend(chunks)
+                stats.record(len(chunks), time.perf_counter() - start)
+            # Batching the chunks, so each call to the embedding model sends full requests
+            while len(batch) >= self.batch_size or (page is DONE and batch):
+                self._put("embed", batch[:self.batch_size], stats)
+                batch = batch[self.batch_size:]
+            if page is DONE:
+                break
+        for _ in range(self.embed_workers):
+            self._put("embed", DONE, stats)
+        stats.finished_at = time.perf_counter()
+
+    def _embed(self, stats):
+        while True:
+            batch = self._get("embed")
+            if batch is DONE:
+                break
+            start = time.perf_counter()
+            # Only the chunks that are not indexed yet are embedded
+            chunks = self.chroma_creator.new_chunks(batch)
+            vectors = self.chroma_creator.embed_model.embed_documents([chunk.page_content for chunk in chunks.values()]) if chunks else []
+            stats.record(len(batch), time.perf_counter() - start)
+            self._put("index", (batch, chunks, vectors), stats)
+        self._put("index", DONE, stats)
+
+    def _index(self, stats, lexical_index):
+        remaining = self.embed_workers
+        while remaining:
+            item = self._get("index")
+            if item is DONE:
+                if self.stopped.is_set():
+                    break
+                remaining -= 1
+                continue
+            batch, chunks, vectors = item
+            start = time.perf_counter()
+            if chunks:
+                self.chroma_creator.add_embedded_documents(chunks, vectors)
+                # The same text in two batches embedded at the same time is written twice, but added once
+                self.chunks_added += len(chunks.keys() - self.added_ids)
+                self.added_ids.update(chunks)
+            for chunk in batch:
+                self.chunk_ids.setdefault(chunk.metadata["source"], set()).add(self.chroma_creator.chunk_id(chunk))
+            if lexical_index is not None:
+                lexical_index.add_documents(batch)
+            stats.record(len(batch), time.perf_counter() - start)
+            if self.on_progress:
+                self.on_progress(self.progress())
+        stats.finished_at = time.perf_counter()
+
+    def _discard_files(self, file_names):
+        # Forgets the pages and chunks of the given files, and deletes from the collection the chunks they added
+        for file_name in file_names:
+            self.page_counts.pop(file_name, None)
+        # A chunk is only deleted if this run added it and no other file has the same text
+        discarded = set().union(*(self.chunk_ids.pop(file_name, set()) for file_name in file_names))
+        ids = list((discarded & self.added_ids) - set().union(*self.chunk_ids.values()))
+        if ids:
+            self.chroma_creator.db.delete(ids=ids)
+            self.chunks_added -= len(ids)
+            self.added_ids.difference_update(ids)
+
+    def run(self, uploaded_files) -> dict:
+        """
+        Parses, splits, embeds and indexes the given files, all stages running at the same time.
+
+        :param uploaded_files: A list of uploaded files, each a binary file-like object with a `name`.
+        :return: The progress of each stage at the end (see `progress`), with the number of pages and chunks indexed,
+                 the sorted names of the files they come from, and the number of chunks added and removed.
+        :raises ValueError: If no page could be extracted from the files.
+        :raises: The first error raised by a stage.
+        """
+        with self.chroma_creator.lock:
+            return self.ingest(uploaded_files)
+
+    def ingest(self, uploaded_files) -> dict:
+        """
+        Runs the pipeline like `run`, for a caller already holding the lock of the ChromaCollectionCreator
+        (e.g. its `create_chroma_collection`).
+        """
+        self.queues = {name: queue.Queue(maxsize=self.queue_size) for name in ("split", "embed", "index")}
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        self.stopped.clear()
+        self.error = None
+        self.page_counts = {}
+        self.chunks_added = 0
+        self.chunk_ids = {}
+        self.added_ids = set()
+        num_errors = len(self.processor.errors)
+        lexical_index = LexicalIndex() if self.build_lexical_index else None
+
+        creator = self.chroma_creator
+        with tracer.span("ingest", files=len(uploaded_files)) as span:
+            creator.open_chroma_collection()
+            threads = [threading.Thread(target=self._stage, args=("parse", lambda stats: self._parse(uploaded_files, stats))),
+                       threading.Thread(target=self._stage, args=("split", self._split)),
+                       threading.Thread(target=self._stage, args=("index", lambda stats: self._index(stats, lexical_index)))]
+            threads += [threading.Thread(target=self._stage, args=("embed", self._embed)) for _ in range(self.embed_workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.stats["embed"].finished_at = time.perf_counter()
+            if self.error is not None:
+                span.set_attribute("error", str(self.error))
+                raise self.error
+
+            # The pages of a file failing halfway went through the stages: its chunks are taken out again
+            failed = self.processor.failed_files(since=num_errors)
+            if failed:
+                self._discard_files(failed)
+                if lexical_index is not None:
+                    lexical_index = LexicalIndex([chunk for chunk in lexical_index.documents
+                                                  if chunk.metadata["source"] not in failed])
+            if not self.page_counts:
+                errors = self.processor.errors
+                raise ValueError(f"Failed to parse the documents: {errors[0][1]}" if errors else "No documents found!")
+
+            # Dropping the chunks of the documents that were removed from the upload, as create_chroma_collection does
+            current_ids = set().union(*self.chunk_ids.values())
+            num_removed = 0
+            if creator.prune_removed:
+                num_removed = creator.prune_chunks(current_ids)
+            num_chunks = len(current_ids)
+            creator.chunks = lexical_index.documents if lexical_index is not None else []
+            creator.lexical_index = lexical_index
+            creator.embedded_topics = {}
+            creator.indexed_fingerprint = self.processor.corpus_fingerprint()
+            creator.status = (f"Successfully updated Chroma Collection! ({num_chunks} chunks, "
+                              f"{self.chunks_added} new chunks embedded, {num_removed} removed)")
+            if self.processor.errors:
+                creator.status += f" Could not parse: {', '.join(name for name, _ in self.processor.errors)}"
+
+            result = self.progress()
+            for name, stage in result.items():
+                span.set_attribute(f"{name}.items_per_sec", stage["items_per_sec"])
+                tracer.count(f"ingest.{name}.items", stage["items"])
+            span.set_attribute("chunks_added", self.chunks_added)
+        result["pages"] = sum(self.page_counts.values())
+        result["chunks"] = num_chunks
+        result["sources"] = sorted(self.page_counts)
+        result["chunks_added"] = self.chunks_added
+        result["chunks_removed"] = num_removed
+        return result
@@ -0,0 +1,149 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+class QueueFullError(RuntimeError):
+    """
+    Raised when a job is submitted while the queue of the FairScheduler is full.
+    """
+
+
+class FairScheduler:
+    """
+    This class runs the jobs of many sessions (e.g. the quizzes of the students connected to the app)
+    on a bounded pool of worker threads.
+
+    Functionalities:
+    - Bounded global queue: a submission is rejected with QueueFullError when `max_queued` jobs are already waiting,
+      or when the session already has `max_queued_per_session` jobs waiting, instead of piling up work.
+    - Fair scheduling: the workers take the next job of each session in turn (round robin), so a session that
+      submits many jobs does not delay the other sessions by more than one job each.
+    - Returns a Future per job; the jobs waiting for a session can be cancelled, e.g. when it ends.
+
+    Parameters:
+    - max_workers: The number of worker threads.
+    - max_queued: The maximum number of jobs waiting, over every session.
+    - max_queued_per_session: The maximum number of jobs waiting for one session, or None for no limit.
+    """
+
+    def __init__(self, max_workers=4, max_queued=64, max_queued_per_session=None):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_queued_per_session = max_queued_per_session
+        self.condition = threading.Condition()
+        self.queues = {}        # session id -> deque of (future, function, args, kwargs)
+        self.rotation = deque() # session ids with waiting jobs, in the order they are served
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.closed = False
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, session_id, function, *args, **kwargs) -> Future:
+        """
+        Queues a job of a session.
+
+        :param session_id: The session the job belongs to.
+        :param function: The function to run, with the given arguments.
+        :return: A Future of the result of the function.
+        """
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The scheduler is shut down.")
+            session_queue = self.queues.get(session_id)
+            if self.queued >= self.max_queued or (
+                    self.max_queued_per_session is not None and session_queue is not None
+                    and len(session_queue) >= self.max_queued_per_session):
+                self.rejected += 1
+                raise QueueFullError(f"Too many jobs waiting ({self.queued}), try again later.")
+            if session_queue is None:
+                session_queue = self.queues[session_id] = deque()
+                self.rotation.append(session_id)
+            session_queue.append((future, function, args, kwargs))
+            self.queued += 1
+            self.condition.notify()
+        return future
+
+    def _next_job(self):
+        # Taking the oldest job of the session at the head of the rotation, and moving the session to the back
+        session_id = self.rotation.popleft()
+        session_queue = self.queues[session_id]
+        job = session_queue.popleft()
+        if session_queue:
+            self.rotation.append(session_id)
+        else:
+            del self.queues[session_id]
+        self.queued -= 1
+        return job
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.rotation and not self.closed:
+                    self.condition.wait()
+                if not self.rotation:
+                    return
+                future, function, args, kwargs = self._next_job()
+                self.running += 1
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self.condition:
+                self.running -= 1
+                self.completed += 1
+
+    def cancel_session(self, session_id) -> int:
+        """
+        Cancels the jobs of a session that are still waiting; running jobs are not interrupted.
+
+        :return: The number of jobs cancelled.
+        """
+        with self.condition:
+            session_queue = self.queues.pop(session_id, None)
+            if session_queue is None:
+                return 0
+            self.rotation.remove(session_id)
+            self.queued -= len(session_queue)
+        for future, _, _, _ in session_queue:
+            future.cancel()
+        return len(session_queue)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of jobs waiting (in total and per session), running, completed and rejected.
+        """
+        with self.condition:
+            return {
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "sessions_waiting": {session_id: len(jobs) for session_id, jobs in self.queues.items()},
+            }
+
+    def shutdown(self, wait=True, cancel_jobs=False):
+        """
+        Stops the workers once the waiting jobs are done, or after cancelling them.
+
+        :param wait: Whether to wait for the workers to stop.
+        :param cancel_jobs: Whether to cancel the jobs still waiting.
+        """
+        if cancel_jobs:
+            with self.condition:
+                session_ids = list(self.queues)
+            for session_id in session_ids:
+                self.cancel_session(session_id)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation
+from Tracing import tracer
+
+# Set while the LLM calls of the current context must not be answered from the cache, see fresh_responses
+_fresh = ContextVar("llm_cache_fresh", default=False)
+
+@contextmanager
+def fresh_responses():
+    """
+    Makes the lookups of every LLMResponseCache miss inside the block, e.g. when a question is generated again because
+    the cached response was a duplicate: the same prompt would get the same response back. The new responses are
+    still stored, as samples of their prompt.
+    """
+    token = _fresh.set(True)
+    try:
+        yield
+    finally:
+        _fresh.reset(token)
+
+class LLMResponseCache(BaseCache):
+    """
+    This class implements a persistent cache of LLM responses, plugged into LangChain's LLM cache interface,
+    so it sits around the VertexAI call of the QuizGenerator chain (`VertexAI(cache=...)`).
+
+    Functionalities:
+    - Keys the responses by the LLM parameters given by LangChain (model name, temperature, output token limit...)
+      and the SHA-256 of the fully rendered prompt (topic, context and format instructions).
+    - Keeps up to `samples_per_prompt` different responses per key and returns one of them at random, so the same
+      handbook and topic do not always produce the exact same quiz. Until a key has all its samples, lookups miss.
+    - Expires responses after `ttl` seconds, and keeps at most `max_entries` responses, evicting the least recently used.
+    - Can be bypassed with the `bypass` flag, and skips responses rejected by the optional `is_cacheable` function.
+      Lookups also miss inside `fresh_responses()`, used by the QuizGenerator when it retries a question.
+
+    Parameters:
+    - cache_path: The path of the SQLite file where responses are stored.
+    - ttl: The lifetime of a response, in seconds.
+    - max_entries: The maximum number of responses kept.
+    - samples_per_prompt: The number of different responses kept per prompt.
+    - bypass: Whether to skip the cache entirely.
+    - is_cacheable: An optional function telling whether a response text is worth caching.
+    """
+
+    def __init__(self, cache_path="./llm_cache/responses.sqlite3", ttl=7 * 24 * 3600, max_entries=20_000,
+                 samples_per_prompt=3, bypass=False, is_cacheable=None):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.samples_per_prompt = samples_per_prompt
+        self.bypass = bypass
+        self.is_cacheable = is_cacheable
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by several processes like the EmbeddingCache, with the same busy timeout and write-ahead logging
+        self.connection = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT NOT NULL, sample INTEGER NOT NULL, generations TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (key, sample))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(prompt, llm_string) -> str:
+        """
+        Builds the cache key of a prompt.
+
+        :param prompt: The fully rendered prompt.
+        :param llm_string: The LLM parameters, as serialized by LangChain.
+        :return: The hex SHA-256 of the parameters and the prompt.
+        """
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        """
+        Returns a cached response for the prompt, or None if there is none (or not all samples yet).
+        """
+        if self.bypass or _fresh.get():
+            return None
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT sample, generations FROM responses WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchall()
+            if len(rows) < self.samples_per_prompt:
+                self.misses += 1
+                tracer.count("llm_cache.misses")
+                return None
+            sample, generations = random.choice(rows)
+            self.connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ? AND sample = ?", (now, key, sample))
+            self.connection.commit()
+            self.hits += 1
+        tracer.count("llm_cache.hits")
+        return [Generation(text=text) for text in json.loads(generations)]
+
+    def update(self, prompt, llm_string, return_val):
+        """
+        Stores a new response for the prompt, as one of its samples.
+        """
+        if self.bypass:
+            return
+        texts = [generation.text for generation in return_val]
+        if self.is_cacheable and not all(self.is_cacheable(text) for text in texts):
+            return
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            # Dropping the expired samples of this key, then filling the first free sample slot
+            self.connection.execute("DELETE FROM responses WHERE key = ? AND created_at <= ?", (key, now - self.ttl))
+            used = {row[0] for row in self.connection.execute("SELECT sample FROM responses WHERE key = ?", (key,))}
+            free = [sample for sample in range(self.samples_per_prompt) if sample not in used]
+            sample = free[0] if free else random.randrange(self.samples_per_prompt)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, sample, generations, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, sample, json.dumps(texts), now, now),
+            )
+            self._evict(now)
+            self.connection.commit()
+
+    def _evict(self, now):
+        self.connection.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+        count = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self, **kwargs):
+        """
+        Removes every response from the cache.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the cache.
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
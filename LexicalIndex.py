@@ -0,0 +1,105 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+# Words too common to tell the chunks apart
+STOP_WORDS = frozenset("""
+a an and are as at be but by can do does for from has have how in into is it its not of on or that the their
+them then there these they this to was were what when where which who why will with you your about
+""".split())
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+class LexicalIndex:
+    """
+    This class implements a BM25 ranking of the chunks over an in-memory inverted index. It needs no embedding
+    and is built locally in milliseconds, so it can pick the chunks relevant to a topic before any of them is embedded.
+
+    Functionalities:
+    - Inverted index: for each term, the chunks containing it and its frequency in each of them.
+    - BM25 search: only the chunks sharing a term with the query are scored.
+    - Used by the ChromaCollectionCreator in lazy mode, to embed the best candidates for the topic first,
+      and by the HybridRetriever, to fuse lexical and vector results.
+
+    Parameters:
+    - documents: The chunk Documents to index.
+    - k1: The BM25 term frequency saturation.
+    - b: The BM25 document length normalization.
+    """
+
+    def __init__(self, documents=(), k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self.lengths = []
+        self.postings = {}  # term -> list of (chunk position, term frequency)
+        self.total_length = 0
+        self.add_documents(documents)
+
+    @staticmethod
+    def tokenize(text) -> list:
+        """
+        Splits a text into lowercase terms, without the stop words and single characters.
+        """
+        return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOP_WORDS]
+
+    @staticmethod
+    def term_frequencies(text) -> Counter:
+        """
+        Counts the terms of a text, like `Counter(tokenize(text))`; the filter runs once per distinct word instead of once per word.
+        """
+        terms = Counter(TOKEN_PATTERN.findall(text.lower()))
+        for token in [token for token in terms if len(token) < 2 or token in STOP_WORDS]:
+            del terms[token]
+        return terms
+
+    def add_documents(self, documents):
+        """
+        Adds chunks to the index.
+
+        :param documents: A list of chunk Documents.
+        """
+        for document in documents:
+            position = len(self.documents)
+            terms = self.term_frequencies(document.page_content)
+            self.documents.append(document)
+            length = sum(terms.values())
+            self.lengths.append(length)
+            self.total_length += length
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((position, frequency))
+
+    def count(self) -> int:
+        """
+        Returns the number of chunks in the index.
+        """
+        return len(self.documents)
+
+    def search(self, query, k=10) -> list:
+        """
+        Ranks the chunks for a query with BM25.
+
+        :param query: The query string, e.g. the topic of the quiz.
+        :param k: The number of chunks returned, or None for every chunk sharing a term with the query.
+        :return: The list of (Document, score) of the best chunks, best first. Chunks without a query term are left out.
+        """
+        if not self.documents:
+            return []
+        num_documents = len(self.documents)
+        average_length = self.total_length / num_documents or 1.0
+        scores = {}
+        for term in set(self.tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / average_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        if k is None:
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        else:
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.documents[position], score) for position, score in best]
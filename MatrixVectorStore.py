@@ -0,0 +1,151 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+class MatrixVectorStore(VectorStore, ABC):
+    """
+    This class holds what the vectorstores searching a matrix of normalized embeddings with NumPy have in common
+    (NumpyVectorStore and QuantizedVectorStore): the chunks are `documents`, with their `ids`, and the row of
+    each id in `rows`.
+
+    Functionalities:
+    - LangChain VectorStore: `similarity_search` and its variants, `max_marginal_relevance_search`, relevance
+      scores and `as_retriever`, all built on `batch_similarity_search_by_vector` and `_mmr_candidates`.
+    - Batch queries: `batch_similarity_search` ranks the chunks for many queries at once.
+    - The `get` of the Chroma collection, by ids or by equality on metadata, built on `_snapshot` and `_embeddings_of`.
+
+    A subclass sets `embedding_function`, and implements the abstract methods `_snapshot`, `_embeddings_of`,
+    `batch_similarity_search_by_vector` and `_mmr_candidates`.
+    """
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def count(self) -> int:
+        """
+        Returns the number of chunks in the store.
+        """
+        return len(self.ids)
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def _top_k(scores, k):
+        """
+        Returns the indices of the k best scores along the last axis, best first.
+        k is clamped to the number of scores; k <= 0 gives an empty selection for each row.
+        """
+        k = min(int(k), scores.shape[-1])
+        if k <= 0:
+            return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+        # Partial selection of the k best scores, then sorting only those
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        order = np.take_along_axis(scores, top, axis=-1).argsort(axis=-1)[..., ::-1]
+        return np.take_along_axis(top, order, axis=-1)
+
+    @abstractmethod
+    def _snapshot(self):
+        """
+        Returns a consistent view of the store: its ids, documents, rows (id -> row) and stored vectors.
+        """
+
+    @abstractmethod
+    def _embeddings_of(self, vectors, rows):
+        """
+        Returns the embeddings of the given rows, from the stored vectors of a snapshot.
+        """
+
+    @abstractmethod
+    def _mmr_candidates(self, query, fetch_k):
+        """
+        Returns the `fetch_k` Documents most similar to the normalized query vector, with their embeddings.
+        """
+
+    @abstractmethod
+    def batch_similarity_search_by_vector(self, embeddings, k=4) -> list:
+        """
+        Ranks the chunks for several query vectors at once.
+
+        :param embeddings: A list of query vectors.
+        :param k: The number of chunks per query.
+        :return: For each query, the list of (Document, cosine similarity) of its k most similar chunks.
+        """
+
+    def get(self, ids=None, where=None, include=("metadatas", "documents")) -> dict:
+        """
+        Returns stored chunks in the format of Chroma's `get`, selected by ids and/or by equality on metadata.
+
+        :param ids: The ids to look up; None selects every chunk.
+        :param where: A dictionary of metadata values the chunks must have, e.g. {"source": "notes.pdf"}.
+        :param include: The fields returned besides the ids: "metadatas", "documents" and/or "embeddings".
+        """
+        chunk_ids, documents, positions, vectors = self._snapshot()
+        rows = range(len(chunk_ids)) if ids is None else [positions[i] for i in ids if i in positions]
+        if where:
+            rows = [row for row in rows
+                    if all(documents[row].metadata.get(key) == value for key, value in where.items())]
+        rows = list(rows)
+        result = {"ids": [chunk_ids[row] for row in rows]}
+        if "metadatas" in include:
+            result["metadatas"] = [documents[row].metadata for row in rows]
+        if "documents" in include:
+            result["documents"] = [documents[row].page_content for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = self._embeddings_of(vectors, rows)
+        return result
+
+    def batch_similarity_search(self, queries, k=4) -> list:
+        """
+        Returns the k most similar chunks of each query, ranked at once.
+
+        :param queries: A list of query strings.
+        :param k: The number of chunks per query.
+        :return: For each query, the list of its k most similar Documents.
+        """
+        embeddings = [self.embedding_function.embed_query(query) for query in queries]
+        return [[document for document, _ in results]
+                for results in self.batch_similarity_search_by_vector(embeddings, k=k)]
+
+    def similarity_search_by_vector_with_scores(self, embedding, k=4) -> list:
+        """
+        Returns the k chunks most similar to the given vector, with their cosine similarity.
+        """
+        return self.batch_similarity_search_by_vector([embedding], k=k)[0]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs) -> list:
+        return self.similarity_search_by_vector_with_scores(self.embedding_function.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs) -> list:
+        return [document for document, _ in self.similarity_search_by_vector_with_scores(embedding, k=k)]
+
+    def similarity_search(self, query, k=4, **kwargs) -> list:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k)
+
+    @staticmethod
+    def relevance_score(similarity) -> float:
+        """
+        Maps a cosine similarity from [-1, 1] to a relevance in [0, 1], as `similarity_search_with_relevance_scores` does.
+        """
+        return (similarity + 1.0) / 2.0
+
+    def _select_relevance_score_fn(self):
+        return self.relevance_score
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs) -> list:
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        documents, vectors = self._mmr_candidates(query, fetch_k)
+        if not documents:
+            return []
+        selected = maximal_marginal_relevance(query, vectors, lambda_mult=lambda_mult, k=k)
+        return [documents[i] for i in selected]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs) -> list:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding_function.embed_query(query), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
@@ -0,0 +1,136 @@
+import threading
+import uuid
+import numpy as np
+from langchain_core.documents import Document
+from MatrixVectorStore import MatrixVectorStore
+
+class NumpyVectorStore(MatrixVectorStore):
+    """
+    This class implements an in-process vectorstore: the normalized embeddings of the chunks are rows of one
+    contiguous NumPy matrix, searched with a single matrix product. For a handful of documents it avoids
+    the start-up, SQLite writes and serialization of Chroma, whose cost dwarfs the search itself.
+
+    Functionalities:
+    - LangChain VectorStore (see MatrixVectorStore), so the QuizGenerator and the ContextScheduler work unchanged.
+    - Batch queries: `batch_similarity_search` ranks the chunks for many queries with one matrix product.
+    - The subset of the Chroma collection API used by the ChromaCollectionCreator (`get` by ids or by source,
+      `delete`), so chunks are upserted and pruned the same way.
+    - Nothing is persisted: the store lives as long as the process.
+
+    Parameters:
+    - embedding_function: The embedding model (e.g. the EmbeddingClient).
+    - dtype: The NumPy type of the stored vectors.
+    """
+
+    def __init__(self, embedding_function, dtype=np.float32):
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self.lock = threading.Lock()
+        self.vectors = None  # (capacity, dimensions) matrix, the first `size` rows are used
+        self.size = 0
+        self.ids = []
+        self.documents = []
+        self.rows = {}       # id -> row
+
+    def _reserve(self, dimensions, count):
+        # Growing the matrix geometrically, so adding chunks in many small batches stays linear
+        if self.vectors is None:
+            self.vectors = np.empty((max(count, 64), dimensions), dtype=self.dtype)
+        elif self.size + count > self.vectors.shape[0]:
+            grown = np.empty((max(self.size + count, 2 * self.vectors.shape[0]), dimensions), dtype=self.dtype)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        """
+        Embeds and adds texts to the store; a text with the id of a stored chunk replaces it.
+
+        :return: The ids of the texts.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas, ids=ids)
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, *, ids=None):
+        """
+        Adds texts whose embeddings are already computed; a text with the id of a stored chunk replaces it.
+
+        :return: The ids of the texts.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        vectors = self._normalize(np.asarray(embeddings, dtype=self.dtype))
+
+        with self.lock:
+            self._reserve(vectors.shape[1], len(texts))
+            for text, metadata, chunk_id, vector in zip(texts, metadatas, ids, vectors):
+                document = Document(page_content=text, metadata=dict(metadata or {}), id=chunk_id)
+                row = self.rows.get(chunk_id)
+                if row is None:
+                    row = self.rows[chunk_id] = self.size
+                    self.size += 1
+                    self.ids.append(chunk_id)
+                    self.documents.append(document)
+                else:
+                    self.documents[row] = document
+                self.vectors[row] = vector
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        """
+        Removes the chunks with the given ids. The remaining rows are copied to a new matrix,
+        so searches running at the same time keep a consistent view of the old one.
+        """
+        if not ids:
+            return False
+        with self.lock:
+            removed = {self.rows[i] for i in ids if i in self.rows}
+            if not removed:
+                return False
+            keep = [row for row in range(self.size) if row not in removed]
+            self.vectors = self.vectors[keep]
+            self.ids = [self.ids[row] for row in keep]
+            self.documents = [self.documents[row] for row in keep]
+            self.size = len(keep)
+            self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        return True
+
+    def _snapshot(self):
+        with self.lock:
+            return list(self.ids), list(self.documents), dict(self.rows), self.vectors[:self.size] if self.size else None
+
+    def _embeddings_of(self, vectors, rows):
+        return vectors[rows].copy() if rows else np.empty((0, 0), dtype=self.dtype)
+
+    def _matrix(self):
+        # The matrix is only grown or compacted under the lock, so the search works on a consistent view
+        with self.lock:
+            if self.size == 0:
+                return None, []
+            return self.vectors[:self.size], list(self.documents)
+
+    def batch_similarity_search_by_vector(self, embeddings, k=4) -> list:
+        matrix, documents = self._matrix()
+        if matrix is None or len(embeddings) == 0:
+            return [[] for _ in embeddings]
+        queries = self._normalize(np.asarray(embeddings, dtype=self.dtype))
+        scores = queries @ matrix.T
+        top = self._top_k(scores, k)
+        return [[(documents[row], float(scores[i, row])) for row in rows] for i, rows in enumerate(top)]
+
+    def _mmr_candidates(self, query, fetch_k):
+        matrix, documents = self._matrix()
+        if matrix is None:
+            return [], None
+        candidates = self._top_k(matrix @ query.astype(self.dtype), fetch_k)
+        return [documents[row] for row in candidates], matrix[candidates]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -0,0 +1,314 @@
+import json
+import re
+import threading
+from pydantic import ValidationError
+from Tracing import tracer
+
+CHOICE_KEYS = "ABCDEFGH"
+
+# Other names the model sometimes uses for the fields of QuestionSchema
+FIELD_ALIASES = {
+    "question": ("question", "question_text", "prompt", "text", "q"),
+    "choices": ("choices", "options", "answers", "alternatives"),
+    "answer": ("answer", "correct_answer", "correct", "correct_choice", "answer_key", "solution"),
+    "explanation": ("explanation", "reason", "rationale", "justification", "explanations"),
+}
+
+
+class OutputRepairError(ValueError):
+    """
+    Raised when the output of the LLM cannot be turned into a valid question, even after repair.
+    """
+
+
+def _close_truncated(text):
+    """
+    Completes a JSON document that was cut off (e.g. by max_output_tokens), by dropping the open string with
+    its key or a dangling comma, and closing the open brackets. A field whose value was cut off is dropped
+    rather than kept with a partial value, so the validation sees it is missing.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    string_start = 0
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            string_start = position
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text = text[:string_start]
+    text = re.sub(r'(,\s*)?"[^"]*"\s*:\s*$', "", text.rstrip())
+    text = re.sub(r"[,:]\s*$", "", text.rstrip())
+    return text + "".join(reversed(stack))
+
+
+def iter_json_values(text):
+    """
+    Yields the JSON values that can be recovered from the text, tolerating code fences, text around the JSON,
+    trailing commas and smart quotes. Every "{" or "[" is tried as the start of a value, in order, so braces in the
+    text before the JSON do not hide it; complete values come first, then the values completed by closing a
+    truncated output.
+
+    :param text: The raw output of the LLM.
+    :return: A generator of tuples (value, repaired, truncated), where repaired tells whether the text needed a fix
+             and truncated whether the value was cut off and completed (its last fields may be missing).
+    """
+    try:
+        yield json.loads(text), False, False
+    except (TypeError, json.JSONDecodeError):
+        pass
+    if not isinstance(text, str):
+        return
+
+    cleaned = re.sub(r"```(?:json)?", "", text).replace("“", '"').replace("”", '"')
+    candidates = []
+    for match in re.finditer(r"[{\[]", cleaned):
+        candidate = cleaned[match.start():]
+        candidates.extend((candidate, re.sub(r",\s*([}\]])", r"\1", candidate)))
+
+    decoder = json.JSONDecoder()
+    for truncated in (False, True):
+        for candidate in candidates:
+            try:
+                # raw_decode stops at the end of the first value, ignoring any text after it
+                yield decoder.raw_decode(_close_truncated(candidate) if truncated else candidate)[0], True, truncated
+            except json.JSONDecodeError:
+                pass
+
+
+def parse_json(text):
+    """
+    Parses the first JSON value found in the text (see iter_json_values).
+
+    :param text: The raw output of the LLM.
+    :return: A tuple (value, repaired), where repaired tells whether the text needed a fix.
+    :raises OutputRepairError: If no JSON value can be recovered.
+    """
+    for value, repaired, _ in iter_json_values(text):
+        return value, repaired
+    raise OutputRepairError("No JSON value found in the output")
+
+
+def is_repairable(text) -> bool:
+    """
+    Tells whether a JSON value can be recovered from the output of the LLM, e.g. before caching the output.
+    """
+    try:
+        parse_json(text)
+    except OutputRepairError:
+        return False
+    return True
+
+
+def _get_field(data, field):
+    lowered = {str(key).lower(): value for key, value in data.items()}
+    for alias in FIELD_ALIASES[field]:
+        if alias in lowered:
+            return lowered[alias], alias != field
+    return None, False
+
+
+def _normalize_key(key):
+    # "a)", "(A)", " a. " -> "a"
+    return str(key).strip().strip("()[].:").strip().lower()
+
+
+def _choice_letter(value, choices, original_keys):
+    """
+    Turns the answer given by the model ("C", "c)", "Option C", 2, "Paris"...) into the key of a choice.
+    The choice values are matched first, so an answer like "A membrane" is not mistaken for the letter A,
+    then the keys the model gave the choices, before they were re-keyed A, B, C... in order.
+    """
+    keys = [choice["key"] for choice in choices]
+    text = str(value).strip()
+    for choice in choices:
+        if text.lower() == str(choice["value"]).strip().lower():
+            return choice["key"]
+    if _normalize_key(text) in original_keys:
+        return keys[original_keys.index(_normalize_key(text))]
+    match = re.fullmatch(r"(?:option|choice|answer)?\s*[\(\[]?([A-Ha-h])[\)\].:]?(?:\s.*)?", text, re.IGNORECASE)
+    if match and match.group(1).lower() in original_keys:
+        return keys[original_keys.index(match.group(1).lower())]
+    if match and match.group(1).upper() in keys:
+        return match.group(1).upper()
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < len(keys):
+        return keys[value]
+    return None
+
+
+def normalize_question(data):
+    """
+    Maps the fields of a question to QuestionSchema: renamed fields, choices given as a dictionary or as
+    plain strings, choice keys like "a)" or "1", and answers given as text instead of a key.
+
+    :param data: The decoded question.
+    :return: A tuple (question, repaired).
+    :raises OutputRepairError: If the question text, the choices or the answer cannot be recovered.
+    """
+    if not isinstance(data, dict):
+        raise OutputRepairError("The question is not a JSON object")
+    repaired = False
+
+    question, renamed = _get_field(data, "question")
+    repaired |= renamed
+    if not question or not isinstance(question, str):
+        raise OutputRepairError("The question text is missing")
+
+    raw_choices, renamed = _get_field(data, "choices")
+    repaired |= renamed
+    if isinstance(raw_choices, dict):
+        raw_choices = [{"key": key, "value": value} for key, value in raw_choices.items()]
+        repaired = True
+    if not isinstance(raw_choices, list) or len(raw_choices) < 2:
+        raise OutputRepairError("The choices are missing")
+
+    choices = []
+    original_keys = []
+    for position, choice in enumerate(raw_choices[:len(CHOICE_KEYS)]):
+        expected_key = CHOICE_KEYS[position]
+        if isinstance(choice, dict):
+            key = str(choice.get("key", choice.get("label", choice.get("letter", expected_key))))
+            value = choice.get("value", choice.get("text", choice.get("option", "")))
+        else:
+            key, value = expected_key, choice
+            match = re.match(r"\s*[\(\[]?([A-Ha-h])[\)\].:]\s+(.*)", str(choice))
+            if match:
+                key, value = match.groups()
+        # Choice keys are the letters A, B, C... in order
+        if key != expected_key:
+            repaired = True
+        original_keys.append(_normalize_key(key))
+        choices.append({"key": expected_key, "value": str(value)})
+
+    answer, renamed = _get_field(data, "answer")
+    repaired |= renamed
+    # The answer may use the original keys of the choices ("1", "a)", or letters given out of order)
+    letter = _choice_letter(answer, choices, original_keys) if answer is not None else None
+    if letter is None:
+        raise OutputRepairError("The answer does not match any choice")
+    repaired |= letter != answer
+
+    explanation, renamed = _get_field(data, "explanation")
+    repaired |= renamed
+    if not isinstance(explanation, str):
+        explanation = "" if explanation is None else str(explanation)
+        repaired = True
+
+    return {"question": question, "choices": choices, "answer": letter, "explanation": explanation}, repaired
+
+
+class QuestionRepairer:
+    """
+    This class turns the raw output of the LLM into validated question dictionaries, repairing common
+    defects locally instead of calling the LLM again.
+
+    Functionalities:
+    - Tolerant JSON parsing: code fences, text around the JSON (braces included), trailing commas, truncated
+      output; a question whose fields were cut off is rejected rather than repaired.
+    - Repair of the fields: renamed keys, choices as a dictionary or as strings, wrong choice keys,
+      answers given as text, missing explanation.
+    - Validation against the schema of the question.
+    - Counts the outputs that were parsed as is, repaired, or could not be recovered.
+
+    Parameters:
+    - schema: The pydantic model of a question (QuestionSchema).
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the counters.
+        """
+        with self.lock:
+            self.stats = {"clean": 0, "repaired": 0, "unrecoverable": 0}
+
+    def _count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+        tracer.count(f"output.{outcome}")
+
+    def _validate(self, data, truncated=False):
+        # A field missing from a truncated output was cut off: its question is incomplete, not repairable
+        if truncated and isinstance(data, dict):
+            for field in FIELD_ALIASES:
+                if _get_field(data, field)[0] is None:
+                    raise OutputRepairError(f"The output was cut off before the end of the {field}")
+        question, repaired = normalize_question(data)
+        try:
+            return self.schema.model_validate(question).model_dump(), repaired
+        except ValidationError as e:
+            raise OutputRepairError(str(e))
+
+    def parse(self, output) -> dict:
+        """
+        Parses the output of the LLM into a single question. The JSON values found in the output are tried
+        in order (see iter_json_values) and the first one that validates is returned.
+
+        :param output: The raw text returned by the LLM (or an already decoded dictionary).
+        :return: The validated question dictionary.
+        :raises OutputRepairError: If the output cannot be repaired; the question has to be generated again.
+        """
+        values = [(output, False, False)] if isinstance(output, dict) else iter_json_values(output)
+        error = OutputRepairError("No JSON value found in the output")
+        for data, repaired, truncated in values:
+            if isinstance(data, list) and data:
+                data, repaired = data[0], True
+            try:
+                question, fixed = self._validate(data, truncated)
+            except OutputRepairError as e:
+                error = e
+                continue
+            self._count("repaired" if repaired or fixed else "clean")
+            return question
+        self._count("unrecoverable")
+        raise error
+
+    def parse_batch(self, output) -> list:
+        """
+        Parses the output of the LLM into a list of questions (batch mode). Questions that cannot be
+        repaired are dropped, the others are kept. The JSON values found in the output are tried in order,
+        until one holds a valid question; in a truncated output, the question that was cut off is dropped.
+
+        :param output: The raw text returned by the LLM.
+        :return: The list of validated question dictionaries.
+        :raises OutputRepairError: If no question can be recovered from the output.
+        """
+        values = [(output, False, False)] if isinstance(output, (dict, list)) else iter_json_values(output)
+        for data, repaired, truncated in values:
+            if isinstance(data, dict):
+                items = data.get("questions")
+                if items is None:
+                    items, repaired = [data], True
+            else:
+                items, repaired = data, True
+
+            questions = []
+            num_dropped = 0
+            for item in items if isinstance(items, list) else []:
+                try:
+                    questions.append(self._validate(item, truncated))
+                except OutputRepairError:
+                    num_dropped += 1
+            if questions:
+                for _ in range(num_dropped):
+                    self._count("unrecoverable")
+                for question, fixed in questions:
+                    self._count("repaired" if repaired or fixed else "clean")
+                return [question for question, _ in questions]
+        self._count("unrecoverable")
+        raise OutputRepairError("No valid question in the output")
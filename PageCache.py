@@ -0,0 +1,225 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+class PageCache:
+    """
+    This class implements a persistent, content-addressed cache for the pages extracted from PDF documents.
+
+    Functionalities:
+    - Stores the extracted page Documents (and some metadata about the source file) on disk, keyed by the
+      SHA-256 of the uploaded bytes, so an unchanged file is never parsed twice, across Streamlit reruns or restarts.
+    - Writes an entry one page at a time (`open_entry`), while the file is still being parsed.
+    - Keeps the total size of the cache under a cap by evicting the least recently used entries.
+
+    Parameters:
+    - cache_dir: The directory where cache entries are stored.
+    - max_bytes: The maximum total size of the cache entries on disk, in bytes.
+    """
+
+    def __init__(self, cache_dir="./page_cache", max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_bytes(data) -> str:
+        """
+        Computes the cache key for the given file content.
+
+        :param data: The raw bytes of the uploaded file.
+        :return: The hex SHA-256 digest of the content.
+        """
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_file(file) -> str:
+        """
+        Computes the cache key for a file-like object without copying its whole content into a new bytes object.
+
+        :param file: A binary file-like object (e.g. a Streamlit UploadedFile).
+        :return: The hex SHA-256 digest of the content.
+        """
+        # In-memory buffers can be hashed in place
+        if hasattr(file, "getbuffer"):
+            with file.getbuffer() as buffer:
+                return hashlib.sha256(buffer).hexdigest()
+
+        digest = hashlib.sha256()
+        file.seek(0)
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+        file.seek(0)
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """
+        Retrieves the cached pages for the given key.
+
+        :param key: The SHA-256 of the file content.
+        :return: The list of page Documents, or None if the file has not been cached.
+        """
+        path = self._entry_path(key)
+        try:
+            pages, _ = self._read_entry(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # A truncated or unreadable entry is treated as a miss and removed
+            self._remove(path)
+            return None
+
+        # Touching the entry so that the LRU eviction sees it as recently used, unless another process evicted it
+        # while it was being read
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        return pages
+
+    @staticmethod
+    def _read_entry(path):
+        # An entry is a sequence of pickled pages, ended by a dictionary with the metadata
+        pages = []
+        with open(path, 'rb') as f:
+            while True:
+                record = pickle.load(f)
+                if isinstance(record, dict):
+                    # Entries written before the pages were streamed hold every page in that dictionary
+                    return record.get("pages", pages), record["metadata"]
+                pages.append(record)
+
+    def get_metadata(self, key):
+        """
+        Retrieves the metadata stored alongside the cached pages for the given key.
+
+        :param key: The SHA-256 of the file content.
+        :return: A dictionary with the metadata, or None if the file has not been cached.
+        """
+        try:
+            return self._read_entry(self._entry_path(key))[1]
+        except Exception:
+            return None
+
+    def put(self, key, pages, metadata=None):
+        """
+        Stores the extracted pages for the given key and evicts old entries if the cache grew over its cap.
+
+        :param key: The SHA-256 of the file content.
+        :param pages: The list of page Documents extracted from the file.
+        :param metadata: An optional dictionary with information about the source file.
+        """
+        writer = self.open_entry(key, metadata)
+        try:
+            for page in pages:
+                writer.write(page)
+        except Exception:
+            writer.discard()
+            raise
+        writer.commit()
+
+    def open_entry(self, key, metadata=None):
+        """
+        Starts an entry written one page at a time, as the pages are extracted, so they are not held back in memory.
+
+        :param key: The SHA-256 of the file content.
+        :param metadata: An optional dictionary with information about the source file.
+        :return: A PageCacheWriter; the entry is only visible once the writer is committed.
+        """
+        return PageCacheWriter(self, key, metadata)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the total size of the cache is under `max_bytes`.
+        """
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        # Oldest entries first
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        for file_name in os.listdir(self.cache_dir):
+            self._remove(os.path.join(self.cache_dir, file_name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class PageCacheWriter:
+    """
+    This class writes the pages of a file to a PageCache entry as they are extracted.
+
+    The pages go to a temporary file, renamed to the entry by `commit`, so a concurrent reader never sees a partial
+    entry; `discard` drops the pages written so far, e.g. when the file fails to parse halfway.
+
+    Parameters:
+    - cache: The PageCache receiving the entry.
+    - key: The SHA-256 of the file content.
+    - metadata: An optional dictionary with information about the source file.
+    """
+
+    def __init__(self, cache, key, metadata=None):
+        self.cache = cache
+        self.key = key
+        self.metadata = metadata or {}
+        self.num_pages = 0
+        fd, self.temp_path = tempfile.mkstemp(dir=cache.cache_dir, suffix=".tmp")
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, page):
+        """
+        Appends a page to the entry.
+
+        :param page: A page Document.
+        """
+        pickle.dump(page, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.num_pages += 1
+
+    def commit(self):
+        """
+        Ends the entry with its metadata, makes it visible, and evicts old entries if the cache grew over its cap.
+        """
+        metadata = {**self.metadata, "num_pages": self.num_pages, "cached_at": time.time()}
+        try:
+            pickle.dump({"metadata": metadata}, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.close()
+            os.replace(self.temp_path, self.cache._entry_path(self.key))
+        except Exception:
+            self.discard()
+            raise
+        self.cache.evict()
+
+    def discard(self):
+        """
+        Drops the pages written so far; the cache is left as it was.
+        """
+        self.file.close()
+        self.cache._remove(self.temp_path)
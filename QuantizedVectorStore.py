@@ -0,0 +1,186 @@
+import json
+import os
+import numpy as np
+from langchain_core.documents import Document
+from MatrixVectorStore import MatrixVectorStore
+
+class QuantizedVectorStore(MatrixVectorStore):
+    """
+    This class implements a compact, read-only vectorstore over a directory of memory-mapped files, so the
+    embeddings of a large collection (e.g. a whole department's course material) cost little RAM per process.
+
+    Functionalities:
+    - The normalized embeddings are stored as float16 (half the size of float32) or int8 with a scale per row
+      (a quarter of the size), in `.npy` files opened with `mmap_mode="r"`: the operating system loads the pages
+      on demand, and processes opening the same directory share them in the page cache.
+    - Searches run on the quantized data, block by block, without converting the whole matrix at once.
+    - Optional re-ranking: the best `rerank_factor * k` candidates are scored again with the full-precision vectors
+      (kept in a separate memory-mapped file, of which only the candidate rows are read).
+    - LangChain VectorStore and the `get` of Chroma (see MatrixVectorStore), so the QuizGenerator works unchanged.
+      The store is built once with `write` or `from_store`.
+
+    Files of the directory: meta.json, vectors.npy, scales.npy (int8), full.npy (if kept) and documents.jsonl.
+
+    Parameters:
+    - path: The directory of the store.
+    - embedding_function: The embedding model used to embed the queries.
+    - rerank: Whether to re-rank the candidates with the full-precision vectors.
+    - rerank_factor: The number of candidates re-ranked per result.
+    - block_rows: The number of rows scored at a time.
+    """
+
+    QUANTIZATIONS = ("float16", "int8")
+
+    def __init__(self, path, embedding_function=None, rerank=False, rerank_factor=4, block_rows=1024):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.rerank_factor = rerank_factor
+        self.block_rows = block_rows
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.quantization = self.meta["quantization"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.quantization == "int8" else None
+        full_path = os.path.join(path, "full.npy")
+        self.full = np.load(full_path, mmap_mode="r") if os.path.exists(full_path) else None
+        if rerank and self.full is None:
+            raise ValueError("The store was written without its full-precision vectors, it cannot re-rank.")
+        self.rerank = rerank
+
+        self.ids = []
+        self.documents = []
+        with open(os.path.join(path, "documents.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.documents.append(Document(page_content=record["text"], metadata=record["metadata"], id=record["id"]))
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+    @classmethod
+    def write(cls, path, ids, texts, metadatas, vectors, quantization="int8", keep_full_precision=True) -> str:
+        """
+        Writes a store to a directory.
+
+        :param path: The directory to write, created if needed; its files are replaced.
+        :param ids: The ids of the chunks.
+        :param texts: The texts of the chunks.
+        :param metadatas: The metadata dictionaries of the chunks.
+        :param vectors: The embeddings of the chunks, one row per chunk.
+        :param quantization: "float16" or "int8".
+        :param keep_full_precision: Whether to also write the float32 vectors, needed for re-ranking.
+        :return: The path of the directory.
+        """
+        if quantization not in cls.QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}. Expected one of {', '.join(cls.QUANTIZATIONS)}.")
+        os.makedirs(path, exist_ok=True)
+        vectors = cls._normalize(np.asarray(vectors, dtype=np.float32))
+
+        if quantization == "int8":
+            # Symmetric quantization per row: the largest component of each vector maps to 127
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            np.save(os.path.join(path, "vectors.npy"), np.round(vectors / scales[:, None]).astype(np.int8))
+            np.save(os.path.join(path, "scales.npy"), scales.astype(np.float32))
+        else:
+            np.save(os.path.join(path, "vectors.npy"), vectors.astype(np.float16))
+        full_path = os.path.join(path, "full.npy")
+        if keep_full_precision:
+            np.save(full_path, vectors)
+        elif os.path.exists(full_path):
+            os.remove(full_path)
+
+        with open(os.path.join(path, "documents.jsonl"), "w", encoding="utf-8") as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}) + "\n")
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"quantization": quantization, "count": len(vectors),
+                       "dimensions": int(vectors.shape[1]) if len(vectors) else 0}, f)
+        return path
+
+    @classmethod
+    def from_store(cls, store, path, quantization="int8", keep_full_precision=True, embedding_function=None, **kwargs):
+        """
+        Writes the chunks and embeddings of another vectorstore (a Chroma collection or a NumpyVectorStore)
+        to a quantized store, and opens it.
+        """
+        data = store.get(include=["embeddings", "documents", "metadatas"])
+        cls.write(path, data["ids"], data["documents"], data["metadatas"], data["embeddings"],
+                  quantization=quantization, keep_full_precision=keep_full_precision)
+        return cls(path, embedding_function or getattr(store, "embeddings", None), **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, path=None, quantization="int8", **kwargs):
+        if path is None:
+            raise ValueError("A QuantizedVectorStore needs the path of its directory.")
+        texts = list(texts)
+        cls.write(path, ids or [str(i) for i in range(len(texts))], texts, metadatas or [{} for _ in texts],
+                  embedding.embed_documents(texts), quantization=quantization)
+        return cls(path, embedding, **kwargs)
+
+    def nbytes(self) -> dict:
+        """
+        Returns the size in bytes of the searched data (quantized vectors and scales) and of the full-precision vectors.
+        """
+        searched = self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        return {"searched": searched, "full_precision": self.full.nbytes if self.full is not None else 0}
+
+    def _dequantize(self, rows):
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= np.asarray(self.scales[rows])[:, None]
+        return vectors
+
+    def _scores(self, queries):
+        # Scoring the rows block by block: each block is converted to float32 in the same small buffer, which
+        # stays in the CPU cache, so the whole matrix is never converted at once
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        buffer = np.empty((min(self.block_rows, len(self.ids)), self.vectors.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.ids), self.block_rows):
+            stop = min(start + self.block_rows, len(self.ids))
+            block = buffer[:stop - start]
+            np.copyto(block, self.vectors[start:stop], casting="unsafe")
+            scores[:, start:stop] = queries @ block.T
+            if self.scales is not None:
+                scores[:, start:stop] *= self.scales[start:stop]
+        return scores
+
+    def _snapshot(self):
+        # The store is read-only, so it is its own consistent view
+        return self.ids, self.documents, self.rows, self.vectors
+
+    def _embeddings_of(self, vectors, rows):
+        return self._dequantize(rows)
+
+    def batch_similarity_search_by_vector(self, embeddings, k=4, rerank=None) -> list:
+        """
+        Ranks the chunks for several query vectors at once.
+
+        :param embeddings: A list of query vectors.
+        :param k: The number of chunks per query.
+        :param rerank: Whether to re-rank with the full-precision vectors; defaults to the setting of the store.
+        :return: For each query, the list of (Document, cosine similarity) of its k most similar chunks.
+        """
+        if not self.ids or len(embeddings) == 0:
+            return [[] for _ in embeddings]
+        rerank = self.rerank if rerank is None else rerank
+        queries = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        scores = self._scores(queries)
+        if not rerank:
+            top = self._top_k(scores, k)
+            return [[(self.documents[row], float(scores[i, row])) for row in rows] for i, rows in enumerate(top)]
+
+        results = []
+        for query, candidates in zip(queries, self._top_k(scores, k * self.rerank_factor)):
+            # Reading the full-precision rows of the candidates only, in file order
+            candidates = np.sort(candidates)
+            exact = np.asarray(self.full[candidates]) @ query
+            best = np.argsort(-exact)[:k]
+            results.append([(self.documents[candidates[i]], float(exact[i])) for i in best])
+        return results
+
+    def _mmr_candidates(self, query, fetch_k):
+        if not self.ids:
+            return [], None
+        candidates = np.sort(self._top_k(self._scores(query[None, :])[0], fetch_k))
+        vectors = np.asarray(self.full[candidates]) if self.full is not None else self._dequantize(candidates)
+        return [self.documents[row] for row in candidates], vectors
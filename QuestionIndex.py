@@ -0,0 +1,161 @@
+import hashlib
+import json
+import re
+import threading
+
+# Words that carry no meaning on their own, ignored when comparing questions
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "from", "by", "with", "and", "or", "is", "are", "was",
+    "were", "be", "been", "does", "do", "did", "what", "which", "who", "whom", "whose", "when", "where", "why",
+    "how", "that", "this", "these", "those", "it", "its", "as", "following", "true", "correct", "best", "most",
+}
+
+# Mersenne prime used by the universal hash functions of the MinHash signatures
+PRIME = (1 << 61) - 1
+
+
+class QuestionIndex:
+    """
+    This class implements a near-duplicate index over quiz question texts.
+
+    Functionalities:
+    - Catches exact duplicates after normalization (case, punctuation, whitespace) with a hash lookup.
+    - Catches reworded duplicates with MinHash signatures over the meaningful words of the questions, and
+      Locality-Sensitive Hashing (LSH) buckets, so a lookup only compares the question to a few candidates
+      instead of scanning every question of the bank.
+    - Can be kept across quizzes on the same corpus, and saved to / loaded from a JSON file.
+
+    Parameters:
+    - threshold: The Jaccard similarity of the word sets above which two questions are duplicates.
+    - num_bands: The number of LSH bands.
+    - rows_per_band: The number of MinHash values per band; the signatures have num_bands * rows_per_band values.
+    """
+
+    def __init__(self, threshold=0.6, num_bands=21, rows_per_band=3):
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        num_perm = num_bands * rows_per_band
+
+        # Deterministic coefficients of the hash functions, so saved indexes stay valid
+        self.coefficients = []
+        for i in range(num_perm):
+            digest = hashlib.sha256(f"minhash-{i}".encode("utf-8")).digest()
+            self.coefficients.append((int.from_bytes(digest[:8], "little") % (PRIME - 1) + 1,
+                                      int.from_bytes(digest[8:16], "little") % PRIME))
+
+        self.questions = []      # Question texts, by id
+        self.word_sets = []      # Meaningful words of each question, by id
+        self.exact = {}          # Normalized text -> id
+        self.buckets = {}        # (band, band values) -> ids
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def normalize(text) -> str:
+        """
+        Lowercases the text and removes punctuation and repeated whitespace.
+        """
+        return " ".join(re.findall(r"\w+", text.lower()))
+
+    @staticmethod
+    def words(normalized) -> frozenset:
+        """
+        Returns the meaningful words of a normalized text, with a naive plural stripping.
+        """
+        words = {word[:-1] if len(word) > 3 and word.endswith("s") else word
+                 for word in normalized.split() if word not in STOPWORDS}
+        return frozenset(words or normalized.split())
+
+    def _signature(self, words):
+        hashes = [int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+                  for word in words]
+        if not hashes:
+            return [0] * len(self.coefficients)
+        return [min((a * h + b) % PRIME for h in hashes) for a, b in self.coefficients]
+
+    def _band_keys(self, signature):
+        r = self.rows_per_band
+        return [(band, tuple(signature[band * r:(band + 1) * r])) for band in range(self.num_bands)]
+
+    def find_duplicate(self, text):
+        """
+        Looks for a question of the index that is a duplicate or a near-duplicate of the given text.
+
+        :param text: The question text.
+        :return: The text of the matching question, or None if the question is new.
+        """
+        normalized = self.normalize(text)
+        words = self.words(normalized)
+        signature = self._signature(words)
+        with self.lock:
+            if normalized in self.exact:
+                return self.questions[self.exact[normalized]]
+
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self.buckets.get(key, ()))
+
+            # Confirming the candidates with the exact Jaccard similarity of the word sets
+            for question_id in candidates:
+                other = self.word_sets[question_id]
+                if len(words & other) / len(words | other) >= self.threshold:
+                    return self.questions[question_id]
+        return None
+
+    def add(self, text) -> int:
+        """
+        Adds a question to the index.
+
+        :param text: The question text.
+        :return: The id of the question in the index.
+        """
+        normalized = self.normalize(text)
+        words = self.words(normalized)
+        signature = self._signature(words)
+        with self.lock:
+            if normalized in self.exact:
+                return self.exact[normalized]
+            question_id = len(self.questions)
+            self.questions.append(text)
+            self.word_sets.append(words)
+            self.exact[normalized] = question_id
+            for key in self._band_keys(signature):
+                self.buckets.setdefault(key, []).append(question_id)
+        return question_id
+
+    def add_if_unique(self, text) -> bool:
+        """
+        Adds a question to the index unless it is a near-duplicate of a question already there.
+
+        :param text: The question text.
+        :return: True if the question was added, False if it is a duplicate.
+        """
+        with self.lock:
+            if self.find_duplicate(text) is not None:
+                return False
+            self.add(text)
+            return True
+
+    def __len__(self):
+        return len(self.questions)
+
+    def save(self, path):
+        """
+        Saves the questions of the index to a JSON file.
+        """
+        with self.lock:
+            data = {"threshold": self.threshold, "questions": list(self.questions)}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        Loads an index saved with `save`, rebuilding the signatures.
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(threshold=data.get("threshold", 0.6), **kwargs)
+        for text in data["questions"]:
+            index.add(text)
+        return index
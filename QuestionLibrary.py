@@ -0,0 +1,188 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+class QuestionLibrary:
+    """
+    This class implements a persistent library of generated quiz questions, shared by every session,
+    so users quizzing themselves on the same documents are served questions that were already generated.
+
+    Functionalities:
+    - Stores the questions by corpus fingerprint (see DocumentProcessor.corpus_fingerprint) and topic,
+      in a local SQLite file.
+    - Matches topics by the cosine similarity of their embeddings, so "cell membranes" also finds the questions
+      generated for "the cell membrane". Without an embedding model, only topics equal after normalization match.
+    - Serves the least served questions first, and counts how many times each question was served.
+
+    Parameters:
+    - embed_model: An optional embedding model (e.g. the EmbeddingClient) used to embed the topics.
+    - library_path: The path of the SQLite file where questions are stored.
+    - similarity_threshold: The cosine similarity above which two topics are considered the same.
+    """
+
+    def __init__(self, embed_model=None, library_path="./question_library/library.sqlite3", similarity_threshold=0.85):
+        self.embed_model = embed_model
+        self.library_path = library_path
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(library_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Several processes may write to the library (see EmbeddingCache)
+        self.connection = sqlite3.connect(library_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS topics (id INTEGER PRIMARY KEY, corpus TEXT NOT NULL, topic TEXT NOT NULL, "
+            "vector BLOB, UNIQUE (corpus, topic))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS questions (id INTEGER PRIMARY KEY, topic_id INTEGER NOT NULL, question TEXT NOT NULL, "
+            "served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS questions_topic ON questions (topic_id, served)")
+        self.connection.commit()
+
+    @staticmethod
+    def normalize_topic(topic) -> str:
+        """
+        Lowercases the topic and collapses its whitespace.
+        """
+        return " ".join(topic.lower().split())
+
+    @staticmethod
+    def _cosine(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    def _embed_topic(self, topic):
+        if self.embed_model is None:
+            return None
+        try:
+            return self.embed_model.embed_query(topic)
+        except Exception as e:
+            print(f"Could not embed the topic, matching it by name only: {e}")
+            return None
+
+    def find_topics(self, corpus, topic, vector=None) -> list:
+        """
+        Finds the topics of the library on the same corpus that match the given topic.
+
+        :param corpus: The corpus fingerprint.
+        :param topic: The topic of the quiz.
+        :param vector: The embedding of the topic, if already computed.
+        :return: The ids of the matching topics, the most similar first.
+        """
+        normalized = self.normalize_topic(topic)
+        if vector is None:
+            vector = self._embed_topic(normalized)
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, topic, vector FROM topics WHERE corpus = ?", (corpus,)).fetchall()
+
+        matches = []
+        for topic_id, other, blob in rows:
+            if other == normalized:
+                matches.append((1.0, topic_id))
+            elif vector is not None and blob is not None:
+                other_vector = array('d')
+                other_vector.frombytes(blob)
+                similarity = self._cosine(vector, other_vector)
+                if similarity >= self.similarity_threshold:
+                    matches.append((similarity, topic_id))
+        return [topic_id for _, topic_id in sorted(matches, reverse=True)]
+
+    def draw(self, corpus, topic, count, accept=None) -> list:
+        """
+        Serves up to `count` questions of the library for the corpus and topic, least served first.
+
+        :param corpus: The corpus fingerprint.
+        :param topic: The topic of the quiz.
+        :param count: The number of questions wanted.
+        :param accept: An optional function called with each candidate question, returning False to skip it
+                       (e.g. because it was already asked in this session).
+        :return: The list of question dictionaries served.
+        """
+        topic_ids = self.find_topics(corpus, topic)
+        if not topic_ids or count <= 0:
+            return []
+        placeholders = ",".join("?" * len(topic_ids))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT id, question FROM questions WHERE topic_id IN ({placeholders}) ORDER BY served, RANDOM()",
+                topic_ids,
+            ).fetchall()
+
+        served = []
+        questions = []
+        for question_id, text in rows:
+            if len(questions) >= count:
+                break
+            question = json.loads(text)
+            if accept is None or accept(question):
+                served.append(question_id)
+                questions.append(question)
+
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE questions SET served = served + 1 WHERE id = ?", [(question_id,) for question_id in served])
+            self.connection.commit()
+        return questions
+
+    def add(self, corpus, topic, questions):
+        """
+        Writes generated questions back to the library, under the given corpus and topic.
+
+        :param corpus: The corpus fingerprint.
+        :param topic: The topic of the quiz.
+        :param questions: A list of question dictionaries.
+        """
+        if not questions:
+            return
+        normalized = self.normalize_topic(topic)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id FROM topics WHERE corpus = ? AND topic = ?", (corpus, normalized)).fetchone()
+        if row is None:
+            # Embedding the topic outside of the lock, since it may call the embedding model
+            vector = self._embed_topic(normalized)
+            blob = array('d', vector).tobytes() if vector is not None else None
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO topics (corpus, topic, vector) VALUES (?, ?, ?)", (corpus, normalized, blob))
+                row = self.connection.execute(
+                    "SELECT id FROM topics WHERE corpus = ? AND topic = ?", (corpus, normalized)).fetchone()
+
+        now = time.time()
+        with self.lock:
+            # The questions were just served to the user who generated them
+            self.connection.executemany(
+                "INSERT INTO questions (topic_id, question, served, created_at) VALUES (?, ?, 1, ?)",
+                [(row[0], json.dumps(question), now) for question in questions],
+            )
+            self.connection.commit()
+
+    def count(self, corpus=None) -> int:
+        """
+        Returns the number of questions in the library, for one corpus or in total.
+        """
+        with self.lock:
+            if corpus is None:
+                return self.connection.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM questions JOIN topics ON topics.id = questions.topic_id WHERE topics.corpus = ?",
+                (corpus,)).fetchone()[0]
+
+    def clear(self):
+        """
+        Removes every question and topic from the library.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM questions")
+            self.connection.execute("DELETE FROM topics")
+            self.connection.commit()
@@ -0,0 +1,225 @@
+import queue
+import threading
+from QuizGenerator import QuizGenerator
+
+class QuestionProducer:
+    """
+    This class prepares the quiz of a session in the background, so the user does not wait for the indexing
+    and for every question before seeing the first one.
+
+    Functionalities:
+    - Indexes the uploaded documents in a background thread as soon as they are uploaded.
+    - Once the topic is known, generates the questions in another background thread (after the indexing is done),
+      and puts each question in a bounded queue as soon as it is accepted. When the queue is full, the producer
+      waits for the quiz to consume questions.
+    - Can be cancelled, e.g. when the uploaded documents change: the threads stop at the next question and
+      the questions in the queue are dropped.
+    - With a scheduler (see QuizServer), the generation runs as a job of the session on the shared worker pool
+      instead of in its own thread. The job is only submitted once the documents are indexed, so it never holds
+      a worker while waiting for the indexing.
+
+    Parameters:
+    - chroma_creator: The ChromaCollectionCreator of the uploaded documents.
+    - corpus_fingerprint: The fingerprint of the uploaded documents, telling when the uploads change.
+    - max_queued: The maximum number of questions waiting in the queue.
+    - scheduler: An optional FairScheduler running the generation.
+    - session_id: The session the generation is scheduled for.
+    """
+
+    def __init__(self, chroma_creator, corpus_fingerprint=None, max_queued=10, scheduler=None, session_id=None):
+        self.chroma_creator = chroma_creator
+        self.corpus_fingerprint = corpus_fingerprint
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.cancelled = threading.Event()
+        self.indexed = threading.Event()
+        self.finished = threading.Event()
+        self.generator = None
+        self.error = None
+        self.index_status = None  # message of the indexing, shown by the script (Streamlit cannot show it from the thread)
+        self.produced = 0
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.index_thread = None
+        self.generation_thread = None
+        self.generation_job = None
+        self.generation_pending = False  # generation waiting for the indexing before being submitted to the scheduler
+        self.lock = threading.Lock()
+
+    def restart(self):
+        """
+        Cancels the producer and returns a new one on the same documents and scheduler, e.g. when the user submits
+        a new quiz while the previous one is still being generated. The new producer starts indexing at once,
+        which returns immediately when the documents are already indexed.
+
+        :return: The new QuestionProducer.
+        """
+        self.cancel()
+        producer = QuestionProducer(self.chroma_creator, corpus_fingerprint=self.corpus_fingerprint,
+                                    max_queued=self.queue.maxsize, scheduler=self.scheduler, session_id=self.session_id)
+        producer.start_indexing()
+        return producer
+
+    def start_indexing(self):
+        """
+        Starts indexing the documents in the background.
+        """
+        if self.index_thread is None:
+            self.index_thread = threading.Thread(target=self._index, daemon=True)
+            self.index_thread.start()
+
+    def start_generation(self, topic, num_questions, **generator_options):
+        """
+        Starts generating the quiz in the background, once the documents are indexed.
+
+        :param topic: The topic of the quiz.
+        :param num_questions: The number of questions of the quiz.
+        :param generator_options: Extra arguments of the QuizGenerator (max_concurrency, context_strategy, library...).
+        """
+        self.start_generator(QuizGenerator(topic, num_questions, self.chroma_creator, **generator_options))
+
+    def start_generator(self, generator):
+        """
+        Starts generating the quiz in the background with a QuizGenerator already set up on the documents.
+
+        :param generator: The QuizGenerator.
+        :raises QueueFullError: If the scheduler has too many jobs waiting; the generation can be started again later.
+                                When the documents are still being indexed, the job is submitted later and the error
+                                ends the generation instead, in `error`.
+        """
+        if self.generator is not None:
+            raise RuntimeError("The quiz is already being generated.")
+        self.start_indexing()
+        self.generator = generator
+        if self.scheduler is not None:
+            with self.lock:
+                if not self.indexed.is_set():
+                    # Submitted by the indexing thread once it is done, so the job does not hold a worker while it waits
+                    self.generation_pending = True
+                    return
+            self._submit_generation()
+            return
+        self.generation_thread = threading.Thread(target=self._generate, daemon=True)
+        self.generation_thread.start()
+
+    def _submit_generation(self):
+        try:
+            self.generation_job = self.scheduler.submit(self.session_id, self._generate)
+        except Exception:
+            self.generator = None
+            raise
+        # A job cancelled before it starts never runs _generate, so the generation is marked as over here
+        self.generation_job.add_done_callback(lambda job: self.finished.set())
+
+    def _index(self):
+        try:
+            self.index_status = self.chroma_creator.create_chroma_collection()
+        except Exception as e:
+            self.error = e
+            print(f"Failed to index the documents: {e}")
+        finally:
+            with self.lock:
+                self.indexed.set()
+                pending, self.generation_pending = self.generation_pending, False
+            if pending and self.error is None and not self.cancelled.is_set():
+                try:
+                    self._submit_generation()
+                except Exception as e:
+                    # E.g. QueueFullError: the quiz ends without questions and the error is shown to the user
+                    self.error = e
+                    self.finished.set()
+            elif pending:
+                self.finished.set()
+
+    def _generate(self):
+        try:
+            # Waiting for the indexing, while staying responsive to cancellation
+            while not self.indexed.wait(timeout=0.1):
+                if self.cancelled.is_set():
+                    return
+            if self.cancelled.is_set() or self.error is not None:
+                return
+            if self.chroma_creator.db is None:
+                raise RuntimeError("The documents could not be indexed.")
+
+            questions = self.generator.iter_quiz()
+            try:
+                for question in questions:
+                    if not self._put(question):
+                        break
+                    # With lazy embedding, the rest of the documents is embedded once the first question is ready
+                    if self.produced == 1:
+                        self.chroma_creator.embed_remaining_in_background()
+            finally:
+                questions.close()
+        except Exception as e:
+            self.error = e
+            print(f"Failed to generate the quiz: {e}")
+        finally:
+            self.finished.set()
+
+    def _put(self, question):
+        # Blocking while the queue is full, until the question fits or the producer is cancelled
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(question, timeout=0.1)
+            except queue.Full:
+                continue
+            # A question put while the producer was being cancelled is dropped like the others
+            if self.cancelled.is_set():
+                self._drain()
+                return False
+            self.produced += 1
+            return True
+        return False
+
+    def _drain(self):
+        while self.get() is not None:
+            pass
+
+    def get(self, timeout=None):
+        """
+        Takes the next question out of the queue.
+
+        :param timeout: How long to wait for a question, in seconds; None does not wait.
+        :return: The question dictionary, or None if no question is available (yet).
+        """
+        try:
+            if timeout is None:
+                return self.queue.get_nowait()
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def wait_for_question(self, poll_interval=0.1):
+        """
+        Waits until a question is available or the generation is over.
+
+        :return: The question dictionary, or None if the generation ended without producing another question.
+        """
+        while True:
+            question = self.get(timeout=poll_interval)
+            if question is not None or (self.finished.is_set() and self.queue.empty()):
+                return question
+
+    @property
+    def expected_total(self):
+        """
+        The number of questions of the quiz being generated, or None before the generation starts.
+        """
+        return self.generator.num_questions if self.generator is not None else None
+
+    @property
+    def done(self) -> bool:
+        """
+        True once the generation is over and every question was taken out of the queue.
+        """
+        return self.finished.is_set() and self.queue.empty()
+
+    def cancel(self):
+        """
+        Stops the producer and drops the questions waiting in the queue.
+        """
+        self.cancelled.set()
+        if self.generation_job is not None:
+            self.generation_job.cancel()
+        self._drain()
@@ -0,0 +1,76 @@
+import asyncio
+import queue
+import threading
+
+class QuestionStream:
+    """
+    This class turns any iterable or async iterable of questions into a question source for the QuizManager,
+    with the same interface as the QuestionProducer (`get`, `wait_for_question`, `done`, `expected_total`).
+
+    Functionalities:
+    - Consumes the iterable (e.g. `QuizGenerator.iter_quiz()`) or the async iterable in a background thread,
+      so the quiz can show the first questions while the others are still being produced.
+    - Reports when the iterable is exhausted, and keeps the error that stopped it, if any.
+
+    Parameters:
+    - questions: An iterable or async iterable of question dictionaries.
+    - expected_total: The number of questions the iterable is expected to produce, if known.
+    """
+
+    def __init__(self, questions, expected_total=None):
+        self.questions = questions
+        self.expected_total = expected_total
+        self.queue = queue.Queue()
+        self.finished = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._consume, daemon=True)
+        self.thread.start()
+
+    def _consume(self):
+        try:
+            if hasattr(self.questions, "__aiter__"):
+                asyncio.run(self._consume_async())
+            else:
+                for question in self.questions:
+                    self.queue.put(question)
+        except Exception as e:
+            self.error = e
+            print(f"The question source failed: {e}")
+        finally:
+            self.finished.set()
+
+    async def _consume_async(self):
+        async for question in self.questions:
+            self.queue.put(question)
+
+    def get(self, timeout=None):
+        """
+        Takes the next question produced.
+
+        :param timeout: How long to wait for a question, in seconds; None does not wait.
+        :return: The question dictionary, or None if no question is available (yet).
+        """
+        try:
+            if timeout is None:
+                return self.queue.get_nowait()
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def wait_for_question(self, poll_interval=0.1):
+        """
+        Waits until a question is available or the iterable is exhausted.
+
+        :return: The question dictionary, or None if the iterable ended without producing another question.
+        """
+        while True:
+            question = self.get(timeout=poll_interval)
+            if question is not None or (self.finished.is_set() and self.queue.empty()):
+                return question
+
+    @property
+    def done(self) -> bool:
+        """
+        True once the iterable is exhausted and every question was taken.
+        """
+        return self.finished.is_set() and self.queue.empty()
@@ -1,14 +1,23 @@
 import streamlit as st
 import os
 import sys
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 sys.path.append(os.path.abspath('../../'))
 from DocumentProcessor import DocumentProcessor
 from EmbeddingClient import EmbeddingClient
 from ChromaCollectionCreator import ChromaCollectionCreator
+from ContextScheduler import ContextScheduler
+from HybridRetriever import HybridRetriever
+from QuestionIndex import QuestionIndex
+from OutputRepair import QuestionRepairer, OutputRepairError
+from ResourceRegistry import registry
+from LLMCache import fresh_responses
+from Tracing import tracer
 
 from langchain_core.prompts import PromptTemplate
-from langchain_google_vertexai import VertexAI
+from langchain_core.runnables import RunnablePassthrough, RunnableParallel, RunnableLambda
 
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
@@ -44,15 +53,52 @@ class QuestionSchema(BaseModel):
         }
       }
 
+# Creating a schema for a list of questions, returned by a single LLM call in batch mode
+class QuizSchema(BaseModel):
+    questions: List[QuestionSchema] = Field(description="The list of quiz questions, all about different facts.")
+
+# Rough number of output tokens needed by one question, used to size the batches
+TOKENS_PER_QUESTION = 250
+
+def format_context(documents) -> str:
+    """
+    Renders the retrieved chunks as plain text for the prompt. Unlike the repr of the Documents, the text does not
+    depend on the order of the metadata returned by the vectorstore, so the same chunks always give the same prompt.
+    """
+    if isinstance(documents, str):
+        return documents
+    return "\n\n".join(document.page_content for document in documents)
+
 # Building the QuizGenerator class
 class QuizGenerator:
-    def __init__(self, topic=None, num_questions=1, vectorstore=None):
+    def __init__(self, topic=None, num_questions=1, vectorstore=None, max_concurrency=1, max_retries=3,
+                 batch_mode=False, max_output_tokens=None, context_strategy=None, chunks_per_question=4,
+                 question_index=None, llm_cache=None, library=None, corpus_fingerprint=None, llm_backend="vertex",
+                 llm_options=None, retrieval="vector"):
         """
         Initializes the QuizGenerator with a required topic, the number of questions, and an optional vectorstore for querying related information.
 
         :param topic: A string representing the required topic of the quiz.
         :param num_questions: An integer representing the number of questions to generate for the quiz, up to a maximum of 10.
         :param vectorstore: An optional vectorstore instance (e.g., ChromaDB) to be used for querying information related to the quiz topic.
+        :param max_concurrency: The maximum number of questions generated in parallel.
+        :param max_retries: The number of extra attempts for a question that fails or is a duplicate.
+        :param batch_mode: Whether to generate several questions in a single LLM call, sharing the prompt and the context.
+        :param max_output_tokens: The output token limit of the LLM; defaults to 500 per question, or 2048 in batch mode.
+        :param context_strategy: None to give every question the top chunks for the topic, or "mmr"/"partition" to give
+                                 each question its own slice of the corpus with a ContextScheduler.
+        :param chunks_per_question: The number of chunks in the context of each question with a context strategy.
+        :param question_index: An optional QuestionIndex of the questions already asked on this corpus, shared across quizzes.
+                               Near-duplicates of its questions are rejected, and accepted questions are added to it.
+        :param llm_cache: An optional LLMResponseCache around the LLM call, returning the stored responses of prompts already sent.
+        :param library: An optional QuestionLibrary shared by every session. Questions are drawn from it first, only the
+                        shortfall is generated, and the generated questions are written back to it.
+        :param corpus_fingerprint: The fingerprint of the documents, used as library key; defaults to the one of the
+                                   vectorstore's DocumentProcessor.
+        :param llm_backend: "vertex" for Gemini on VertexAI, or "fake" for the FakeLLM, which needs no Google Cloud access.
+        :param llm_options: Extra arguments of the fake LLM (latency, token_latency, error_rate, seed...).
+        :param retrieval: "vector" to retrieve the context by similarity search only, or "hybrid" to fuse it with the BM25
+                          ranking of the vectorstore's LexicalIndex (see HybridRetriever).
         """
         
         if not topic:
@@ -62,17 +108,55 @@ class QuizGenerator:
 
         if num_questions > 10:
             raise ValueError("Number of questions cannot exceed 10.")
+        if retrieval not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown retrieval: {retrieval}")
         
         self.num_questions = num_questions
         self.vectorstore = vectorstore
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.batch_mode = batch_mode
+        self.max_output_tokens = max_output_tokens or (2048 if batch_mode else 500)
+        self.context_strategy = context_strategy
+        self.chunks_per_question = chunks_per_question
+        self.scheduler = None
+        self.quiz_span = None
+        self.llm_cache = llm_cache
+        self.library = library
+        self.corpus_fingerprint = corpus_fingerprint
+        self.llm_backend = llm_backend
+        self.llm_options = llm_options or {}
+        self.retrieval = retrieval
         self.llm = None
         
+        # The chains are compiled once, by build_chain and build_batch_chain, and reused for every question
+        self.retriever = None
+        self.chain = None
+        self.generation_chain = None
+        self.batch_chain = None
+        
+        # Lock making the uniqueness check and the insertion in the question bank atomic across worker threads
+        self.lock = threading.Lock()
+        
+        # Counters of the last quiz, see quiz_metrics
+        self.metrics = {"llm_calls": 0, "accepted": 0, "duplicates": 0, "failures": 0, "regenerated": 0, "from_library": 0}
+        
         # Initialize the JsonOutputParser with the QuestionSchema
         # JsonOutputParser: a utility class used to parse JSON output from a language model (LLM) and ensure that the output conforms to a specific schema
         self.parser = JsonOutputParser(pydantic_object=QuestionSchema)
+        self.batch_parser = JsonOutputParser(pydantic_object=QuizSchema)
+        
+        # The parsers provide the format instructions; the output itself is parsed by the QuestionRepairer,
+        # which repairs common defects locally instead of failing and calling the LLM again
+        self.repairer = QuestionRepairer(QuestionSchema)
         
         # Initialize the question bank to store questions
         self.question_bank = [] 
+        
+        # Near-duplicate index of the generated questions, replacing the scan of the question bank
+        # A given index is shared across quizzes; the default one only holds the questions of the current quiz
+        self.shared_question_index = question_index is not None
+        self.question_index = question_index if question_index is not None else QuestionIndex()
         self.system_template = """
             You are a subject matter expert on the topic: {topic}
             
@@ -84,6 +168,20 @@ class QuizGenerator:
             
             {format_instructions}
             
+            Context: {context}
+            """
+        self.batch_template = """
+            You are a subject matter expert on the topic: {topic}
+            
+            Follow the instructions to create a quiz of {num_questions} questions:
+            1. Generate {num_questions} different questions based on the topic provided and context, each in an object with the key "question". No two questions may ask about the same fact.
+            2. For each question, provide 4 multiple choice answers to the question as a list of key-value pairs "choices"
+            3. For each question, provide the correct answer for the question from the list of answers as key "answer"
+            4. For each question, provide an explanation as to why the answer is correct as key "explanation"
+            5. Return the question objects as a list with the key "questions"
+            {previous_questions}
+            {format_instructions}
+            
             Context: {context}
             """
     
@@ -96,31 +194,45 @@ class QuizGenerator:
 
         :return: An instance or configuration for the LLM.
         """
-        self.llm = VertexAI(
+        # The client is shared by every generator with the same settings, see ResourceRegistry
+        if self.llm_backend == "fake":
+            self.llm = registry.llm(backend="fake", cache=self.llm_cache, **self.llm_options)
+            return
+        self.llm = registry.llm(
+            backend = self.llm_backend,
             model_name = "gemini-pro",
             temperature = 0.8, # Increased for less deterministic questions 
-            max_output_tokens = 500
+            max_output_tokens = self.max_output_tokens,
+            cache = self.llm_cache # None falls back to the global LangChain cache setting
         )
 
-    def generate_question_with_vectorstore(self):
+    def build_chain(self):
         """
-        Generates a quiz question based on the topic provided and context using a vectorstore
-
-        Overview:
-        This method leverages the vectorstore to retrieve relevant context for the quiz topic, then utilizes the LLM to generate a structured quiz question in JSON format. 
-        The process involves retrieving documents, creating a prompt, and invoking the LLM to generate a question.
+        Compiles the chain generating one question: retrieval, prompt, LLM and parser.
+        The chain is built on the first call and then reused, so generating a question does not construct any object.
+        Callers can also run the compiled chain themselves, e.g. `generator.build_chain().batch([topic] * n)`.
 
-        :return: A JSON object representing the generated quiz question.
+        :return: The compiled chain, taking the topic as input and returning the parsed question.
         """
+        if self.chain is not None:
+            return self.chain
         if not self.llm:
             self.init_llm()
         if not self.vectorstore:
             raise ValueError("Vectorstore not provided.")
-        
-        from langchain_core.runnables import RunnablePassthrough, RunnableParallel
 
-        # Enable a Retriever: get relevant documents from the vectorstore
-        retriever = self.vectorstore.db.as_retriever()
+        # In lazy mode, embedding the best lexical candidates for the topic first: the vector search only sees embedded chunks
+        if getattr(self.vectorstore, "lazy", False):
+            needed = 2 * self.num_questions * self.chunks_per_question if self.context_strategy else 0
+            self.vectorstore.embed_for_topic(self.topic, max(self.vectorstore.lazy_candidates, needed))
+
+        # Enable a Retriever: get relevant documents from the vectorstore, and from the lexical index in hybrid mode
+        if self.retrieval == "hybrid":
+            if getattr(self.vectorstore, "lexical_index", None) is None:
+                raise ValueError("Hybrid retrieval needs the LexicalIndex built by the ChromaCollectionCreator.")
+            self.retriever = HybridRetriever(vectorstore=self.vectorstore.db, lexical_index=self.vectorstore.lexical_index)
+        else:
+            self.retriever = self.vectorstore.db.as_retriever()
         
         # Use the system template to create a PromptTemplate
         prompt = PromptTemplate(
@@ -132,26 +244,71 @@ class QuizGenerator:
         # RunnableParallel allows Retriever to get relevant documents
         # RunnablePassthrough allows chain.invoke to send self.topic to LLM
         setup_and_retrieval = RunnableParallel(
-            {"context": retriever, "topic": RunnablePassthrough()}
+            {"context": self.retriever, "topic": RunnablePassthrough()}
         )
         # Creating a chain with the Retriever, PromptTemplate, and LLM
-        chain = setup_and_retrieval | prompt | self.llm | self.parser
+        # The part after the retrieval is kept separately, to run it on a context chosen by the ContextScheduler
+        self.generation_chain = (
+            RunnablePassthrough.assign(context=lambda inputs: format_context(inputs["context"]))
+            | prompt | self.llm | RunnableLambda(self.repairer.parse)
+        )
+        self.chain = setup_and_retrieval | self.generation_chain
         """
         The chain is constructed as follows:
             1. setup_and_retrieval: Retrieves relevant documents from the vectorstore and passes them to the next step.
-            2. prompt: Creates a prompt template using the system template and the retrieved documents.
+            2. format_context and prompt: Renders the retrieved documents as text and fills the system template.
             3. self.llm: Generates the quiz question based on the formatted prompt.
-            4. self.parser: Parses the output from the LLM to ensure it conforms to the QuestionSchema.
+            4. self.repairer.parse: Parses (and repairs if needed) the output from the LLM to ensure it conforms to the QuestionSchema.
         Output: A validated and structured quiz question in JSON format.
         """
-        response = chain.invoke(self.topic)
+        return self.chain
+
+    def build_batch_chain(self):
+        """
+        Compiles the chain generating a list of questions in batch mode: prompt, LLM and parser.
+        The context is retrieved separately, once per batch, with the retriever of `build_chain`.
+
+        :return: The compiled chain, taking a dictionary with the topic, context, num_questions and previous_questions.
+        """
+        if self.batch_chain is None:
+            self.build_chain()
+            prompt = PromptTemplate(
+                template = self.batch_template,
+                input_variables=["topic", "context", "num_questions", "previous_questions"],
+                partial_variables={"format_instructions": self.batch_parser.get_format_instructions()},
+            )
+            self.batch_chain = (
+                RunnablePassthrough.assign(context=lambda inputs: format_context(inputs["context"]))
+                | prompt | self.llm | RunnableLambda(self.repairer.parse_batch)
+            )
+        return self.batch_chain
+
+    def generate_question_with_vectorstore(self, context=None):
+        """
+        Generates a quiz question based on the topic provided and context using a vectorstore
+
+        Overview:
+        This method leverages the vectorstore to retrieve relevant context for the quiz topic, then utilizes the LLM to generate a structured quiz question in JSON format. 
+        The process involves retrieving documents, creating a prompt, and invoking the LLM to generate a question, with the chain compiled by `build_chain`.
+
+        :param context: Optional list of chunk Documents to use instead of retrieving the context for the topic.
+        :return: A JSON object representing the generated quiz question.
+        """
+        chain = self.build_chain()
+        # The callbacks time the retrieval, prompt, LLM and parsing steps when tracing is enabled
+        config = {"callbacks": tracer.callbacks()}
+        if context is not None:
+            response = self.generation_chain.invoke({"topic": self.topic, "context": context}, config=config)
+        else:
+            response = chain.invoke(self.topic, config=config)
         return response
 
 
     def validate_question(self, question: dict) -> bool:
         """
         Validates a quiz question for uniqueness within the generated quiz.
-        Checks if the provided question (as a dictionary) is unique based on its text content compared to previously generated questions stored in `question_bank`. 
+        Checks if the provided question (as a dictionary) is unique compared to previously generated questions, using the `question_index`:
+        exact duplicates after normalization and reworded near-duplicates are both rejected, without comparing the question to every other one.
         The goal is to ensure that no duplicate questions are added to the quiz.
 
         Parameters:
@@ -160,22 +317,25 @@ class QuizGenerator:
         Returns:
         - A boolean value: True if the question is unique, False otherwise.
 
-        Note: This method assumes `question` is a valid dictionary and `question_bank` has been properly initialized.
+        Note: This method assumes `question` is a valid dictionary. Call `accept_question` to add a unique question to the quiz.
         """
         # Consider missing 'question' key as invalid in the dict object
         if 'question' not in question or not question['question']:
             raise ValueError("The dict object must contain a non-empty 'question' key")
 
-        # Check if a question with the same text already exists in the self.question_bank
-        is_unique = True
+        # Looking up the question in the near-duplicate index
+        duplicate = self.question_index.find_duplicate(question['question'])
+        return duplicate is None
 
-        # Iterating over the existing questions in `question_bank` and compare their texts to the current question's text
-        for question_iterated in self.question_bank:
-            if(question_iterated['question'] == question['question']):
-                is_unique = False
-                break
+    def accept_question(self, question: dict):
+        """
+        Adds a validated question to the question bank and to the near-duplicate index.
 
-        return is_unique
+        :param question: The question dictionary.
+        """
+        self.question_bank.append(question)
+        self.question_index.add(question['question'])
+        self.metrics["accepted"] += 1
     
     
     def generate_quiz(self) -> list:
@@ -183,47 +343,315 @@ class QuizGenerator:
         Generates a list of unique quiz questions based on the specified topic and number of questions.
         Utilizes the `generate_question_with_vectorstore` method to generate each question and the `validate_question` method to ensure its uniqueness before adding it to the quiz.
 
+        With max_concurrency > 1, up to max_concurrency questions are generated in parallel, so the quiz takes about
+        as long as the slowest question instead of the sum of all of them. Each question keeps its own retry budget,
+        and the questions are returned in the order they were requested, whatever order they complete in.
+
         Returns:
         - A list of dictionaries, where each dictionary represents a unique quiz question generated based on the topic.
 
         Note: This method relies on `generate_question_with_vectorstore` for question generation and `validate_question` for ensuring question uniqueness. 
         Ensure `question_bank` is properly initialized and managed.
         """
+        for _ in self.iter_quiz():
+            pass
+        return self.question_bank
+
+    def iter_quiz(self):
+        """
+        Generates the quiz like `generate_quiz`, but yields each question as soon as it is accepted, in the order
+        they complete, so the first question can be shown without waiting for the slowest one.
+        Once the iteration ends (or the iterator is closed), `question_bank` holds the questions in the order they were requested.
+
+        :return: An iterator over the question dictionaries.
+        """
+        if self.batch_mode:
+            yield from self.iter_quiz_batched()
+            return
         
         # Initializing an empty list to store the unique quiz questions
         self.question_bank = [] # Resetting the question bank
-
-        for _ in range(self.num_questions):
-            # Generating a question
-            question = self.generate_question_with_vectorstore()
+        
+        # Serving the questions already in the library first, then generating only the shortfall
+        self.start_quiz()
+        library_questions = list(self.question_bank)
+        slots = list(range(len(library_questions), self.num_questions))
+        generated = {}
+        executor = None
+        try:
+            yield from library_questions
+            if not slots:
+                return
             
-            # Validatig the question's uniqueness using the validate_question method
-            if self.validate_question(question):
-                print("Successfully generated unique question")
-                # If valid and unique, add it to the bank
-                self.question_bank.append(question)
-                
+            # Compiling the chain once, before the worker threads share it
+            self.build_chain()
+            self.plan_contexts()
+
+            if self.max_concurrency > 1 and len(slots) > 1:
+                executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(slots)))
+                futures = {executor.submit(self.generate_unique_question, slot): slot for slot in slots}
+                for future in as_completed(futures):
+                    generated[futures[future]] = future.result()
+                    if generated[futures[future]] is not None:
+                        yield generated[futures[future]]
             else:
-                print("Duplicate or invalid question detected.")
+                for slot in slots:
+                    generated[slot] = self.generate_unique_question(slot)
+                    if generated[slot] is not None:
+                        yield generated[slot]
+        finally:
+            # Not waiting for the questions still in progress when the iterator is closed early
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            
+            # Keeping the questions in the order they were requested
+            questions = [generated[slot] for slot in slots if generated.get(slot) is not None]
+            self.question_bank = library_questions + questions
+            self.save_to_library(questions)
+            self.end_quiz()
 
-                for i in range(3): #Retry limit of 3 attempts
-                    question_str = self.generate_question_with_vectorstore()
-                    
-                    try:
-                        question = json.loads(question_str)
-                    except json.JSONDecodeError:
-                        print("Failed to decode question JSON.")
-                        continue 
-                    
-                    if self.validate_question(question):
-                        print("Successfully generated unique question")
-                        self.question_bank.append(question)
+    def generate_questions_batch(self, count, slots=None) -> list:
+        """
+        Generates several quiz questions with a single LLM call, using the context retrieved once for the topic.
+        The questions already in the question bank are listed in the prompt so that they are not repeated.
+
+        :param count: The number of questions to ask for.
+        :param slots: The positions in the quiz of the questions asked for, used to pick their context with the ContextScheduler.
+        :return: A list of question dictionaries, as returned by the LLM.
+        """
+        chain = self.build_batch_chain()
+
+        previous_questions = ""
+        if self.question_bank:
+            previous_questions = "Do not repeat any of these questions: " + "; ".join(
+                question["question"] for question in self.question_bank)
+
+        config = {"callbacks": tracer.callbacks()}
+        if self.scheduler and slots is not None:
+            context = self.scheduler.next_contexts(slots)
+        else:
+            context = self.retriever.invoke(self.topic, config=config)
+
+        response = chain.invoke({
+            "topic": self.topic,
+            "context": context,
+            "num_questions": count,
+            "previous_questions": previous_questions,
+        }, config=config)
+        return response.get("questions", []) if isinstance(response, dict) else response
+
+    def generate_quiz_batched(self) -> list:
+        """
+        Generates the quiz with as few LLM calls as possible: each call returns a list of questions, up to the number
+        that fits in `max_output_tokens`. Duplicates inside a batch or across batches are dropped, and missing
+        questions are asked for in further calls, within a budget of `max_retries` extra calls.
+
+        Returns:
+        - A list of dictionaries, where each dictionary represents a unique quiz question generated based on the topic.
+        """
+        for _ in self.iter_quiz_batched():
+            pass
+        return self.question_bank
+
+    def iter_quiz_batched(self):
+        """
+        Generates the quiz like `generate_quiz_batched`, yielding the questions of each batch as soon as they are accepted.
+
+        :return: An iterator over the question dictionaries.
+        """
+        self.question_bank = [] # Resetting the question bank
+        self.start_quiz()
+        num_from_library = len(self.question_bank)
+        questions_per_call = max(1, self.max_output_tokens // TOKENS_PER_QUESTION)
+        max_calls = -(-self.num_questions // questions_per_call) + self.max_retries
+
+        try:
+            yield from list(self.question_bank)
+            if num_from_library >= self.num_questions:
+                return
+            self.build_batch_chain()
+            self.plan_contexts()
+
+            # Set when the last call added no question: the next one sends the same prompt, so it skips the LLM cache
+            retrying = False
+            for _ in range(max_calls):
+                missing = self.num_questions - len(self.question_bank)
+                if missing <= 0:
+                    break
+                count = min(missing, questions_per_call)
+                slots = list(range(len(self.question_bank), len(self.question_bank) + count))
+                self.metrics["llm_calls"] += 1
+                retrying, was_retrying = True, retrying
+                try:
+                    with tracer.start_span("question.batch", parent=self.quiz_span, count=count), \
+                            fresh_responses() if was_retrying else nullcontext():
+                        questions = self.generate_questions_batch(count, slots)
+                except OutputRepairError as e:
+                    self.metrics["regenerated"] += 1
+                    print(f"Could not repair the generated questions, generating them again: {e}")
+                    continue
+                except Exception as e:
+                    self.metrics["failures"] += 1
+                    print(f"Failed to generate questions: {e}")
+                    continue
+
+                for question in questions:
+                    if len(self.question_bank) >= self.num_questions:
                         break
+                    try:
+                        is_unique = isinstance(question, dict) and self.validate_question(question)
+                    except ValueError:
+                        is_unique = False
+                    if is_unique:
+                        self.accept_question(question)
+                        retrying = False
+                        yield question
                     else:
-                        print("Duplicate or invalid question detected - Attempt "+(i+1))
-                        continue
+                        self.metrics["duplicates"] += 1
+                        print("Duplicate or invalid question detected in batch.")
+        finally:
+            self.save_to_library(self.question_bank[num_from_library:])
+            self.end_quiz()
 
-        return self.question_bank
+    def start_quiz(self):
+        """
+        Resets the metrics and the default near-duplicate index and, with a library, adds the questions served by
+        the library to the question bank.
+        """
+        if not self.shared_question_index:
+            self.question_index = QuestionIndex()
+        self.metrics = {"llm_calls": 0, "accepted": 0, "duplicates": 0, "failures": 0, "regenerated": 0, "from_library": 0}
+        self.repairer.reset()
+        self.quiz_span = tracer.start_span("quiz", topic=self.topic, num_questions=self.num_questions, batch_mode=self.batch_mode)
+        with tracer.start_span("library.draw", parent=self.quiz_span):
+            self.draw_from_library()
+
+    def end_quiz(self):
+        """
+        Ends the tracing span of the quiz, recording the metrics of the quiz as its attributes and as counters.
+        """
+        if self.quiz_span is None:
+            return
+        for key, value in self.quiz_metrics().items():
+            self.quiz_span.set_attribute(key, value)
+            if key in ("llm_calls", "accepted", "duplicates", "failures", "regenerated", "from_library", "repaired"):
+                tracer.count(f"quiz.{key}", value)
+        self.quiz_span.end()
+        self.quiz_span = None
+
+    def library_key(self):
+        """
+        Returns the corpus fingerprint under which the questions are stored in the library.
+        """
+        if self.corpus_fingerprint is None:
+            self.corpus_fingerprint = self.vectorstore.processor.corpus_fingerprint()
+        return self.corpus_fingerprint
+
+    def draw_from_library(self) -> list:
+        """
+        Adds to the question bank the library questions for this corpus and topic that are not near-duplicates
+        of the questions already asked.
+
+        :return: The list of questions served by the library.
+        """
+        if self.library is None:
+            return []
+
+        def accept(question):
+            try:
+                if not self.validate_question(question):
+                    return False
+            except ValueError:
+                return False
+            self.accept_question(question)
+            self.metrics["from_library"] += 1
+            return True
+
+        missing = self.num_questions - len(self.question_bank)
+        return self.library.draw(self.library_key(), self.topic, missing, accept=accept)
+
+    def save_to_library(self, questions):
+        """
+        Writes the generated questions back to the library, so other sessions can be served them.
+        """
+        if self.library is not None and questions:
+            self.library.add(self.library_key(), self.topic, questions)
+
+    def plan_contexts(self):
+        """
+        With a context strategy, spreads the context across the questions of the quiz up front.
+        """
+        if self.context_strategy:
+            self.scheduler = ContextScheduler(
+                self.vectorstore.db, self.topic,
+                chunks_per_question=self.chunks_per_question,
+                strategy=self.context_strategy,
+                lexical_index=self.vectorstore.lexical_index if self.retrieval == "hybrid" else None)
+            # One spare slice per question for the retries
+            with tracer.start_span("retrieval.plan", parent=self.quiz_span, strategy=self.context_strategy):
+                self.scheduler.plan(self.num_questions, num_spare_slots=self.num_questions)
+
+    def quiz_metrics(self) -> dict:
+        """
+        Returns the counters of the last quiz, with the duplicate rate (duplicates per generated question),
+        the number of wasted LLM calls (calls beyond the minimum needed for the accepted questions), the number of
+        outputs repaired locally, and the number of outputs that could not be repaired and were generated again.
+        `from_library` counts the accepted questions that were served by the library instead of generated.
+        """
+        metrics = dict(self.metrics)
+        metrics["repaired"] = self.repairer.stats["repaired"]
+        questions_per_call = max(1, self.max_output_tokens // TOKENS_PER_QUESTION) if self.batch_mode else 1
+        generated = metrics["accepted"] + metrics["duplicates"]
+        metrics["duplicate_rate"] = metrics["duplicates"] / generated if generated else 0.0
+        metrics["wasted_calls"] = metrics["llm_calls"] - -(-(metrics["accepted"] - metrics["from_library"]) // questions_per_call)
+        return metrics
+
+    def generate_unique_question(self, slot=0):
+        """
+        Generates one question and adds it to the question bank, retrying up to `max_retries` times
+        when the generation fails or the question is a duplicate.
+
+        :param slot: The position of the question in the quiz.
+        :return: The question dictionary, or None if every attempt failed.
+        """
+        for attempt in range(self.max_retries + 1):
+            # Generating a question, on its own slice of context when a context strategy is set
+            context = self.scheduler.next_context(slot) if self.scheduler else None
+            with self.lock:
+                self.metrics["llm_calls"] += 1
+            try:
+                # A retry sends the same prompt again, so its response must not come from the LLM cache
+                with tracer.start_span("question", parent=self.quiz_span, slot=slot, attempt=attempt), \
+                        fresh_responses() if attempt else nullcontext():
+                    question = self.generate_question_with_vectorstore(context)
+            except OutputRepairError as e:
+                with self.lock:
+                    self.metrics["regenerated"] += 1
+                print(f"Could not repair question {slot + 1}, generating it again: {e}")
+                continue
+            except Exception as e:
+                with self.lock:
+                    self.metrics["failures"] += 1
+                print(f"Failed to generate question {slot + 1}: {e}")
+                continue
+            
+            # Validatig the question's uniqueness using the validate_question method
+            with self.lock, tracer.start_span("validate", parent=self.quiz_span, slot=slot):
+                try:
+                    is_unique = self.validate_question(question)
+                except ValueError:
+                    is_unique = False
+                
+                if is_unique:
+                    # If valid and unique, add it to the bank
+                    self.accept_question(question)
+                    print("Successfully generated unique question")
+                    return question
+                self.metrics["duplicates"] += 1
+            
+            print(f"Duplicate or invalid question detected - Attempt {attempt + 1}")
+        
+        return None
 
 
 # Test Generating the Quiz
@@ -257,7 +685,11 @@ if __name__ == "__main__":
             
             submitted = st.form_submit_button("Submit")
             if submitted:
-                chroma_creator.create_chroma_collection()
+                try:
+                    st.success(chroma_creator.create_chroma_collection(), icon="✅")
+                except (ValueError, RuntimeError) as e:
+                    st.error(str(e), icon="🚨")
+                    st.stop()
                 
                 st.write(topic_input)
                 
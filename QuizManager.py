@@ -2,14 +2,16 @@ import streamlit as st
 import os
 import sys
 import json
+import time
 sys.path.append(os.path.abspath('../../'))
 from DocumentProcessor import DocumentProcessor
 from EmbeddingClient import EmbeddingClient
 from ChromaCollectionCreator import ChromaCollectionCreator
 from QuizGenerator import QuizGenerator
+from QuestionStream import QuestionStream
 
 class QuizManager:
-    def __init__(self, questions: list):
+    def __init__(self, questions: list = None, source=None, expected_total=None):
         """
         Initializing the QuizManager class with a list of quiz questions.
 
@@ -20,23 +22,91 @@ class QuizManager:
 
         Parameters:
         - questions: A list of dictionaries, where each dictionary represents a quiz question along with its choices, correct answer, and an explanation.
+        - source: An optional source of questions still being generated: a QuestionProducer or a QuestionStream, or any iterable
+                  or async iterable of questions (wrapped in a QuestionStream). `fetch` appends its new questions to the list.
+        - expected_total: The number of questions the quiz will have once complete; defaults to the one reported by the source.
 
         Note: This initialization method is crucial for setting the foundation of the `QuizManager` class, enabling it to manage the quiz questions effectively. The class will rely on this setup to perform operations such as retrieving specific questions by index and navigating through the quiz.
         """
         ##### YOUR CODE HERE #####
-        self.questions = questions
+        self.questions = questions if questions is not None else []
+        if source is not None and not hasattr(source, "get"):
+            source = QuestionStream(source, expected_total=expected_total)
+        self.source = source
+        self.expected_total = expected_total
         self.total_questions = len(self.questions)
+        self.fetch()
+
+    @property
+    def is_complete(self) -> bool:
+        """
+        True once the source has produced every question (or when there is no source).
+        """
+        return self.source is None or self.source.done
+
+    @property
+    def pending_questions(self):
+        """
+        The number of questions still expected from the source, or None if unknown.
+        """
+        if self.is_complete:
+            return 0
+        expected = self.expected_total or getattr(self.source, "expected_total", None)
+        return None if expected is None else max(expected - self.total_questions, 0)
+
+    def fetch(self) -> int:
+        """
+        Appends to the quiz the questions the source produced since the last call, without waiting.
+
+        :return: The number of questions added.
+        """
+        added = 0
+        if self.source is not None:
+            question = self.source.get()
+            while question is not None:
+                self.questions.append(question)
+                added += 1
+                question = self.source.get()
+        self.total_questions = len(self.questions)
+        return added
 
     def get_question_at_index(self, index: int):
         """
         Retrieves the quiz question object at the specified index. If the index is out of bounds, it restarts from the beginning index.
+        While the source is still producing questions, indexes past the last question received are not wrapped: the question is pending.
 
         :param index: The index of the question to retrieve.
-        :return: The quiz question object at the specified index, with indexing wrapping around if out of bounds.
+        :return: The quiz question object at the specified index, with indexing wrapping around if out of bounds,
+                 or None if the question is still being generated.
         """
+        self.fetch()
+        if index >= self.total_questions and not self.is_complete:
+            return None
+        if self.total_questions == 0:
+            return None
         # Ensuring index is always within bounds using modulo arithmetic
         valid_index = index % self.total_questions
         return self.questions[valid_index]
+
+    def wait_for_question_at_index(self, index: int, timeout=None):
+        """
+        Waits until the question at the specified index is received, or the source is exhausted.
+
+        :param index: The index of the question.
+        :param timeout: The maximum time to wait, in seconds; None waits as long as needed.
+        :return: The quiz question object, or None if it did not arrive in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        question = self.get_question_at_index(index)
+        while question is None and not self.is_complete:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            next_question = self.source.get(timeout=0.1)
+            if next_question is not None:
+                self.questions.append(next_question)
+                self.total_questions = len(self.questions)
+            question = self.get_question_at_index(index)
+        return question
     
     def next_question_index(self, direction=1):
         """
@@ -54,8 +124,12 @@ class QuizManager:
         # Retrieving the current question index from Streamlit's session state
         current_question_index = st.session_state["question_index"]
         
+        # While the bank is still growing, the position right after the last question received is the next question being generated
+        self.fetch()
+        num_positions = self.total_questions if self.is_complete else self.total_questions + 1
+        
         # Adjusting the index based on the provided `direction` (1 for next, -1 for previous), using modulo arithmetic to wrap around the total number of questions
-        new_index = (current_question_index + direction) % self.total_questions
+        new_index = (current_question_index + direction) % max(num_positions, 1)
         
         # Updating the `question_index` in Streamlit's session state with the new, valid index.
         st.session_state["question_index"] = new_index
@@ -91,7 +165,11 @@ if __name__ == "__main__":
             
             submitted = st.form_submit_button("Submit")
             if submitted:
-                chroma_creator.create_chroma_collection()
+                try:
+                    st.success(chroma_creator.create_chroma_collection(), icon="✅")
+                except (ValueError, RuntimeError) as e:
+                    st.error(str(e), icon="🚨")
+                    st.stop()
                 
                 st.write(topic_input)
                 
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from ChromaCollectionCreator import ChromaCollectionCreator
+from JobScheduler import FairScheduler
+from QuestionIndex import QuestionIndex
+from QuizGenerator import QuizGenerator
+from ResourceRegistry import registry
+
+class QuizSession:
+    """
+    The namespace of one user session on the QuizServer: the state that must not be shared with the other sessions.
+
+    Parameters:
+    - session_id: The identifier of the session.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.question_indexes = {}  # corpus fingerprint -> QuestionIndex of the questions asked in this session
+        self.quizzes = 0
+
+    def question_index(self, corpus_fingerprint) -> QuestionIndex:
+        """
+        Returns the near-duplicate index of the questions already asked in this session on the given documents.
+        """
+        return self.question_indexes.setdefault(corpus_fingerprint, QuestionIndex())
+
+
+class QuizServer:
+    """
+    This class serves many concurrent sessions (e.g. a class of students using the app at the same time)
+    from a single process, without doing the same work twice.
+
+    Functionalities:
+    - Shared index: the documents are indexed once per corpus fingerprint, in their own persisted collection
+      (`<index_dir>/<fingerprint>`), and the collection is shared by every session working on the same documents.
+      Sessions uploading the same documents at the same time wait for a single indexing.
+    - A namespace per session (QuizSession) holding its own state, e.g. the questions already asked.
+    - Quizzes are generated by a FairScheduler: a bounded global queue, served by a pool of workers taking
+      the sessions in turn, so a few users requesting many quizzes do not starve the others.
+    - Idle sessions and collections are dropped: a session unused for `session_ttl` seconds, and a collection unused
+      for `index_ttl` seconds or beyond the `max_indexes` most recently used, so a long-running server does not
+      keep the state of every past session and the vectors of every past corpus in memory.
+
+    Parameters:
+    - embed_model: The embedding model (e.g. the EmbeddingClient) of the collections.
+    - index_dir: The directory under which the collection of each corpus is persisted.
+    - max_workers: The number of quizzes generated at the same time.
+    - max_queued: The maximum number of quizzes waiting, over every session.
+    - max_queued_per_session: The maximum number of quizzes waiting for one session.
+    - resources: The ResourceRegistry holding the shared collections.
+    - vectorstore_backend: "chroma", or "numpy" for in-process collections (see ChromaCollectionCreator).
+    - lazy_embedding: Whether the collections embed their chunks on demand, starting with the candidates for the topic of each quiz.
+    - quantization: "float16" or "int8" to search each collection from a memory-mapped QuantizedVectorStore,
+      shared with the other processes serving the same `index_dir`, or None.
+    - session_ttl: The number of seconds after which an unused session is dropped.
+    - index_ttl: The number of seconds after which an unused collection is released.
+    - max_indexes: The maximum number of collections held.
+    """
+
+    def __init__(self, embed_model, index_dir="./chroma_db", max_workers=4, max_queued=64, max_queued_per_session=4,
+                 resources=registry, vectorstore_backend="chroma", lazy_embedding=False, session_ttl=3600, index_ttl=3600,
+                 max_indexes=16, quantization=None):
+        self.embed_model = embed_model
+        self.index_dir = index_dir
+        self.vectorstore_backend = vectorstore_backend
+        self.lazy_embedding = lazy_embedding
+        self.quantization = quantization
+        self.resources = resources
+        self.scheduler = FairScheduler(max_workers, max_queued, max_queued_per_session)
+        self.session_ttl = session_ttl
+        self.index_ttl = index_ttl
+        self.max_indexes = max_indexes
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.indexes = OrderedDict()  # corpus fingerprint -> (registry config, last use), least recently used first
+
+    def session(self, session_id) -> QuizSession:
+        """
+        Returns the namespace of a session, creating it on first use.
+        """
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = QuizSession(session_id)
+            session.last_seen = time.time()
+        self.evict_idle()
+        return session
+
+    def close_session(self, session_id) -> int:
+        """
+        Drops the namespace of a session and cancels its quizzes still waiting.
+
+        :return: The number of quizzes cancelled.
+        """
+        with self.lock:
+            self.sessions.pop(session_id, None)
+        return self.scheduler.cancel_session(session_id)
+
+    def index(self, processor) -> ChromaCollectionCreator:
+        """
+        Returns the ChromaCollectionCreator shared by every session working on the documents of the processor.
+        The documents are indexed by its `create_chroma_collection`, which only runs once for the corpus.
+        Files given to the processor with `defer_files` are parsed by that indexing, through the IngestionPipeline.
+
+        :param processor: The DocumentProcessor of the session, holding the uploaded documents.
+        """
+        fingerprint = processor.corpus_fingerprint()
+        config = {"corpus": fingerprint, "index_dir": self.index_dir, "embed_model": self.embed_model,
+                  "backend": self.vectorstore_backend, "lazy": self.lazy_embedding, "quantization": self.quantization}
+        chroma_creator = self.resources.get_or_create("corpus_index", config, lambda: ChromaCollectionCreator(
+            processor, self.embed_model, persist_directory=os.path.join(self.index_dir, fingerprint[:16]),
+            backend=self.vectorstore_backend, lazy=self.lazy_embedding, quantization=self.quantization), release=self._release_index)
+        with self.lock:
+            self.indexes[fingerprint] = (config, time.time())
+            self.indexes.move_to_end(fingerprint)
+        self.evict_idle()
+        return chroma_creator
+
+    def _release_index(self, chroma_creator):
+        # The opened Chroma collection of the corpus is also held by the process registry (see open_chroma_collection)
+        if chroma_creator.backend == "chroma":
+            registry.invalidate("chroma_collection", {
+                "collection_name": chroma_creator.opened_collection_name, "persist_directory": chroma_creator.persist_directory,
+                "embedding_function": chroma_creator.embed_model})
+
+    def evict_idle(self) -> tuple:
+        """
+        Drops the sessions unused for `session_ttl` seconds (cancelling their waiting quizzes), and releases
+        the collections unused for `index_ttl` seconds or beyond the `max_indexes` most recently used.
+        Quizzes already running keep their collection until they end; the persisted collection is reopened on next use.
+
+        :return: The number of sessions dropped and of collections released.
+        """
+        now = time.time()
+        with self.lock:
+            idle_sessions = [session_id for session_id, session in self.sessions.items()
+                             if now - session.last_seen > self.session_ttl]
+            for session_id in idle_sessions:
+                del self.sessions[session_id]
+            stale = [fingerprint for fingerprint, (_, last_use) in self.indexes.items() if now - last_use > self.index_ttl]
+            overflow = len(self.indexes) - len(stale) - self.max_indexes
+            if overflow > 0:
+                stale += [fingerprint for fingerprint in self.indexes if fingerprint not in stale][:overflow]
+            configs = [self.indexes.pop(fingerprint)[0] for fingerprint in stale]
+
+        for session_id in idle_sessions:
+            self.scheduler.cancel_session(session_id)
+        for config in configs:
+            self.resources.invalidate("corpus_index", config)
+        return len(idle_sessions), len(configs)
+
+    def submit(self, session_id, function, *args, **kwargs):
+        """
+        Queues a job of a session on the scheduler of the server.
+
+        :return: A Future of the result of the job.
+        :raises QueueFullError: If too many jobs are already waiting.
+        """
+        return self.scheduler.submit(session_id, function, *args, **kwargs)
+
+    def submit_quiz(self, session_id, processor, topic, num_questions, **generator_options):
+        """
+        Queues the generation of a quiz for a session: the documents are indexed (once per corpus), then the
+        questions are generated, avoiding those already asked in the session.
+
+        :param session_id: The session requesting the quiz.
+        :param processor: The DocumentProcessor holding the documents of the quiz.
+        :param topic: The topic of the quiz.
+        :param num_questions: The number of questions.
+        :param generator_options: Extra arguments of the QuizGenerator (max_concurrency, context_strategy, llm_backend...).
+        :return: A Future of the list of questions.
+        :raises QueueFullError: If too many quizzes are already waiting.
+        """
+        session = self.session(session_id)
+        chroma_creator = self.index(processor)
+
+        def generate():
+            chroma_creator.create_chroma_collection()
+            fingerprint = chroma_creator.indexed_fingerprint
+            generator = QuizGenerator(topic, num_questions, chroma_creator, question_index=session.question_index(fingerprint),
+                                      corpus_fingerprint=fingerprint, **generator_options)
+            questions = generator.generate_quiz()
+            # With lazy embedding, the rest of the documents is embedded for the next quizzes
+            chroma_creator.embed_remaining_in_background()
+            session.quizzes += 1
+            return questions
+
+        return self.scheduler.submit(session_id, generate)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of sessions and collections held, and the counters of the scheduler.
+        """
+        with self.lock:
+            sessions = len(self.sessions)
+            indexes = len(self.indexes)
+        return {"sessions": sessions, "indexes": indexes, **self.scheduler.stats()}
+
+    def shutdown(self, wait=True):
+        """
+        Cancels the quizzes waiting and stops the workers.
+        """
+        self.scheduler.shutdown(wait=wait, cancel_jobs=True)
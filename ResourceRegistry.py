@@ -0,0 +1,204 @@
+import json
+import threading
+import time
+from EmbeddingClient import EmbeddingClient
+from FakeBackends import FakeLLM
+from LLMCache import LLMResponseCache
+from QuestionLibrary import QuestionLibrary
+from langchain_community.vectorstores import Chroma
+from langchain_google_vertexai import VertexAI
+
+# LLM backends, by name
+LLM_BACKENDS = {"vertex": VertexAI, "fake": FakeLLM}
+
+class ResourceRegistry:
+    """
+    This class holds the expensive resources of the application (embedding client, LLM client, Chroma collections,
+    caches...) once per process, so they are shared across Streamlit reruns and sessions instead of being built again.
+
+    Functionalities:
+    - Returns a single instance per kind of resource and configuration, building it on first use. Two threads asking
+      for the same resource wait for a single construction, while other resources can be built at the same time.
+    - Explicit invalidation of one resource, of every resource of a kind, or of everything, e.g. when credentials
+      or settings change. The next request builds the resource again, while the users of the old instance
+      (e.g. a quiz still being generated) keep it until they finish.
+    - Lifecycle hooks called when a resource is created (with its construction time) and when it is released.
+    - Counts hits and misses, and keeps the construction time of each resource.
+
+    The module-level `registry` is the instance shared by the whole process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resources = {}      # key -> resource
+        self.releasers = {}      # key -> function releasing the resource, or None
+        self.key_locks = {}      # key -> lock held while the resource is built
+        self.build_seconds = {}  # key -> construction time
+        self.key_objects = {}    # key -> objects of the configuration, kept alive so their identity is not reused
+        self.create_hooks = []
+        self.release_hooks = []
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind, config, objects=None) -> tuple:
+        """
+        Builds the key of a resource from its kind and configuration. Objects in the configuration
+        (e.g. an embedding model) are identified by their type and identity. CPython reuses the identity of an object
+        once it is garbage collected, so the registry keeps these objects alive as long as it holds the resource.
+
+        :param kind: The kind of resource, e.g. "llm".
+        :param config: A dictionary of the settings of the resource.
+        :param objects: An optional list, receiving the objects identified in the configuration.
+        :return: A hashable key.
+        """
+        def identify(o):
+            if objects is not None:
+                objects.append(o)
+            return f"{type(o).__name__}@{id(o):x}"
+
+        return kind, json.dumps(config, sort_keys=True, default=identify)
+
+    def get_or_create(self, kind, config, factory, release=None):
+        """
+        Returns the resource of the given kind and configuration, building it with `factory` if needed.
+
+        :param kind: The kind of resource.
+        :param config: A dictionary of the settings of the resource.
+        :param factory: A function without arguments building the resource.
+        :param release: An optional function called with the resource when it is invalidated. Other threads may still
+                        be using the resource then, so it must not break it (e.g. close a connection they share).
+        :return: The shared resource.
+        """
+        objects = []
+        key = self.make_key(kind, config, objects)
+        with self.lock:
+            if key in self.resources:
+                self.hits += 1
+                return self.resources[key]
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        # Building outside of the registry lock, so slow constructions do not block the other resources
+        with key_lock:
+            with self.lock:
+                if key in self.resources:
+                    self.hits += 1
+                    return self.resources[key]
+                self.misses += 1
+            start = time.perf_counter()
+            resource = factory()
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.resources[key] = resource
+                self.releasers[key] = release
+                self.build_seconds[key] = seconds
+                self.key_objects[key] = objects
+                hooks = list(self.create_hooks)
+
+        for hook in hooks:
+            hook(kind, config, resource, seconds)
+        return resource
+
+    def invalidate(self, kind=None, config=None) -> int:
+        """
+        Releases resources, so they are built again on next use.
+
+        :param kind: The kind of resources to release; None releases every resource.
+        :param config: The configuration of the resource to release; None releases every resource of the kind.
+        :return: The number of resources released.
+        """
+        with self.lock:
+            if kind is None:
+                keys = list(self.resources)
+            elif config is None:
+                keys = [key for key in self.resources if key[0] == kind]
+            else:
+                key = self.make_key(kind, config)
+                keys = [key] if key in self.resources else []
+            released = [(key, self.resources.pop(key), self.releasers.pop(key)) for key in keys]
+            for key in keys:
+                self.build_seconds.pop(key, None)
+                self.key_objects.pop(key, None)
+                self.key_locks.pop(key, None)
+            hooks = list(self.release_hooks)
+
+        for (kind_released, _), resource, release in released:
+            if release is not None:
+                try:
+                    release(resource)
+                except Exception as e:
+                    print(f"Failed to release a {kind_released} resource: {e}")
+            for hook in hooks:
+                hook(kind_released, resource)
+        return len(released)
+
+    def on_create(self, hook):
+        """
+        Registers a function called with (kind, config, resource, seconds) each time a resource is built.
+        """
+        with self.lock:
+            self.create_hooks.append(hook)
+
+    def on_release(self, hook):
+        """
+        Registers a function called with (kind, resource) each time a resource is released.
+        """
+        with self.lock:
+            self.release_hooks.append(hook)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counters, and the construction time of each resource held, by kind.
+        """
+        with self.lock:
+            build_seconds = {}
+            for (kind, _), seconds in self.build_seconds.items():
+                build_seconds.setdefault(kind, []).append(seconds)
+            return {"hits": self.hits, "misses": self.misses, "resources": len(self.resources),
+                    "build_seconds": build_seconds}
+
+    def embedding_client(self, **config):
+        """
+        Returns the shared EmbeddingClient for the given settings (model_name, project, location...).
+        """
+        return self.get_or_create("embedding_client", config, lambda: EmbeddingClient(**config))
+
+    def llm(self, backend="vertex", **config):
+        """
+        Returns the shared LLM client for the given backend and settings: model_name, temperature, max_output_tokens,
+        cache... for "vertex", latency, error_rate, seed... for "fake" (see LLM_BACKENDS).
+        """
+        if backend not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {backend}. Expected one of {', '.join(LLM_BACKENDS)}.")
+        return self.get_or_create("llm", {"backend": backend, **config}, lambda: LLM_BACKENDS[backend](**config))
+
+    def chroma_collection(self, collection_name, persist_directory, embedding_function):
+        """
+        Returns the shared opened Chroma collection for the given name, directory and embedding model.
+        """
+        config = {"collection_name": collection_name, "persist_directory": persist_directory,
+                  "embedding_function": embedding_function}
+        return self.get_or_create("chroma_collection", config, lambda: Chroma(
+            collection_name=collection_name,
+            embedding_function=embedding_function,
+            persist_directory=persist_directory))
+
+    def llm_cache(self, **config):
+        """
+        Returns the shared LLMResponseCache for the given settings.
+        """
+        # The SQLite connection is not closed on invalidation, since LLM clients still running may use the cache;
+        # it is closed when the last of them drops the cache
+        return self.get_or_create("llm_cache", config, lambda: LLMResponseCache(**config))
+
+    def question_library(self, embed_model=None, **config):
+        """
+        Returns the shared QuestionLibrary for the given embedding model and settings.
+        """
+        # Like the LLM cache, the library stays open for the generators still using it after an invalidation
+        return self.get_or_create("question_library", {"embed_model": embed_model, **config},
+                                  lambda: QuestionLibrary(embed_model, **config))
+
+
+# Instance shared by the whole process (Streamlit keeps imported modules across reruns and sessions)
+registry = ResourceRegistry()
@@ -0,0 +1,81 @@
+import io
+import random
+
+"""
+Generated PDF documents, used by the benchmarks and the tests in place of real uploads.
+"""
+
+WORDS = (
+    "cell membrane protein energy enzyme reaction molecule structure function system process "
+    "signal receptor gene expression transport channel gradient pathway metabolism synthesis "
+    "oxygen carbon water light nucleus organelle division growth response regulation balance"
+).split()
+
+SYLLABLES = "ba be bi bo bu da de di do du ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru".split()
+
+
+class InMemoryUpload(io.BytesIO):
+    """
+    Stands in for a Streamlit UploadedFile: a bytes buffer with a file name.
+    """
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def make_pdf(num_pages, lines_per_page=40, words_per_line=10, seed=0) -> bytes:
+    """
+    Generates a PDF with the given number of pages of random text, using only the PDF syntax (no dependencies).
+
+    :param num_pages: The number of pages in the document.
+    :param lines_per_page: The number of text lines on each page.
+    :param words_per_line: The number of words on each line.
+    :param seed: The seed of the random text, so the same arguments always produce the same file.
+    :return: The content of the PDF file.
+    """
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages object, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for _ in range(num_pages):
+        # Each page mixes common words with its own key terms, so that pages are distinguishable
+        page_terms = ["".join(rng.choice(SYLLABLES) for _ in range(3)) for _ in range(20)]
+        vocabulary = WORDS + page_terms
+        lines = [" ".join(rng.choice(vocabulary) for _ in range(words_per_line)) for _ in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 14 TL 50 780 Td " + " T* ".join(f"({line}) Tj" for line in lines) + " ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % ref for ref in page_refs)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, num_pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+    return out.getvalue()
+
+
+def make_uploads(num_files, pages_per_file):
+    """
+    Generates a list of in-memory PDF uploads.
+    """
+    return [
+        InMemoryUpload(f"doc_{i}.pdf", make_pdf(pages_per_file, seed=i))
+        for i in range(num_files)
+    ]
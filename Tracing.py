@@ -0,0 +1,344 @@
+import json
+import os
+import secrets
+import threading
+import time
+import streamlit as st
+from langchain_core.callbacks import BaseCallbackHandler
+
+class Span:
+    """
+    A timed stage of the pipeline. Used as a context manager (`with tracer.span("stage"):`), it becomes the parent
+    of the spans opened inside it on the same thread; `tracer.start_span` returns one that is ended explicitly.
+    """
+
+    __slots__ = ("tracer", "name", "attributes", "trace_id", "span_id", "parent_id", "start", "start_ns", "end_ns",
+                 "status")
+
+    def __init__(self, tracer, name, attributes, parent=None):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "OK"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + int((time.perf_counter() - self.start) * 1e9)
+        if error is not None:
+            self.status = "ERROR"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        self.tracer._record(self)
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.end(exc)
+        return False
+
+
+class _NoopSpan:
+    """
+    The span returned while tracing is disabled: every operation does nothing.
+    """
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    This class records where the time of the pipeline goes: spans around each stage (PDF parsing, splitting,
+    embedding and indexing, retrieval, prompt rendering, LLM calls, parsing and validation), and counters
+    (tokens, cache hits, retries...).
+
+    Functionalities:
+    - `span(name, **attributes)` times a stage; spans opened inside another one on the same thread are its children.
+    - `count(name, value)` increments a counter.
+    - `callbacks()` returns a LangChain callback handler recording the retrieval, prompt, LLM and parser steps of
+      the chains, with the token counts of the LLM calls.
+    - Exports the records as JSON, or as OpenTelemetry (OTLP/JSON) spans, and summarizes the time per stage.
+    - When disabled, spans and counters are no-ops and no callback is attached, so the overhead is negligible.
+
+    Parameters:
+    - enabled: Whether to record anything.
+    - max_spans: The maximum number of spans kept; the oldest ones are dropped beyond it.
+    """
+
+    def __init__(self, enabled=False, max_spans=10_000):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = []
+        self.counters = {}
+
+    def _stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def current_span(self):
+        """
+        Returns the innermost span opened with `with` on this thread, or None.
+        """
+        stack = getattr(self.local, "stack", None)
+        return stack[-1] if stack else None
+
+    def span(self, name, **attributes):
+        """
+        Returns a span to use as a context manager around a stage.
+
+        :param name: The name of the stage, e.g. "llm.call".
+        :param attributes: Extra information on the stage (file name, number of chunks...).
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes, parent=self.current_span())
+
+    def start_span(self, name, parent=None, **attributes):
+        """
+        Starts a span ended explicitly with its `end` method, e.g. around the body of a generator.
+
+        :param name: The name of the stage.
+        :param parent: The parent span; defaults to the current span of the thread.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes, parent=parent if isinstance(parent, Span) else self.current_span())
+
+    def count(self, name, value=1):
+        """
+        Increments a counter.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _record(self, span):
+        with self.lock:
+            self.spans.append(span)
+            if len(self.spans) > self.max_spans:
+                del self.spans[:len(self.spans) - self.max_spans]
+
+    def callbacks(self) -> list:
+        """
+        Returns the LangChain callbacks to pass in the config of a chain, or an empty list when disabled.
+        """
+        return [TracingCallbackHandler(self)] if self.enabled else []
+
+    def reset(self):
+        """
+        Drops the recorded spans and counters.
+        """
+        with self.lock:
+            self.spans = []
+            self.counters = {}
+
+    def records(self) -> list:
+        """
+        Returns the recorded spans as dictionaries, in the order they ended.
+        """
+        with self.lock:
+            spans = list(self.spans)
+        return [{
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "start_time_unix_nano": span.start_ns,
+            "end_time_unix_nano": span.end_ns,
+            "duration_ms": (span.end_ns - span.start_ns) / 1e6,
+            "status": span.status,
+            "attributes": dict(span.attributes),
+        } for span in spans]
+
+    def summary(self) -> dict:
+        """
+        Returns, for each stage, the number of spans and their total, mean and maximum duration in milliseconds.
+        """
+        stages = {}
+        for record in self.records():
+            stage = stages.setdefault(record["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            stage["count"] += 1
+            stage["total_ms"] += record["duration_ms"]
+            stage["max_ms"] = max(stage["max_ms"], record["duration_ms"])
+            stage["errors"] += record["status"] == "ERROR"
+        for stage in stages.values():
+            stage["mean_ms"] = stage["total_ms"] / stage["count"]
+        return stages
+
+    def to_json(self) -> str:
+        """
+        Returns the spans and the counters as a JSON document.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        return json.dumps({"spans": self.records(), "counters": counters}, default=str)
+
+    def to_otel(self, service_name="gemini-quizify") -> dict:
+        """
+        Returns the spans in the OpenTelemetry OTLP/JSON format, with the counters as attributes of the resource.
+        """
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = [{
+            "traceId": record["trace_id"],
+            "spanId": record["span_id"],
+            "parentSpanId": record["parent_id"] or "",
+            "name": record["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(record["start_time_unix_nano"]),
+            "endTimeUnixNano": str(record["end_time_unix_nano"]),
+            "attributes": [attribute(key, value) for key, value in record["attributes"].items()],
+            "status": {"code": 2 if record["status"] == "ERROR" else 1},
+        } for record in self.records()]
+        with self.lock:
+            counters = dict(self.counters)
+        resource = [attribute("service.name", service_name)] + [
+            attribute(f"counter.{name}", value) for name, value in counters.items()]
+        return {"resourceSpans": [{
+            "resource": {"attributes": resource},
+            "scopeSpans": [{"scope": {"name": "quizify"}, "spans": spans}],
+        }]}
+
+    def save(self, path, otel=False):
+        """
+        Saves the records to a JSON file, in the OpenTelemetry format if `otel` is True.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            if otel:
+                json.dump(self.to_otel(), f)
+            else:
+                f.write(self.to_json())
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler turning the steps of a chain into spans of the Tracer: "retrieval" for retrievers,
+    "prompt.render" for prompt templates, "llm.call" for the LLM (with its token counts), and "parse" for the
+    output parser.
+    """
+
+    # Names of the chain steps timed, by the name LangChain gives them
+    CHAIN_STAGES = {"PromptTemplate": "prompt.render", "parse": "parse", "parse_batch": "parse"}
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.runs = {}
+
+    def _start(self, stage, run_id, parent_run_id, **attributes):
+        parent = self.runs.get(parent_run_id)
+        self.runs[run_id] = self.tracer.start_span(stage, parent=parent, **attributes)
+
+    def _end(self, run_id, error=None):
+        span = self.runs.pop(run_id, None)
+        if span is not None:
+            span.end(error)
+        return span
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start("retrieval", run_id, parent_run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        span = self.runs.get(run_id)
+        if span is not None:
+            span.set_attribute("documents", len(documents))
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        stage = self.CHAIN_STAGES.get(kwargs.get("name"))
+        if stage is not None:
+            self._start(stage, run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start("llm.call", run_id, parent_run_id)
+        # Rough estimate (4 characters per token), replaced by the counts of the model when it reports them
+        self.runs[run_id].set_attribute("prompt_tokens", sum(len(prompt) for prompt in prompts) // 4)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self.runs.get(run_id)
+        if span is None:
+            return
+        completion = sum(len(generation.text) for generations in response.generations for generation in generations) // 4
+        usage = (response.llm_output or {}).get("usage_metadata") or {}
+        prompt_tokens = usage.get("prompt_token_count", span.attributes.get("prompt_tokens", 0))
+        completion_tokens = usage.get("candidates_token_count", completion)
+        span.set_attribute("prompt_tokens", prompt_tokens)
+        span.set_attribute("completion_tokens", completion_tokens)
+        self.tracer.count("llm.calls")
+        self.tracer.count("llm.prompt_tokens", prompt_tokens)
+        self.tracer.count("llm.completion_tokens", completion_tokens)
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.tracer.count("llm.errors")
+        self._end(run_id, error)
+
+
+def render_debug_panel(tracer):
+    """
+    Shows the time per stage, the counters and the recent spans of the tracer in a Streamlit expander,
+    with a download of the records.
+    """
+    with st.expander("Debug: pipeline timings", expanded=False):
+        if not tracer.enabled:
+            st.write("Tracing is disabled.")
+            return
+        summary = tracer.summary()
+        st.table([{"stage": name, "count": stage["count"], "total ms": round(stage["total_ms"], 1),
+                   "mean ms": round(stage["mean_ms"], 1), "max ms": round(stage["max_ms"], 1), "errors": stage["errors"]}
+                  for name, stage in sorted(summary.items(), key=lambda item: -item[1]["total_ms"])])
+        with tracer.lock:
+            counters = dict(tracer.counters)
+        st.json(counters)
+        st.download_button("Download trace (OpenTelemetry JSON)", json.dumps(tracer.to_otel()),
+                           file_name="quizify-trace.json", mime="application/json")
+
+
+# Tracer shared by the whole pipeline and every session of the process, enabled with the QUIZIFY_TRACING=1 environment variable
+tracer = Tracer(enabled=os.environ.get("QUIZIFY_TRACING") == "1")
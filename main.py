@@ -2,12 +2,16 @@ import streamlit as st
 import os
 import sys
 import json
+import uuid
 sys.path.append(os.path.abspath('../../'))
 from DocumentProcessor import DocumentProcessor
-from EmbeddingClient import EmbeddingClient
-from ChromaCollectionCreator import ChromaCollectionCreator
-from QuizGenerator import QuizGenerator
 from QuizManager import QuizManager
+from ResourceRegistry import registry
+from QuestionProducer import QuestionProducer
+from QuizServer import QuizServer
+from JobScheduler import QueueFullError
+from OutputRepair import is_repairable
+from Tracing import tracer, render_debug_panel
 
 
 if __name__ == "__main__":
@@ -15,9 +19,17 @@ if __name__ == "__main__":
     embed_config = {
         "model_name": "textembedding-gecko@003",
         "project": "gemini-quizzify-427807",
-        "location": "us-central1"
+        "location": "us-central1",
+        # QUIZIFY_BACKEND=fake runs the app without Google Cloud, with the fake embedding model and LLM (see FakeBackends)
+        "backend": os.environ.get("QUIZIFY_BACKEND", "vertex")
     }
     
+    # Optional debug panel with the time spent in each stage of the pipeline
+    # The tracer is shared by every session of the process, so it is only enabled with QUIZIFY_TRACING=1, not from a widget
+    if tracer.enabled:
+        with st.sidebar:
+            render_debug_panel(tracer)
+    
     
     
     # Add Session State
@@ -29,18 +41,56 @@ if __name__ == "__main__":
         screen = st.empty()
         with screen.container():
             st.header("Quiz Builder")
+            st.write("Select PDFs for Ingestion, the topic for the quiz, and click Generate!")
             
-            # Creating aa new st.form flow control for Data Ingestion
-            with st.form("Load Data to Chroma"):
-                st.write("Select PDFs for Ingestion, the topic for the quiz, and click Generate!")
-                
-                processor = DocumentProcessor()
-                processor.ingest_documents()
+            # The uploader sits outside of the form, so the documents are indexed in the background as soon as they are uploaded
+            # The files are parsed by the indexing, which embeds the first pages while the next ones are parsed
+            processor = DocumentProcessor()
+            processor.ingest_documents(defer_parsing=True)
+        
+            # The embedding client is built once per process and shared by every rerun and session
+            embed_client = registry.embedding_client(**embed_config)
             
-                embed_client = EmbeddingClient(**embed_config) 
+            # The sessions of the process share one server: one index per set of documents, and a fair queue of quizzes
+            # QUIZIFY_VECTORSTORE=numpy keeps the collections in memory instead of Chroma, faster for a handful of documents
+            vectorstore_backend = os.environ.get("QUIZIFY_VECTORSTORE", "chroma")
+            # QUIZIFY_LAZY_EMBEDDING=1 only embeds the chunks relevant to the topic before the first question, for large uploads
+            lazy_embedding = os.environ.get("QUIZIFY_LAZY_EMBEDDING") == "1"
+            # QUIZIFY_RETRIEVAL=hybrid fuses the vector search with a BM25 ranking of the chunks
+            retrieval = os.environ.get("QUIZIFY_RETRIEVAL", "vector")
+            # QUIZIFY_QUANTIZATION=int8 (or float16) searches a compact, memory-mapped copy of each collection, shared by the processes
+            quantization = os.environ.get("QUIZIFY_QUANTIZATION") or None
+            server = registry.get_or_create("quiz_server", {"embed_model": embed_client, "vectorstore_backend": vectorstore_backend,
+                                                            "lazy_embedding": lazy_embedding, "quantization": quantization},
+                                            lambda: QuizServer(embed_client, vectorstore_backend=vectorstore_backend,
+                                                               lazy_embedding=lazy_embedding, quantization=quantization),
+                                            release=lambda server: server.shutdown(wait=False))
+            session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
             
-                chroma_creator = ChromaCollectionCreator(processor, embed_client)
-                
+            # Keeping one background producer per set of documents, and cancelling it when the uploads change
+            corpus_fingerprint = processor.corpus_fingerprint() if processor.file_hashes else None
+            producer = st.session_state.get("producer")
+            if producer is None or producer.corpus_fingerprint != corpus_fingerprint:
+                if producer is not None:
+                    producer.cancel()
+                producer = None
+                if corpus_fingerprint is not None:
+                    # Sessions uploading the same documents share their collection, which is only indexed once
+                    chroma_creator = server.index(processor)
+                    producer = QuestionProducer(chroma_creator, corpus_fingerprint=corpus_fingerprint,
+                                                scheduler=server.scheduler, session_id=session_id)
+                    producer.start_indexing()
+                st.session_state["producer"] = producer
+            
+            # The indexing runs in the background: its outcome is shown on the next run of the script
+            if producer is not None and producer.indexed.is_set():
+                if producer.error is not None:
+                    st.error(f"Failed to index the documents: {producer.error}", icon="🚨")
+                elif producer.index_status:
+                    st.success(producer.index_status, icon="✅")
+            
+            # Creating aa new st.form flow control for the quiz settings
+            with st.form("Load Data to Chroma"):
                 # Setting topic input and number of questions
                 topic_input = st.text_input("Topic for Generative Quiz", placeholder="Enter the topic of the document")
                 questions = st.slider("Number of Questions", min_value=1, max_value=10, value=1)
@@ -49,17 +99,44 @@ if __name__ == "__main__":
                 submitted = st.form_submit_button("Submit")
                 
                 if submitted:
-                    chroma_creator.create_chroma_collection()
+                    if producer is None:
+                        st.error("No documents found!", icon="🚨")
+                        st.stop()
                         
-                    if len(processor.pages) > 0:
-                        st.write(f"Generating {questions} questions for topic: {topic_input}")
+                    st.write(f"Generating {questions} questions for topic: {topic_input}")
+                    
+                    # A previous Submit may have been interrupted by a rerun while its quiz was being generated: starting over
+                    if producer.generator is not None:
+                        producer = producer.restart()
+                        st.session_state["producer"] = producer
+                    
+                    # Keeping one near-duplicate index per set of documents, so a new quiz does not repeat the questions of the previous ones
+                    question_index = server.session(session_id).question_index(corpus_fingerprint)
+                    
+                    # Reusing the stored responses for prompts already sent, e.g. the same handbook and topic; outputs with no JSON are not stored
+                    llm_cache = registry.llm_cache(is_cacheable=is_repairable)
                     
-                    # Initializing a QuizGenerator class using the topic, number of questrions, and the chroma collection
-                    generator = QuizGenerator(topic_input, questions, chroma_creator) 
-                    question_bank = generator.generate_quiz() #getting the question bank
+                    # Serving the questions already generated by other users on the same documents and a similar topic first
+                    library = registry.question_library(embed_client)
+                    
+                    # The questions are generated in the background, in parallel, and each question gets its own slice of the documents, to avoid duplicate questions
+                    try:
+                        producer.start_generation(topic_input, questions, max_concurrency=questions, context_strategy="mmr", question_index=question_index,
+                                                  llm_cache=llm_cache, library=library, corpus_fingerprint=corpus_fingerprint,
+                                                  llm_backend=embed_config["backend"], retrieval=retrieval)
+                    except QueueFullError:
+                        st.error("Too many quizzes are being generated right now, please try again in a moment.", icon="🚨")
+                        st.stop()
+                    
+                    # Showing the quiz as soon as the first question is ready, the others are consumed from the producer while the user answers
+                    first_question = producer.wait_for_question()
+                    if first_question is None:
+                        st.error(f"Failed to generate the quiz: {producer.error}", icon="🚨")
+                        st.session_state["producer"] = None
+                        st.stop()
                     
                     # Initializing the question bank list in st.session_state
-                    st.session_state["question_bank"] = question_bank
+                    st.session_state["question_bank"] = [first_question]
 
                     # Setting a display_quiz flag in st.session_state to True
                     if "display_quiz" not in st.session_state:
@@ -79,12 +156,25 @@ if __name__ == "__main__":
         st.empty()
         with st.container():
             st.header("Generated Quiz Question: ")
-            quiz_manager = QuizManager(question_bank)
+            # Appending the questions produced in the background since the last run
+            quiz_manager = QuizManager(question_bank, source=st.session_state.get("producer"))
+            if not quiz_manager.is_complete:
+                pending = quiz_manager.pending_questions
+                st.caption(f"{quiz_manager.total_questions} questions ready" + (f", {pending} more being generated" if pending else ", more being generated"))
+                
+            # Setting index_question using the Quiz Manager method get_question_at_index passing the st.session_state["question_index"]
+            index_question = quiz_manager.get_question_at_index(st.session_state["question_index"])
+            if index_question is None:
+                # The user moved past the last question received: waiting for the next one to be generated
+                with st.spinner(f"Generating question {st.session_state['question_index'] + 1}..."):
+                    index_question = quiz_manager.wait_for_question_at_index(st.session_state["question_index"])
+                if index_question is None:
+                    # The generation ended without this question, going back to the first one
+                    st.session_state["question_index"] = 0
+                    index_question = quiz_manager.get_question_at_index(0)
                 
             # Format the question and display it
             with st.form("MCQ"):
-                # Setting index_question using the Quiz Manager method get_question_at_index passing the st.session_state["question_index"]
-                index_question = quiz_manager.get_question_at_index(st.session_state["question_index"])                   
 
                 # Unpacking choices for radio button
                 choices = []
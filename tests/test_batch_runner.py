@@ -0,0 +1,43 @@
+import json
+
+from BatchRunner import BatchQuizRunner
+from SampleDocuments import make_pdf
+
+
+def make_runner(tmp_path):
+    return BatchQuizRunner(
+        str(tmp_path / "pdfs"), ["photosynthesis", "cell division"], output_path=str(tmp_path / "quizzes.jsonl"),
+        num_questions=2, workers=1, index_dir=str(tmp_path / "index"),
+        embed_config={"model_name": "batch-test", "backend": "fake"},
+        generator_options={"max_concurrency": 2, "llm_backend": "fake"})
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_a_rerun_skips_the_completed_quizzes_and_retries_the_failed_ones(monkeypatch, tmp_path):
+    # The page, embedding and LLM caches are created in the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pdfs").mkdir()
+    (tmp_path / "pdfs" / "biology.pdf").write_bytes(make_pdf(3, seed=1))
+    (tmp_path / "pdfs" / "broken.pdf").write_bytes(b"not a pdf")
+
+    summary = make_runner(tmp_path).run()
+    records = read_records(tmp_path / "quizzes.jsonl")
+
+    assert summary["quizzes"] == 2 and summary["failures"] == 2
+    assert all(record["questions"] and not record["error"] for record in records if record["file"] == "biology.pdf")
+    assert all(record["error"] for record in records if record["file"] == "broken.pdf")
+
+    # Fixing the broken file: only its quizzes are generated again
+    (tmp_path / "pdfs" / "broken.pdf").write_bytes(make_pdf(2, seed=2))
+    runner = make_runner(tmp_path)
+    assert [(file_name, topics) for _, file_name, topics, _ in runner.plan()] == \
+        [("broken.pdf", ["photosynthesis", "cell division"])]
+
+    summary = runner.run()
+    assert summary["documents"] == 1 and summary["quizzes"] == 2 and summary["failures"] == 0
+    assert len(read_records(tmp_path / "quizzes.jsonl")) == 6
+    assert make_runner(tmp_path).plan() == []
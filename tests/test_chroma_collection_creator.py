@@ -0,0 +1,69 @@
+import pytest
+
+from ChromaCollectionCreator import ChromaCollectionCreator
+from DocumentProcessor import DocumentProcessor
+from FakeBackends import FakeEmbeddings
+from SampleDocuments import InMemoryUpload, make_pdf
+
+
+def index(uploads, embed_model, directory, **options):
+    processor = DocumentProcessor(use_page_cache=False)
+    processor.process_files(uploads)
+    creator = ChromaCollectionCreator(processor, embed_model, persist_directory=directory, **options)
+    creator.create_chroma_collection()
+    return creator
+
+
+def test_only_new_chunks_are_embedded_whatever_their_file_name(tmp_path):
+    embed_model = FakeEmbeddings(dimensions=32)
+    first = InMemoryUpload("first.pdf", make_pdf(3, seed=1))
+    second = InMemoryUpload("second.pdf", make_pdf(3, seed=2))
+    creator = index([first], embed_model, str(tmp_path), collection_name="shared")
+    embedded = embed_model.texts_embedded
+
+    # The same content under another name, then a new document
+    index([InMemoryUpload("renamed.pdf", first.getvalue())], embed_model, str(tmp_path), collection_name="shared")
+    assert embed_model.texts_embedded == embedded
+    creator = index([first, second], embed_model, str(tmp_path), collection_name="shared")
+
+    assert 0 < embed_model.texts_embedded - embedded < len(creator.db.get(include=[])["ids"])
+    assert "0 removed" in creator.status
+
+
+def test_removed_documents_are_pruned_by_chunk_id(tmp_path):
+    embed_model = FakeEmbeddings(dimensions=32)
+    first = InMemoryUpload("first.pdf", make_pdf(3, seed=1))
+    second = InMemoryUpload("second.pdf", make_pdf(3, seed=2))
+    index([first, second], embed_model, str(tmp_path), collection_name="single", prune_removed=True)
+    creator = index([second], embed_model, str(tmp_path), collection_name="single", prune_removed=True)
+
+    ids = set(creator.db.get(include=[])["ids"])
+    assert ids == {creator.chunk_id(chunk) for chunk in creator.chunks}
+    assert {metadata["source"] for metadata in creator.db.get()["metadatas"]} == {"second.pdf"}
+
+
+def test_each_corpus_gets_its_own_collection_by_default(tmp_path):
+    embed_model = FakeEmbeddings(dimensions=32)
+    first = InMemoryUpload("first.pdf", make_pdf(3, seed=1))
+    second = InMemoryUpload("second.pdf", make_pdf(3, seed=2))
+    creator = index([first], embed_model, str(tmp_path))
+    first_collection = creator.opened_collection_name
+
+    creator.processor = DocumentProcessor(use_page_cache=False)
+    creator.processor.process_files([second])
+    creator.create_chroma_collection()
+
+    assert creator.opened_collection_name != first_collection
+    assert {metadata["source"] for metadata in creator.db.get()["metadatas"]} == {"second.pdf"}
+
+
+def test_the_ingestion_pipeline_writes_its_vectors_to_the_chroma_collection(tmp_path):
+    embed_model = FakeEmbeddings(dimensions=32)
+    processor = DocumentProcessor(use_page_cache=False)
+    processor.defer_files([InMemoryUpload("first.pdf", make_pdf(3, seed=1))])
+    creator = ChromaCollectionCreator(processor, embed_model, persist_directory=str(tmp_path))
+    creator.create_chroma_collection()
+
+    stored = creator.db.get(include=["embeddings", "documents"])
+    assert len(stored["ids"]) == embed_model.texts_embedded > 0
+    assert list(stored["embeddings"][0]) == pytest.approx(embed_model._vector(stored["documents"][0]), abs=1e-6)
@@ -0,0 +1,59 @@
+import pytest
+from langchain_core.documents import Document
+
+from ContextScheduler import ContextScheduler
+from FakeBackends import FakeEmbeddings
+from LexicalIndex import LexicalIndex
+from NumpyVectorStore import NumpyVectorStore
+
+TEXTS = [f"cell membrane fact {i} transport protein {i % 5}" for i in range(40)]
+
+
+def make_store(texts=TEXTS):
+    return NumpyVectorStore.from_texts(texts, FakeEmbeddings(dimensions=32), ids=[str(i) for i in range(len(texts))])
+
+
+@pytest.mark.parametrize("strategy", ["mmr", "partition"])
+def test_each_question_gets_its_own_slice(strategy):
+    scheduler = ContextScheduler(make_store(), "cell membrane", chunks_per_question=3, strategy=strategy)
+    scheduler.plan(4, num_spare_slots=2)
+
+    contexts = [scheduler.next_context(slot) for slot in range(4)]
+    texts = [document.page_content for context in contexts for document in context]
+
+    assert all(len(context) == 3 for context in contexts)
+    assert len(set(texts)) == len(texts)
+
+
+def test_retries_use_the_spare_slices_then_the_other_slices():
+    scheduler = ContextScheduler(make_store(), "cell membrane", chunks_per_question=2)
+    scheduler.plan(2, num_spare_slots=1)
+    first = scheduler.next_context(0)
+    other = scheduler.next_context(1)
+
+    spare = scheduler.next_context(0)
+    assert spare not in (first, other)
+    assert scheduler.next_context(0) in (first, other)
+
+
+def test_a_small_corpus_fills_every_slice():
+    scheduler = ContextScheduler(make_store(TEXTS[:2]), "cell membrane", chunks_per_question=2)
+    scheduler.plan(5)
+
+    assert all(scheduler.next_context(slot) for slot in range(5))
+
+
+def test_the_pool_is_fused_with_the_lexical_ranking():
+    lexical_index = LexicalIndex([Document(page_content=text) for text in TEXTS])
+    scheduler = ContextScheduler(make_store(), "fact 17", chunks_per_question=2, strategy="partition",
+                                 lexical_index=lexical_index)
+    scheduler.plan(3)
+    contexts = [scheduler.next_context(slot) for slot in range(3)]
+
+    assert all(len(context) == 2 for context in contexts)
+    assert TEXTS[17] in [document.page_content for context in contexts for document in context]
+
+
+def test_an_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        ContextScheduler(make_store(), "cell membrane", strategy="random")
@@ -0,0 +1,68 @@
+import DocumentProcessor as DocumentProcessor_module
+from SampleDocuments import InMemoryUpload, make_pdf, make_uploads
+from DocumentProcessor import DocumentProcessor
+from PageCache import PageCache
+
+
+def test_a_file_failing_halfway_is_reported_and_its_pages_discarded(monkeypatch, tmp_path):
+    processor = DocumentProcessor(page_cache=PageCache(cache_dir=str(tmp_path)))
+    good, bad = make_uploads(2, 3)
+    iter_pages = processor.iter_pages
+
+    def failing_iter_pages(source, file_name=None):
+        pages = iter_pages(source, file_name)
+        if file_name == bad.name:
+            yield next(pages)
+            raise ValueError("truncated file")
+        yield from pages
+
+    monkeypatch.setattr(processor, "iter_pages", failing_iter_pages)
+    streamed = list(processor.stream_documents([good, bad]))
+
+    # The page of the bad file was yielded before the failure; the consumer drops it
+    assert len(streamed) == 4
+    assert processor.errors == [(bad.name, "truncated file")]
+    assert processor.failed_files() == {bad.name}
+    assert len(processor.file_hashes) == 1
+    assert processor.page_cache.get(PageCache.hash_file(good)) is not None
+    assert processor.page_cache.get(PageCache.hash_file(bad)) is None
+
+    processor.process_files([good, bad])
+    assert {page.metadata["source"] for page in processor.pages} == {good.name}
+    assert len(processor.pages) == 3
+
+
+def test_the_first_page_is_yielded_before_the_rest_of_the_file_is_parsed(monkeypatch, tmp_path):
+    processor = DocumentProcessor(page_cache=PageCache(cache_dir=str(tmp_path)))
+    upload = InMemoryUpload("large.pdf", make_pdf(200))
+    extracted = []
+    split_page = DocumentProcessor_module._split_page
+
+    def counting_split_page(reader, file_name, index):
+        extracted.append(index)
+        return split_page(reader, file_name, index)
+
+    monkeypatch.setattr(DocumentProcessor_module, "_split_page", counting_split_page)
+    pages = processor.stream_documents([upload])
+
+    first_page = next(pages)
+    assert first_page.metadata["page"] == 0
+    assert extracted == [0]
+    assert processor.page_cache.get(PageCache.hash_file(upload)) is None
+
+    rest = list(pages)
+    assert len(extracted) == 200
+    assert len(processor.page_cache.get(PageCache.hash_file(upload))) == len(rest) + 1
+
+
+def test_deferred_files_are_fingerprinted_before_being_parsed():
+    processor = DocumentProcessor(use_page_cache=False)
+    uploads = make_uploads(2, 2)
+    processor.defer_files(uploads)
+    fingerprint = processor.corpus_fingerprint()
+
+    processor.pages.extend(processor.stream_documents(processor.take_pending_files()))
+
+    assert len(processor.pages) == 4
+    assert processor.pending_files == []
+    assert processor.corpus_fingerprint() == fingerprint
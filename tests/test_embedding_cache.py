@@ -0,0 +1,45 @@
+from EmbeddingCache import EmbeddingCache
+from EmbeddingClient import EmbeddingClient
+
+
+def test_vectors_round_trip_and_whitespace_shares_a_key(tmp_path):
+    cache = EmbeddingCache(cache_path=str(tmp_path / "embeddings.sqlite3"))
+    key = EmbeddingCache.make_key("model", "document", "cell  membrane\n")
+    cache.put_many([(key, [0.25, -0.5, 1.0])])
+
+    assert EmbeddingCache.make_key("model", "document", "cell membrane") == key
+    assert EmbeddingCache.make_key("model", "query", "cell membrane") != key
+    assert cache.get_many([key, "missing"]) == {key: [0.25, -0.5, 1.0]}
+
+
+def test_the_least_recently_used_vectors_are_evicted(tmp_path):
+    cache = EmbeddingCache(cache_path=str(tmp_path / "embeddings.sqlite3"), max_entries=2)
+    cache.put_many([("a", [1.0])])
+    cache.put_many([("b", [2.0])])
+    cache.get_many(["a"])
+    cache.put_many([("c", [3.0])])
+
+    assert len(cache) == 2
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_the_client_only_embeds_the_texts_missing_from_the_cache(tmp_path):
+    cache = EmbeddingCache(cache_path=str(tmp_path / "embeddings.sqlite3"))
+    client = EmbeddingClient("model", backend="fake", cache=cache, backend_options={"dimensions": 16})
+    first = client.embed_documents(["mitochondria", "ribosome"])
+    second = client.embed_documents(["ribosome", "nucleus", "mitochondria"])
+
+    assert second[0] == first[1] and second[2] == first[0]
+    assert client.client.texts_embedded == 3
+    assert client.cache_stats()["hits"] == 2
+
+
+def test_two_connections_to_the_same_file_see_each_others_writes(tmp_path):
+    # As two worker processes of the BatchRunner do
+    path = str(tmp_path / "embeddings.sqlite3")
+    first, second = EmbeddingCache(cache_path=path), EmbeddingCache(cache_path=path)
+    first.put_many([("a", [1.0])])
+    second.put_many([("b", [2.0])])
+
+    assert first.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert first.get_many(["a", "b"]) == second.get_many(["a", "b"]) == {"a": [1.0], "b": [2.0]}
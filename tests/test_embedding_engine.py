@@ -0,0 +1,49 @@
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from EmbeddingEngine import EmbeddingEngine, TokenBucket
+from FakeBackends import FakeEmbeddings
+
+
+def test_throttled_batches_are_retried_and_keep_their_order():
+    embedder = FakeEmbeddings(dimensions=16, throttle_rate=0.3, seed=1)
+    engine = EmbeddingEngine(embedder.embed_documents, batch_size=3, max_concurrency=4,
+                             max_retries=20, initial_backoff=0.001, max_backoff=0.01)
+    texts = [f"chunk number {i}" for i in range(40)]
+
+    vectors = engine.embed(texts)
+
+    assert vectors == [embedder._vector(text) for text in texts]
+    assert engine.stats()["throttled"] > 0
+    assert engine.stats()["requests"] == 14 + engine.stats()["throttled"]
+
+
+def test_a_batch_still_throttled_after_the_last_retry_raises():
+    embedder = FakeEmbeddings(dimensions=16, throttle_rate=1.0)
+    engine = EmbeddingEngine(embedder.embed_documents, max_retries=2, initial_backoff=0.001)
+
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        engine.embed(["cell membrane"])
+    assert engine.stats() == {"requests": 3, "throttled": 2}
+
+
+def test_other_errors_are_not_retried():
+    def failing(texts):
+        raise ValueError("bad request")
+
+    engine = EmbeddingEngine(failing, initial_backoff=0.001)
+    with pytest.raises(ValueError):
+        engine.embed(["cell membrane"])
+    assert engine.stats()["requests"] == 1
+
+
+def test_the_token_bucket_limits_the_rate_after_the_burst():
+    bucket = TokenBucket(rate=50, capacity=5)
+    start = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+
+    # The 5 tokens of the burst are free, the next 10 come at 50 per second
+    assert time.monotonic() - start >= 0.18
@@ -0,0 +1,19 @@
+from langchain_core.documents import Document
+
+from HybridRetriever import HybridRetriever
+
+
+def chunk(source, text):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_fuse_favours_chunks_ranked_by_both_rankings():
+    retriever = HybridRetriever(vectorstore=None, lexical_index=None, k=2)
+    a, b, c = chunk("s", "a"), chunk("s", "b"), chunk("s", "c")
+    assert retriever.fuse([a, b, c], [b]) == [b, a]
+
+
+def test_fuse_matches_chunks_on_source_and_content():
+    retriever = HybridRetriever(vectorstore=None, lexical_index=None, k=4)
+    fused = retriever.fuse([chunk("s", "a")], [chunk("s", "a"), chunk("t", "a")])
+    assert [(document.metadata["source"], document.page_content) for document in fused] == [("s", "a"), ("t", "a")]
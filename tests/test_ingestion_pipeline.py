@@ -0,0 +1,63 @@
+import time
+
+from ChromaCollectionCreator import ChromaCollectionCreator
+from DocumentProcessor import DocumentProcessor
+from FakeBackends import FakeEmbeddings
+from IngestionPipeline import IngestionPipeline
+from SampleDocuments import InMemoryUpload, make_pdf, make_uploads
+
+
+def make_creator(tmp_path, **options):
+    processor = DocumentProcessor(use_page_cache=False)
+    return ChromaCollectionCreator(processor, FakeEmbeddings(dimensions=32), persist_directory=str(tmp_path),
+                                   backend="numpy", **options)
+
+
+def test_the_chunks_of_a_file_failing_halfway_are_deleted(monkeypatch, tmp_path):
+    creator = make_creator(tmp_path)
+    good, bad = make_uploads(2, 6)
+    iter_pages = creator.processor.iter_pages
+
+    def failing_iter_pages(source, file_name=None):
+        pages = iter_pages(source, file_name)
+        if file_name == bad.name:
+            for _ in range(3):
+                yield next(pages)
+            raise ValueError("truncated file")
+        yield from pages
+
+    monkeypatch.setattr(creator.processor, "iter_pages", failing_iter_pages)
+    result = IngestionPipeline(creator, batch_size=4).run([bad, good])
+
+    assert creator.processor.errors == [(bad.name, "truncated file")]
+    assert {metadata["source"] for metadata in creator.db.get()["metadatas"]} == {good.name}
+    assert result["chunks_added"] == creator.db.count()
+    assert {document.metadata["source"] for document in creator.lexical_index.documents} == {good.name}
+    assert result["sources"] == [good.name] and result["chunks"] == len(creator.chunks)
+
+
+def test_embedding_starts_before_parsing_finishes_and_no_page_is_kept(monkeypatch, tmp_path):
+    creator = make_creator(tmp_path)
+    upload = InMemoryUpload("large.pdf", make_pdf(60))
+    iter_pages = creator.processor.iter_pages
+    embed_documents = creator.embed_model.embed_documents
+    embedded_at = []
+
+    def slow_iter_pages(source, file_name=None):
+        for page in iter_pages(source, file_name):
+            time.sleep(0.01)
+            yield page
+
+    def timed_embed_documents(texts):
+        embedded_at.append(time.perf_counter())
+        return embed_documents(texts)
+
+    monkeypatch.setattr(creator.processor, "iter_pages", slow_iter_pages)
+    monkeypatch.setattr(creator.embed_model, "embed_documents", timed_embed_documents)
+    pipeline = IngestionPipeline(creator, batch_size=4, build_lexical_index=False)
+    result = pipeline.run([upload])
+
+    assert embedded_at[0] < pipeline.stats["parse"].finished_at
+    assert result["pages"] == 60 and result["sources"] == ["large.pdf"]
+    assert result["chunks"] == creator.db.count() == result["chunks_added"]
+    assert creator.processor.pages == [] and creator.chunks == [] and creator.lexical_index is None
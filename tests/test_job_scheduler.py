@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from JobScheduler import FairScheduler, QueueFullError
+
+
+def test_sessions_are_served_in_turn():
+    scheduler = FairScheduler(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    order = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    scheduler.submit("x", blocker)
+    started.wait(5)
+    futures = [scheduler.submit("a", order.append, f"a{i}") for i in range(3)]
+    futures.append(scheduler.submit("b", order.append, "b0"))
+    release.set()
+    for future in futures:
+        future.result(5)
+    scheduler.shutdown()
+    assert order == ["a0", "b0", "a1", "a2"]
+
+
+def test_queue_bounds_reject_submissions():
+    scheduler = FairScheduler(max_workers=1, max_queued=2, max_queued_per_session=1)
+    started, release = threading.Event(), threading.Event()
+    scheduler.submit("x", lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    scheduler.submit("a", lambda: None)
+    with pytest.raises(QueueFullError):
+        scheduler.submit("a", lambda: None)
+    scheduler.submit("b", lambda: None)
+    with pytest.raises(QueueFullError):
+        scheduler.submit("c", lambda: None)
+    assert scheduler.stats()["rejected"] == 2
+    release.set()
+    scheduler.shutdown()
+
+
+def test_cancel_session_cancels_waiting_jobs():
+    scheduler = FairScheduler(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    scheduler.submit("x", lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    futures = [scheduler.submit("a", lambda: None) for _ in range(2)]
+    assert scheduler.cancel_session("a") == 2
+    assert all(future.cancelled() for future in futures)
+    release.set()
+    scheduler.shutdown()
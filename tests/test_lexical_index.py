@@ -0,0 +1,28 @@
+from langchain_core.documents import Document
+
+from LexicalIndex import LexicalIndex
+
+
+def documents():
+    return [Document(page_content="The cell membrane controls what enters the cell.", metadata={"source": "a"}),
+            Document(page_content="Mitochondria produce the energy of the cell.", metadata={"source": "b"}),
+            Document(page_content="The French Revolution began in 1789.", metadata={"source": "c"})]
+
+
+def test_tokenize_drops_stop_words_and_single_characters():
+    assert LexicalIndex.tokenize("What is a Cell membrane?") == ["cell", "membrane"]
+
+
+def test_search_ranks_the_chunks_sharing_the_query_terms():
+    index = LexicalIndex(documents())
+    results = index.search("cell membrane", k=10)
+    assert [document.metadata["source"] for document, _ in results] == ["a", "b"]
+    assert results[0][1] > results[1][1]
+
+
+def test_documents_added_later_are_searchable():
+    index = LexicalIndex()
+    assert index.search("revolution") == []
+    index.add_documents(documents())
+    assert index.count() == 3
+    assert index.search("revolution", k=1)[0][0].metadata["source"] == "c"
@@ -0,0 +1,38 @@
+from langchain_core.outputs import Generation
+
+from LLMCache import LLMResponseCache, fresh_responses
+
+
+def make_cache(tmp_path, **options):
+    return LLMResponseCache(str(tmp_path / "responses.sqlite3"), **options)
+
+
+def test_lookup_misses_until_every_sample_is_stored(tmp_path):
+    cache = make_cache(tmp_path, samples_per_prompt=2)
+    cache.update("prompt", "llm", [Generation(text="one")])
+    assert cache.lookup("prompt", "llm") is None
+    cache.update("prompt", "llm", [Generation(text="two")])
+    assert cache.lookup("prompt", "llm")[0].text in ("one", "two")
+    assert cache.lookup("other prompt", "llm") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_responses_expire(tmp_path):
+    cache = make_cache(tmp_path, samples_per_prompt=1, ttl=-1)
+    cache.update("prompt", "llm", [Generation(text="one")])
+    assert cache.lookup("prompt", "llm") is None
+
+
+def test_uncacheable_responses_are_not_stored(tmp_path):
+    cache = make_cache(tmp_path, samples_per_prompt=1, is_cacheable=lambda text: text.startswith("{"))
+    cache.update("prompt", "llm", [Generation(text="not json")])
+    assert cache.lookup("prompt", "llm") is None
+
+
+def test_fresh_responses_skip_the_lookup_but_store(tmp_path):
+    cache = make_cache(tmp_path, samples_per_prompt=1)
+    cache.update("prompt", "llm", [Generation(text="one")])
+    with fresh_responses():
+        assert cache.lookup("prompt", "llm") is None
+        cache.update("prompt", "llm", [Generation(text="two")])
+    assert cache.lookup("prompt", "llm")[0].text == "two"
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from FakeBackends import FakeEmbeddings
+from MatrixVectorStore import MatrixVectorStore
+from NumpyVectorStore import NumpyVectorStore
+
+TEXTS = [f"chunk {i} about topic {i % 4}" for i in range(20)]
+
+
+def make_store():
+    return NumpyVectorStore.from_texts(TEXTS, FakeEmbeddings(dimensions=32), ids=[str(i) for i in range(20)],
+                                       metadatas=[{"source": f"doc{i % 2}.pdf"} for i in range(20)])
+
+
+def test_similarity_search_finds_the_query_text_first():
+    store = make_store()
+    results = store.similarity_search_with_score(TEXTS[5], k=3)
+    assert results[0][0].page_content == TEXTS[5]
+    assert abs(results[0][1] - 1.0) < 1e-5
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_batch_search_matches_single_searches():
+    store = make_store()
+    batch = store.batch_similarity_search(TEXTS[:3], k=2)
+    assert batch == [store.similarity_search(text, k=2) for text in TEXTS[:3]]
+
+
+def test_upsert_get_and_delete():
+    store = make_store()
+    store.add_texts(["replaced"], ids=["3"], metadatas=[{"source": "doc1.pdf"}])
+    assert store.count() == 20
+    assert store.get(ids=["3"])["documents"] == ["replaced"]
+    assert len(store.get(where={"source": "doc0.pdf"})["ids"]) == 10
+    store.delete(ids=["0", "1"])
+    assert store.count() == 18
+    assert store.get(ids=["0"])["ids"] == []
+    assert store.get(ids=["2"], include=["embeddings"])["embeddings"].shape == (1, 32)
+
+
+def test_empty_store_returns_no_results():
+    store = NumpyVectorStore(FakeEmbeddings(dimensions=8))
+    assert store.similarity_search("anything") == []
+    assert store.max_marginal_relevance_search("anything") == []
+
+
+def test_k_is_clamped_to_the_number_of_chunks():
+    store = make_store()
+    assert len(store.similarity_search(TEXTS[0], k=50)) == 20
+    assert store.similarity_search(TEXTS[0], k=0) == []
+    assert store.batch_similarity_search(TEXTS[:2], k=-1) == [[], []]
+    assert len(store.max_marginal_relevance_search(TEXTS[0], k=3, fetch_k=100)) == 3
+
+    scores = np.array([[0.1, 0.9, 0.5], [0.7, 0.2, 0.3]])
+    assert MatrixVectorStore._top_k(scores, 0).shape == (2, 0)
+    assert MatrixVectorStore._top_k(scores, 5).tolist() == [[1, 2, 0], [0, 2, 1]]
+
+
+def test_the_matrix_store_is_abstract():
+    with pytest.raises(TypeError):
+        MatrixVectorStore()
@@ -0,0 +1,72 @@
+import pytest
+from OutputRepair import OutputRepairError, QuestionRepairer, normalize_question
+from QuizGenerator import QuestionSchema
+
+
+def question(choices, answer):
+    return {"question": "Which one?", "choices": choices, "answer": answer, "explanation": "Because."}
+
+
+def test_answer_matching_a_choice_value_wins_over_its_first_letter():
+    normalized, _ = normalize_question(question(["A cell", "A membrane", "A protein", "A gene"], "A membrane"))
+    assert normalized["answer"] == "B"
+
+
+def test_answer_key_is_mapped_through_the_original_keys():
+    normalized, repaired = normalize_question(question({"B": "cat", "A": "dog"}, "A"))
+    assert normalized["choices"] == [{"key": "A", "value": "cat"}, {"key": "B", "value": "dog"}]
+    assert normalized["answer"] == "B"
+    assert repaired
+
+
+def test_numbered_choice_keys():
+    choices = [{"key": "1", "value": "Berlin"}, {"key": "2", "value": "Paris"}]
+    normalized, _ = normalize_question(question(choices, "2"))
+    assert normalized["answer"] == "B"
+
+
+def test_prefixed_answer_letter():
+    normalized, _ = normalize_question(question(["a) Berlin", "b) Madrid", "c) Paris"], "Option C"))
+    assert normalized["answer"] == "C"
+    assert normalized["choices"][2]["value"] == "Paris"
+
+
+def test_valid_question_is_not_repaired():
+    choices = [{"key": "A", "value": "Berlin"}, {"key": "B", "value": "Paris"}]
+    normalized, repaired = normalize_question(question(choices, "B"))
+    assert normalized["answer"] == "B"
+    assert not repaired
+
+
+def test_unknown_answer_is_rejected():
+    with pytest.raises(OutputRepairError):
+        normalize_question(question(["Berlin", "Paris"], "Rome"))
+
+
+COMPLETE = ('{"question": "Which organelle makes ATP?", "choices": [{"key": "A", "value": "Mitochondria"}, '
+            '{"key": "B", "value": "Ribosome"}], "answer": "A", "explanation": "Mitochondria produce ATP."}')
+
+
+def test_braces_before_the_json_do_not_hide_it():
+    repairer = QuestionRepairer(QuestionSchema)
+    question = repairer.parse("Here is a {great} question for {topic}:\n" + COMPLETE + "\nEnjoy!")
+    assert question["question"] == "Which organelle makes ATP?"
+    assert repairer.stats["repaired"] == 1
+
+
+def test_a_question_with_its_explanation_cut_off_is_rejected():
+    repairer = QuestionRepairer(QuestionSchema)
+    with pytest.raises(OutputRepairError):
+        repairer.parse(COMPLETE[:COMPLETE.index("produce")])
+    assert repairer.stats["unrecoverable"] == 1
+
+
+def test_a_question_cut_off_after_its_last_field_is_kept():
+    question = QuestionRepairer(QuestionSchema).parse(COMPLETE[:-1])
+    assert question["explanation"] == "Mitochondria produce ATP."
+
+
+def test_the_question_cut_off_at_the_end_of_a_batch_is_dropped():
+    output = '{"questions": [' + COMPLETE + ", " + COMPLETE.replace("ATP", "proteins") + "]}"
+    questions = QuestionRepairer(QuestionSchema).parse_batch(output[:output.rindex("produce")])
+    assert [question["question"] for question in questions] == ["Which organelle makes ATP?"]
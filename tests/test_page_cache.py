@@ -0,0 +1,55 @@
+import os
+import time
+
+from langchain_core.documents import Document
+
+from PageCache import PageCache
+
+
+def make_pages(num_pages, size=1000):
+    return [Document(page_content="x" * size, metadata={"page": i}) for i in range(num_pages)]
+
+
+def test_pages_round_trip_with_metadata(tmp_path):
+    cache = PageCache(cache_dir=str(tmp_path))
+    key = PageCache.hash_bytes(b"content")
+    cache.put(key, make_pages(3), {"file_name": "notes.pdf"})
+
+    pages = cache.get(key)
+    metadata = cache.get_metadata(key)
+
+    assert [page.metadata["page"] for page in pages] == [0, 1, 2]
+    assert metadata["file_name"] == "notes.pdf"
+    assert metadata["num_pages"] == 3
+    assert cache.get(PageCache.hash_bytes(b"other")) is None
+
+
+def test_the_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PageCache(cache_dir=str(tmp_path), max_bytes=10 ** 9)
+    for key in ("a", "b", "c"):
+        cache.put(key, make_pages(1, size=4000))
+    entry_size = os.path.getsize(cache._entry_path("a"))
+
+    # Making the ages explicit, then reading "a" so that "b" becomes the least recently used entry
+    now = time.time()
+    for age, key in enumerate(("c", "b", "a")):
+        os.utime(cache._entry_path(key), (now - 100 * (age + 1), now - 100 * (age + 1)))
+    assert cache.get("a") is not None
+
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_a_corrupt_entry_is_a_miss_and_is_removed(tmp_path):
+    cache = PageCache(cache_dir=str(tmp_path))
+    cache.put("key", make_pages(2))
+    with open(cache._entry_path("key"), 'wb') as f:
+        f.write(b"not a pickle")
+
+    assert cache.get("key") is None
+    assert not os.path.exists(cache._entry_path("key"))
+    assert cache.get_metadata("key") is None
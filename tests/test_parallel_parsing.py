@@ -0,0 +1,28 @@
+from SampleDocuments import InMemoryUpload, make_pdf
+from DocumentProcessor import DocumentProcessor
+
+
+def test_parallel_parsing_keeps_the_order_of_files_and_pages():
+    uploads = [InMemoryUpload(f"doc_{i}.pdf", make_pdf(5, seed=i)) for i in range(3)]
+    sequential = DocumentProcessor(use_page_cache=False)
+    sequential.process_files(uploads)
+
+    parallel = DocumentProcessor(use_page_cache=False, num_workers=2, pages_per_task=2)
+    parallel.process_files(uploads)
+
+    assert [(page.metadata["source"], page.metadata["page"], page.page_content) for page in parallel.pages] == \
+           [(page.metadata["source"], page.metadata["page"], page.page_content) for page in sequential.pages]
+    assert parallel.file_hashes == sequential.file_hashes
+
+
+def test_a_broken_file_does_not_stop_the_parallel_batch():
+    good = InMemoryUpload("good.pdf", make_pdf(3))
+    broken = InMemoryUpload("broken.pdf", b"%PDF-1.4 not really a pdf")
+    processor = DocumentProcessor(use_page_cache=False, num_workers=2, pages_per_task=1)
+
+    processor.process_files([broken, good])
+
+    assert {page.metadata["source"] for page in processor.pages} == {"good.pdf"}
+    assert [page.metadata["page"] for page in processor.pages] == [0, 1, 2]
+    assert [file_name for file_name, _ in processor.errors] == ["broken.pdf"]
+    assert len(processor.file_hashes) == 1
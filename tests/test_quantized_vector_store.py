@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from FakeBackends import FakeEmbeddings
+from NumpyVectorStore import NumpyVectorStore
+from QuantizedVectorStore import QuantizedVectorStore
+
+
+def make_vectors(num_rows=2000, dimensions=64, seed=0):
+    # Clustered vectors, so that many neighbours have close scores, as the chunks of the same document do
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dimensions))
+    vectors = centers[rng.integers(0, len(centers), num_rows)] + 0.3 * rng.normal(size=(num_rows, dimensions))
+    queries = centers[rng.integers(0, len(centers), 50)] + 0.3 * rng.normal(size=(50, dimensions))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def write_store(path, vectors, quantization, **kwargs):
+    ids = [str(i) for i in range(len(vectors))]
+    QuantizedVectorStore.write(str(path), ids, ids, [{} for _ in ids], vectors, quantization=quantization)
+    return QuantizedVectorStore(str(path), **kwargs)
+
+
+def recall(store, exact, queries, k):
+    found = store.batch_similarity_search_by_vector(queries, k=k)
+    return np.mean([len({document.page_content for document, _ in results} & expected) / k
+                    for results, expected in zip(found, exact)])
+
+
+@pytest.mark.parametrize("quantization, rerank, min_recall", [
+    ("float16", False, 0.98),
+    ("int8", False, 0.9),
+    ("int8", True, 0.99),
+])
+def test_the_quantized_search_recalls_the_exact_top_k(tmp_path, quantization, rerank, min_recall):
+    vectors, queries = make_vectors()
+    exact_store = NumpyVectorStore(FakeEmbeddings(dimensions=64))
+    ids = [str(i) for i in range(len(vectors))]
+    exact_store.add_embeddings(ids, vectors, ids=ids)
+    exact = [{document.page_content for document, _ in results}
+             for results in exact_store.batch_similarity_search_by_vector(queries, k=10)]
+
+    store = write_store(tmp_path, vectors, quantization, rerank=rerank, block_rows=300)
+
+    assert recall(store, exact, queries, k=10) >= min_recall
+
+
+def test_the_scores_do_not_depend_on_the_block_size(tmp_path):
+    vectors, queries = make_vectors(num_rows=500)
+    whole = write_store(tmp_path, vectors, "int8", block_rows=10_000)
+    blocks = QuantizedVectorStore(str(tmp_path), block_rows=64)
+
+    assert np.allclose(whole._scores(queries), blocks._scores(queries), atol=1e-5)
+    assert whole.nbytes()["searched"] * 3 < whole.nbytes()["full_precision"]
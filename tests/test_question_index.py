@@ -0,0 +1,21 @@
+import json
+
+from QuestionIndex import QuestionIndex
+
+
+def test_exact_duplicate_after_normalization():
+    index = QuestionIndex()
+    index.add("What is the role of the cell membrane?")
+    assert index.find_duplicate("what is the ROLE of the cell membrane") == "What is the role of the cell membrane?"
+
+
+def test_reworded_duplicate_is_found():
+    index = QuestionIndex()
+    index.add("Which organelle produces energy in the cell?")
+    assert index.find_duplicate("In the cell, which organelle produces the energy?") is not None
+
+
+def test_different_question_is_new():
+    index = QuestionIndex()
+    index.add("Which organelle produces energy in the cell?")
+    assert index.find_duplicate("What year did the French Revolution begin?") is None
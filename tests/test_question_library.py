@@ -0,0 +1,38 @@
+from FakeBackends import FakeEmbeddings
+from QuestionLibrary import QuestionLibrary
+
+
+def make_questions(prefix, count):
+    return [{"question": f"{prefix} question {i}?", "choices": [], "answer": "A", "explanation": ""} for i in range(count)]
+
+
+def test_the_least_served_questions_are_drawn_first(tmp_path):
+    library = QuestionLibrary(library_path=str(tmp_path / "library.sqlite3"))
+    library.add("corpus", "Cell Membrane", make_questions("old", 2))
+    library.draw("corpus", "cell membrane", 2)
+    library.add("corpus", "cell  membrane", make_questions("new", 2))
+
+    drawn = library.draw("corpus", "CELL MEMBRANE", 3)
+
+    assert {question["question"] for question in drawn[:2]} == {"new question 0?", "new question 1?"}
+    assert drawn[2]["question"].startswith("old")
+
+
+def test_questions_are_kept_per_corpus_and_filtered_by_accept(tmp_path):
+    library = QuestionLibrary(library_path=str(tmp_path / "library.sqlite3"))
+    library.add("first", "mitosis", make_questions("first", 3))
+    library.add("second", "mitosis", make_questions("second", 1))
+
+    drawn = library.draw("first", "mitosis", 5, accept=lambda question: question["question"] != "first question 1?")
+
+    assert sorted(question["question"] for question in drawn) == ["first question 0?", "first question 2?"]
+    assert library.count("first") == 3 and library.count() == 4
+    assert library.draw("third", "mitosis", 5) == []
+
+
+def test_topics_are_matched_by_embedding(tmp_path):
+    library = QuestionLibrary(FakeEmbeddings(dimensions=64), library_path=str(tmp_path / "library.sqlite3"))
+    library.add("corpus", "transport across the cell membrane", make_questions("membrane", 2))
+
+    assert len(library.draw("corpus", "the cell membrane transport across", 5)) == 2
+    assert library.draw("corpus", "photosynthesis in chloroplasts", 5) == []
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from ChromaCollectionCreator import ChromaCollectionCreator
+from DocumentProcessor import DocumentProcessor
+from FakeBackends import FakeEmbeddings, FakeLLM
+from JobScheduler import FairScheduler
+from QuestionProducer import QuestionProducer
+from QuizGenerator import QuizGenerator
+from SampleDocuments import make_uploads
+
+
+def make_creator(tmp_path, num_files=1):
+    processor = DocumentProcessor(use_page_cache=False)
+    processor.defer_files(make_uploads(num_files, 5))
+    return ChromaCollectionCreator(processor, FakeEmbeddings(dimensions=64), persist_directory=str(tmp_path),
+                                   backend="numpy")
+
+
+def make_generator(creator, num_questions, **llm_options):
+    generator = QuizGenerator("cell membrane", num_questions, creator, max_retries=10)
+    generator.llm = FakeLLM(**llm_options)
+    return generator
+
+
+def drain(producer):
+    questions = []
+    while (question := producer.wait_for_question()) is not None:
+        questions.append(question)
+    return questions
+
+
+def test_the_documents_are_indexed_then_every_question_is_queued(tmp_path):
+    creator = make_creator(tmp_path)
+    producer = QuestionProducer(creator)
+    producer.start_indexing()
+    producer.start_generator(make_generator(creator, 4))
+
+    questions = drain(producer)
+
+    assert len(questions) == 4
+    assert producer.error is None and producer.done
+    assert producer.index_status.startswith("Successfully")
+    assert producer.expected_total == 4
+
+
+def test_a_full_queue_holds_the_generation_until_cancelled(tmp_path):
+    creator = make_creator(tmp_path)
+    producer = QuestionProducer(creator, max_queued=1)
+    producer.start_generator(make_generator(creator, 6))
+
+    assert producer.wait_for_question() is not None
+    time.sleep(0.5)
+    assert producer.produced <= 3
+    producer.cancel()
+
+    assert producer.finished.wait(5)
+    assert producer.get() is None
+
+
+def test_an_indexing_error_ends_the_generation(tmp_path):
+    creator = ChromaCollectionCreator(DocumentProcessor(use_page_cache=False), FakeEmbeddings(dimensions=64),
+                                      persist_directory=str(tmp_path), backend="numpy")
+    producer = QuestionProducer(creator)
+    producer.start_generator(make_generator(creator, 2))
+
+    assert producer.wait_for_question() is None
+    assert isinstance(producer.error, ValueError)
+
+
+def test_a_scheduled_generation_is_only_submitted_once_indexed(tmp_path):
+    creator = make_creator(tmp_path)
+    indexing, release = threading.Event(), threading.Event()
+    create_chroma_collection = creator.create_chroma_collection
+
+    def slow_indexing():
+        indexing.set()
+        release.wait(5)
+        return create_chroma_collection()
+
+    creator.create_chroma_collection = slow_indexing
+    scheduler = FairScheduler(max_workers=1)
+    producer = QuestionProducer(creator, scheduler=scheduler, session_id="session")
+    producer.start_generator(make_generator(creator, 3))
+
+    assert indexing.wait(5)
+    assert producer.generation_job is None and producer.generation_pending
+    release.set()
+
+    assert len(drain(producer)) == 3
+    assert producer.generation_job.done()
+    scheduler.shutdown()
@@ -0,0 +1,93 @@
+import time
+
+from ChromaCollectionCreator import ChromaCollectionCreator
+from DocumentProcessor import DocumentProcessor
+from FakeBackends import FakeEmbeddings, FakeLLM
+from QuizGenerator import QuizGenerator
+from SampleDocuments import make_uploads
+
+
+def make_collection(tmp_path, num_pages=10):
+    processor = DocumentProcessor(use_page_cache=False)
+    processor.process_files(make_uploads(1, num_pages))
+    creator = ChromaCollectionCreator(processor, FakeEmbeddings(dimensions=64), persist_directory=str(tmp_path),
+                                      backend="numpy")
+    creator.create_chroma_collection()
+    return creator
+
+
+def make_generator(creator, num_questions, llm, **options):
+    generator = QuizGenerator("cell membrane", num_questions, creator, **options)
+    generator.llm = llm
+    return generator
+
+
+def test_concurrent_questions_take_about_as_long_as_one(tmp_path):
+    creator = make_collection(tmp_path)
+    generator = make_generator(creator, 6, FakeLLM(latency=0.3), max_concurrency=6)
+
+    start = time.perf_counter()
+    questions = generator.generate_quiz()
+    elapsed = time.perf_counter() - start
+
+    assert len(questions) == 6
+    assert len({question["question"] for question in questions}) == 6
+    # Six questions in a row would take at least 1.8 s
+    assert elapsed < 0.75 * 6 * 0.3
+
+
+def test_concurrent_questions_are_stored_in_the_order_of_their_slots(tmp_path):
+    creator = make_collection(tmp_path)
+    generator = make_generator(creator, 6, FakeLLM(), max_concurrency=6)
+    generate_unique_question = generator.generate_unique_question
+
+    def slow_first_slots(slot=0):
+        # The first slots complete last
+        time.sleep(0.05 * (6 - slot))
+        question = generate_unique_question(slot)
+        question["slot"] = slot
+        return question
+
+    generator.generate_unique_question = slow_first_slots
+    streamed = list(generator.iter_quiz())
+
+    assert [question["slot"] for question in streamed] != list(range(6))
+    assert [question["slot"] for question in generator.question_bank] == list(range(6))
+
+
+def test_each_concurrent_question_keeps_its_retry_budget(tmp_path):
+    creator = make_collection(tmp_path)
+    generator = make_generator(creator, 8, FakeLLM(error_rate=0.3, seed=3), max_concurrency=4, max_retries=5)
+
+    questions = generator.generate_quiz()
+    metrics = generator.quiz_metrics()
+
+    assert len(questions) == 8
+    assert metrics["failures"] > 0
+    assert metrics["llm_calls"] == metrics["accepted"] + metrics["failures"] + metrics["duplicates"] + metrics["regenerated"]
+
+
+def test_a_batched_quiz_needs_fewer_llm_calls(tmp_path):
+    creator = make_collection(tmp_path)
+    per_question = make_generator(creator, 8, FakeLLM(), max_retries=10)
+    batched = make_generator(creator, 8, FakeLLM(), batch_mode=True, max_retries=10)
+
+    assert len(per_question.generate_quiz()) == 8
+    assert len(batched.generate_quiz()) == 8
+    assert batched.llm.stats["calls"] < per_question.llm.stats["calls"]
+    assert batched.llm.stats["prompt_tokens"] < per_question.llm.stats["prompt_tokens"]
+
+
+def test_a_batch_asks_again_for_the_duplicates_within_the_retry_budget(tmp_path):
+    creator = make_collection(tmp_path)
+    generator = make_generator(creator, 6, FakeLLM(duplicate_rate=0.5, seed=1), batch_mode=True,
+                               max_output_tokens=1000, max_retries=10)
+
+    questions = generator.generate_quiz()
+    metrics = generator.quiz_metrics()
+
+    assert len(questions) == 6
+    assert len({question["question"] for question in questions}) == 6
+    assert metrics["duplicates"] > 0
+    # Four questions per call: two calls without duplicates, and at most max_retries more
+    assert metrics["llm_calls"] <= 2 + 10
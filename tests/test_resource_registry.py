@@ -0,0 +1,46 @@
+import gc
+import weakref
+
+from langchain_core.outputs import Generation
+
+from ResourceRegistry import ResourceRegistry
+
+
+def test_get_or_create_builds_once_per_configuration():
+    resources = ResourceRegistry()
+    first = resources.get_or_create("thing", {"size": 1}, object)
+    assert resources.get_or_create("thing", {"size": 1}, object) is first
+    assert resources.get_or_create("thing", {"size": 2}, object) is not first
+    assert resources.stats()["hits"] == 1
+
+
+def test_invalidated_cache_stays_usable_by_its_holders(tmp_path):
+    resources = ResourceRegistry()
+    config = {"cache_path": str(tmp_path / "responses.sqlite3"), "samples_per_prompt": 1}
+    cache = resources.llm_cache(**config)
+    assert resources.invalidate("llm_cache") == 1
+
+    cache.update("prompt", "llm", [Generation(text="one")])
+    assert cache.lookup("prompt", "llm")[0].text == "one"
+    assert resources.llm_cache(**config) is not cache
+
+
+def test_objects_of_the_configuration_are_kept_with_their_resource():
+    class Model:
+        pass
+
+    resources = ResourceRegistry()
+    model = Model()
+    model_ref = weakref.ref(model)
+    first = resources.get_or_create("index", {"embed_model": model}, object)
+    assert resources.get_or_create("index", {"embed_model": Model()}, object) is not first
+
+    # The identity of the model cannot be reused by another object while the resource is held
+    del model
+    gc.collect()
+    assert model_ref() is not None
+    assert resources.get_or_create("index", {"embed_model": model_ref()}, object) is first
+
+    resources.invalidate("index")
+    gc.collect()
+    assert model_ref() is None
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from Tracing import NOOP_SPAN, Tracer
+
+
+def test_nested_spans_share_the_trace_of_their_parent():
+    tracer = Tracer(enabled=True)
+    with tracer.span("quiz") as quiz:
+        with tracer.span("question", slot=0):
+            pass
+    question, parent = tracer.records()
+
+    assert question["name"] == "question" and parent["name"] == "quiz"
+    assert question["parent_id"] == quiz.span_id
+    assert question["trace_id"] == parent["trace_id"]
+    assert question["attributes"] == {"slot": 0}
+
+
+def test_spans_of_other_threads_get_their_parent_explicitly():
+    tracer = Tracer(enabled=True)
+    with tracer.span("quiz") as quiz:
+        thread = threading.Thread(target=lambda: tracer.start_span("question", parent=quiz).end())
+        thread.start()
+        thread.join()
+    question = tracer.records()[0]
+
+    assert question["parent_id"] == quiz.span_id
+
+
+def test_errors_are_recorded_and_summarized():
+    tracer = Tracer(enabled=True)
+    with pytest.raises(ValueError):
+        with tracer.span("pdf.parse"):
+            raise ValueError("truncated file")
+    tracer.start_span("pdf.parse").end()
+    tracer.count("page_cache.hits", 2)
+
+    summary = tracer.summary()["pdf.parse"]
+    assert summary["count"] == 2 and summary["errors"] == 1
+    assert tracer.records()[0]["attributes"]["error"] == "ValueError: truncated file"
+
+    otel = tracer.to_otel()["resourceSpans"][0]
+    assert [span["status"]["code"] for span in otel["scopeSpans"][0]["spans"]] == [2, 1]
+    assert {"key": "counter.page_cache.hits", "value": {"intValue": "2"}} in otel["resource"]["attributes"]
+
+
+def test_only_the_latest_spans_are_kept():
+    tracer = Tracer(enabled=True, max_spans=3)
+    for i in range(5):
+        tracer.start_span(f"span{i}").end()
+    assert [record["name"] for record in tracer.records()] == ["span2", "span3", "span4"]
+
+
+def test_a_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    assert tracer.span("quiz") is NOOP_SPAN
+    tracer.count("llm.calls")
+    assert tracer.records() == [] and tracer.counters == {} and tracer.callbacks() == []